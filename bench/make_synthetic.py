@@ -0,0 +1,210 @@
+# bench/make_synthetic.py
+"""
+Synthetic Pitchfork + Spotify inputs for the benchmarks.
+
+Scale 1 matches the real interim data (~18k reviews, ~20k tracks); 10 and 100
+multiply row counts and the artist vocabulary together. Names carry the noise
+the matchers deal with: "feat." credits, `&` / `,` / `/` / "and" credits,
+"The " prefixes dropped on one side, accents stripped on one side, `;`-joined
+Spotify artists and "various artists" compilations.
+
+Writes, under <out>/data:
+  interim/pitchfork_reviews.*        raw review rows (stage_reviews.py input)
+  interim/pitchfork_artists.*        reviewid -> artist (match_artists.py input)
+  interim/spotify_youtube_clean.*    cleaned tracks (warehouse + match_artists.py)
+  raw/spotify_youtube/Spotify_Youtube.csv   raw tracks (match_artists_offline.py)
+
+Usage:
+  python bench/make_synthetic.py --scale 10 --out bench/work/x10
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+import interim_io  # noqa: E402
+
+BASE_REVIEWS = 18_400
+BASE_TRACKS = 20_700
+BASE_PF_ARTISTS = 8_800
+BASE_SP_ARTISTS = 2_100
+SP_FROM_PF = 0.25              # share of Spotify artists that are also reviewed
+
+P_THE = 0.12                   # base names with a "The " prefix
+P_THE_DROPPED = 0.4            # ...that Spotify lists without it
+P_ACCENT = 0.05                # names with an accented letter
+P_ACCENT_STRIPPED = 0.5        # ...that the other side spells without it
+P_MULTI = 0.06                 # reviews credited to two artists
+P_VARIOUS = 0.037              # "various artists" compilations
+P_FEAT = 0.08                  # Spotify rows with a featured artist
+P_SEMI = 0.02                  # Spotify rows with ';'-joined artists
+
+CREDIT_SEPS = [" & ", ", ", " / ", " and ", " feat. ", " + "]
+ACCENTS = {"e": "é", "o": "ö", "a": "á", "n": "ñ", "u": "ü", "i": "í"}
+SYLLABLES = ["ka", "lo", "mi", "ra", "ven", "dor", "sha", "tel", "bri", "nox", "ule", "zen",
+             "mar", "quo", "fi", "gan", "sil", "tor", "vey", "pla", "dun", "ech", "rho", "yas"]
+
+
+def vocabulary(rng: np.random.Generator, n: int) -> np.ndarray:
+    """n distinct made-up words of 2-3 syllables."""
+    words: set[str] = set()
+    while len(words) < n:
+        k = rng.integers(2, 4, size=n)
+        for i in range(n):
+            words.add("".join(rng.choice(SYLLABLES, size=k[i])))
+    return np.array(sorted(words)[:n])
+
+
+def artist_names(rng: np.random.Generator, n: int) -> list[str]:
+    """n distinct lower-case artist names of 1-3 words, some with "the " or accents."""
+    vocab = vocabulary(rng, max(200, int(n ** 0.5 * 6)))
+    names: dict[str, None] = {}
+    while len(names) < n:
+        m = n - len(names)
+        n_words = rng.choice([1, 2, 3], size=m, p=[0.45, 0.4, 0.15])
+        the = rng.random(m) < P_THE
+        accent = rng.random(m) < P_ACCENT
+        for i in range(m):
+            name = " ".join(rng.choice(vocab, size=n_words[i]))
+            if accent[i]:
+                for plain, acc in ACCENTS.items():
+                    if plain in name:
+                        name = name.replace(plain, acc, 1)
+                        break
+            names["the " + name if the[i] else name] = None
+    return list(names)
+
+
+def strip_accents(name: str) -> str:
+    for plain, acc in ACCENTS.items():
+        name = name.replace(acc, plain)
+    return name
+
+
+def spotify_spelling(name: str, rng: np.random.Generator) -> str:
+    """How Spotify lists a Pitchfork artist: title case, sometimes without "The "/accents."""
+    if name.startswith("the ") and rng.random() < P_THE_DROPPED:
+        name = name[4:]
+    if rng.random() < P_ACCENT_STRIPPED:
+        name = strip_accents(name)
+    return name.title()
+
+
+def reviews(rng: np.random.Generator, n: int, artists: list[str]) -> pd.DataFrame:
+    # Review counts per artist are skewed: a few artists get many reviews
+    weights = rng.lognormal(0.0, 0.9, size=len(artists))
+    weights /= weights.sum()
+    first = rng.choice(len(artists), size=n, p=weights)
+    second = rng.choice(len(artists), size=n, p=weights)
+    multi = rng.random(n) < P_MULTI
+    various = rng.random(n) < P_VARIOUS
+    seps = rng.choice(CREDIT_SEPS, size=n)
+
+    credit = [
+        "various artists" if various[i]
+        else f"{artists[first[i]]}{seps[i]}{artists[second[i]]}" if multi[i]
+        else artists[first[i]]
+        for i in range(n)
+    ]
+    dates = pd.Timestamp("1999-01-01") + pd.to_timedelta(rng.integers(0, 18 * 365, size=n), unit="D")
+    reviewid = np.arange(1, n + 1)
+    titles = [f"record {i}" for i in reviewid]
+    return pd.DataFrame({
+        "reviewid": reviewid,
+        "title": titles,
+        "artist": credit,
+        "url": [f"http://pitchfork.com/reviews/albums/{i}-{t.replace(' ', '-')}/" for i, t in zip(reviewid, titles)],
+        "score": np.round(np.clip(rng.normal(7.0, 1.3, size=n), 0, 10), 1),
+        "best_new_music": (rng.random(n) < 0.05).astype(int),
+        "author": rng.choice(["nate patrin", "zoe camp", "ian cohen", "jayson greene"], size=n),
+        "author_type": "contributor",
+        "pub_date": dates.strftime("%Y-%m-%d"),
+        "pub_weekday": dates.weekday,
+        "pub_day": dates.day,
+        "pub_month": dates.month,
+        "pub_year": dates.year,
+    })
+
+
+def tracks(rng: np.random.Generator, n: int, pf_artists: list[str], n_artists: int) -> pd.DataFrame:
+    n_shared = min(int(n_artists * SP_FROM_PF), len(pf_artists))
+    shared = [spotify_spelling(a, rng) for a in rng.choice(pf_artists, size=n_shared, replace=False)]
+    own = [a.title() for a in artist_names(np.random.default_rng(rng.integers(1 << 32)), n_artists - n_shared)]
+    pool = shared + own
+
+    artist_idx = rng.integers(0, len(pool), size=n)
+    feat = rng.random(n) < P_FEAT
+    semi = rng.random(n) < P_SEMI
+    other = rng.integers(0, len(pool), size=n)
+    artist = [
+        f"{pool[a]};{pool[o]}" if s else f"{pool[a]} feat. {pool[o]}" if f else pool[a]
+        for a, o, f, s in zip(artist_idx, other, feat, semi)
+    ]
+    return pd.DataFrame({
+        "Artist": artist,
+        "Track": [f"song {i}" for i in range(n)],
+        "Album": "x",
+        "Url_spotify": "u",
+        "Danceability": rng.random(n).round(3),
+        "Energy": rng.random(n).round(3),
+        "Loudness": rng.normal(-7, 3, size=n).round(3),
+        "Valence": rng.random(n).round(3),
+        "Views": rng.lognormal(16, 2, size=n).round(),
+        "Likes": rng.lognormal(11, 2, size=n).round(),
+        "Comments": rng.lognormal(8, 2, size=n).round(),
+        "Stream": rng.lognormal(18, 1.5, size=n).round(),
+    })
+
+
+def generate(out: Path, scale: float, seed: int = 0) -> dict[str, int]:
+    """Write a synthetic data/ tree under `out`; returns the generated row counts."""
+    rng = np.random.default_rng(seed)
+    n_reviews = max(100, int(BASE_REVIEWS * scale))
+    n_tracks = max(100, int(BASE_TRACKS * scale))
+    pf_artists = artist_names(rng, max(50, int(BASE_PF_ARTISTS * scale)))
+
+    rev = reviews(rng, n_reviews, pf_artists)
+    raw = tracks(rng, n_tracks, pf_artists, max(20, int(BASE_SP_ARTISTS * scale)))
+
+    interim = out / "data" / "interim"
+    raw_dir = out / "data" / "raw" / "spotify_youtube"
+    raw_dir.mkdir(parents=True, exist_ok=True)
+    (out / "data" / "processed").mkdir(parents=True, exist_ok=True)
+
+    interim_io.write_table(rev, interim / "pitchfork_reviews.csv")
+    interim_io.write_table(rev[["reviewid", "artist"]], interim / "pitchfork_artists.csv")
+    raw.to_csv(raw_dir / "Spotify_Youtube.csv")
+
+    clean = raw.rename(columns={
+        "Artist": "artist", "Track": "song", "Danceability": "danceability", "Energy": "energy",
+        "Loudness": "loudness", "Valence": "valence", "Views": "yt_views", "Likes": "yt_likes",
+        "Comments": "yt_comments", "Stream": "streams",
+    }).drop(columns=["Album", "Url_spotify"])
+    interim_io.write_table(clean, interim / "spotify_youtube_clean.csv")
+
+    return {
+        "reviews": n_reviews,
+        "tracks": n_tracks,
+        "pitchfork_artists": len(pf_artists),
+        "spotify_artists": int(raw["Artist"].nunique()),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Generate synthetic benchmark inputs.")
+    ap.add_argument("--scale", type=float, default=1.0, help="1 = real data size; 10, 100 = multiples")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", type=Path, required=True, help="workspace root; data/ is created inside")
+    args = ap.parse_args()
+
+    counts = generate(args.out, args.scale, args.seed)
+    print(f"[ok] synthetic x{args.scale:g} -> {args.out}: " + ", ".join(f"{k}={v:,}" for k, v in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# bench/run_bench.py
+"""
+Time every pipeline stage on synthetic data at several scales.
+
+For each scale a throwaway workspace is generated (make_synthetic.py), the
+repo's scripts/ and sql/ are copied in, and the stages run in order as
+subprocesses from the workspace root, exactly as they run on real data.
+View queries are timed in-process against the resulting warehouse.
+
+Results go to a JSON file (one record per scale, one entry per stage) so runs
+can be diffed or plotted as scaling curves.
+
+Usage:
+  python bench/run_bench.py                          # scales 1, 10, 100
+  python bench/run_bench.py --scales 0.1 1 --skip match_rapidfuzz
+"""
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+import make_synthetic
+import clean_spotify_youtube  # scripts/ is put on sys.path by make_synthetic
+import interim_io
+
+ROOT = Path(__file__).resolve().parents[1]
+RESULTS_DIR = ROOT / "bench" / "results"
+DB = Path("data/processed/vinyl_dw.sqlite")
+VIEWS_SQL = Path("sql/dw/create_views.sql")
+
+# (stage, argv) in pipeline order; "@..." entries run in-process
+STAGES = [
+    ("stage_reviews", ["scripts/stage_reviews.py"]),
+    ("make_review_artists_bridge", ["scripts/make_review_artists_bridge.py"]),
+    ("load_reviews_and_bridge", ["scripts/load_reviews_and_bridge.py"]),
+    ("load_spotify", ["@load_spotify"]),
+    ("build_artist_universe", ["scripts/build_artist_universe.py"]),
+    ("match_offline", ["scripts/match_artists_offline.py", "--no-cache"]),
+    ("match_rapidfuzz", ["scripts/match_artists.py", "--no-cache"]),
+    ("load_dim_artist", ["scripts/load_dim_artist.py"]),
+    ("create_views", ["@create_views"]),
+    ("view_queries", ["@view_queries"]),
+]
+
+
+def load_spotify(ws: Path) -> None:
+    """
+    Stand-in for stage_to_sqlite.py, which reads from fixed absolute paths. The
+    per-artist rollup is built as clean_spotify_youtube.py builds it.
+    """
+    df = interim_io.read_table(ws / "data/interim/spotify_youtube_clean.csv")
+    rollup = clean_spotify_youtube.ArtistRollup(list(df.columns))
+    rollup.add(df)
+    with sqlite3.connect(ws / DB) as con:
+        df.to_sql("spotify_youtube_clean", con, if_exists="replace", index=False)
+        con.execute("CREATE INDEX IF NOT EXISTS ix_spotify_youtube_clean_artist ON spotify_youtube_clean(artist)")
+        rollup.result().to_sql("spotify_artist_rollup", con, if_exists="replace", index=False)
+        con.execute("CREATE INDEX IF NOT EXISTS ix_spotify_artist_rollup_artist ON spotify_artist_rollup(artist)")
+
+
+def create_views(ws: Path) -> None:
+    with sqlite3.connect(ws / DB) as con:
+        con.executescript((ws / VIEWS_SQL).read_text(encoding="utf-8"))
+
+
+def view_queries(ws: Path) -> dict[str, float]:
+    """Seconds to fully fetch each view defined in create_views.sql."""
+    views = re.findall(r"CREATE VIEW\s+(?:IF NOT EXISTS\s+)?(\w+)", (ws / VIEWS_SQL).read_text(encoding="utf-8"), re.I)
+    timings = {}
+    with sqlite3.connect(ws / DB) as con:
+        for v in views:
+            t0 = time.perf_counter()
+            con.execute(f"SELECT * FROM {v}").fetchall()
+            timings[v] = round(time.perf_counter() - t0, 4)
+    return timings
+
+
+IN_PROCESS = {"@load_spotify": load_spotify, "@create_views": create_views, "@view_queries": view_queries}
+
+
+def run_stage(ws: Path, name: str, argv: list[str], timeout: float) -> dict:
+    t0 = time.perf_counter()
+    rec: dict = {"stage": name}
+    try:
+        if argv[0] in IN_PROCESS:
+            detail = IN_PROCESS[argv[0]](ws)
+            if detail:
+                rec["detail"] = detail
+        else:
+            with (ws / "logs" / f"{name}.log").open("w", encoding="utf-8") as log:
+                subprocess.run([sys.executable, *argv], cwd=ws, stdout=log, stderr=subprocess.STDOUT,
+                               timeout=timeout, check=True, env={**os.environ, "PYTHONHASHSEED": "0"})
+        rec["status"] = "ok"
+    except subprocess.TimeoutExpired:
+        rec["status"] = "timeout"
+    except (subprocess.CalledProcessError, sqlite3.Error, OSError) as e:
+        rec["status"] = "failed"
+        rec["error"] = str(e)
+    rec["seconds"] = round(time.perf_counter() - t0, 4)
+    return rec
+
+
+def bench_scale(scale: float, seed: int, skip: set[str], timeout: float, keep: Path | None) -> dict:
+    ws = (keep / f"x{scale:g}") if keep else Path(tempfile.mkdtemp(prefix=f"vinyl_bench_x{scale:g}_"))
+    if ws.exists():
+        shutil.rmtree(ws)
+    try:
+        t0 = time.perf_counter()
+        rows = make_synthetic.generate(ws, scale, seed)
+        gen_s = time.perf_counter() - t0
+        shutil.copytree(ROOT / "scripts", ws / "scripts", ignore=shutil.ignore_patterns("__pycache__"))
+        shutil.copytree(ROOT / "sql", ws / "sql")
+        (ws / "logs").mkdir()
+
+        print(f"[info] x{scale:g}: " + ", ".join(f"{k}={v:,}" for k, v in rows.items()))
+        stages = []
+        failed = False
+        for name, argv in STAGES:
+            if name in skip:
+                stages.append({"stage": name, "status": "skipped", "seconds": None})
+                continue
+            if failed:
+                stages.append({"stage": name, "status": "not_run", "seconds": None})
+                continue
+            rec = run_stage(ws, name, argv, timeout)
+            stages.append(rec)
+            print(f"  {name:<28} {rec['status']:<8} {rec['seconds']:>9.2f}s")
+            # Later stages read this one's outputs; a matcher failure only blocks dim_artist onward
+            failed = rec["status"] != "ok" and name != "match_rapidfuzz"
+
+        return {"scale": scale, "seed": seed, "rows": rows, "generate_seconds": round(gen_s, 4), "stages": stages}
+    finally:
+        if keep is None:
+            shutil.rmtree(ws, ignore_errors=True)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic data.")
+    ap.add_argument("--scales", type=float, nargs="+", default=[1, 10, 100])
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--skip", nargs="*", default=[], choices=[s for s, _ in STAGES], metavar="STAGE",
+                    help="stages to leave out (e.g. match_rapidfuzz at 100x)")
+    ap.add_argument("--timeout", type=float, default=3600, help="seconds per subprocess stage")
+    ap.add_argument("--keep", type=Path, help="keep workspaces under this directory instead of a temp dir")
+    ap.add_argument("--out", type=Path, help="results JSON (default: bench/results/bench_<utc>.json)")
+    args = ap.parse_args()
+
+    started = datetime.now(tz=timezone.utc)
+    results = {
+        "started_at": started.isoformat(),
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "cpu_count": os.cpu_count(),
+            "sqlite": sqlite3.sqlite_version,
+        },
+        "interim_format": os.environ.get("VINYL_INTERIM_FORMAT", "parquet"),
+        "runs": [bench_scale(s, args.seed, set(args.skip), args.timeout, args.keep) for s in args.scales],
+    }
+
+    out = args.out or RESULTS_DIR / f"bench_{started:%Y%m%dT%H%M%SZ}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with out.open("w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"[ok] results -> {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+# scripts/artist_search.py
+"""
+Fuzzy artist lookup over an FTS5 trigram index inside the warehouse.
+
+`artist_search` is an FTS5 table (trigram tokenizer, case-insensitive) holding
+every distinct artist name together with where it came from:
+
+  pitchfork        pitchfork_review_artists.artist
+  artist_spotify   dim_artist.artist_spotify
+  spotify          spotify_youtube_clean.artist
+
+The loaders call `refresh()` for the sources they just wrote; only names that
+appeared or disappeared are inserted into / deleted from the index. Incremental
+loads that know which names they touched call `refresh_names()` instead, which
+looks up just those names.
+
+`lookup()` turns the query into its trigrams, lets FTS5 rank the names sharing
+the most of them (bm25), and re-scores that short list with rapidfuzz WRatio.
+Substring searches (`LIKE '%...%'`, 3+ characters) on `artist_search.name`
+are served by the same index. It doubles as a candidate generator: pass
+sources=["spotify"] to get Spotify names close to a Pitchfork artist.
+
+Usage:
+  python scripts/artist_search.py "radiohed"
+  python scripts/artist_search.py "bon iver" --source spotify --limit 5
+  python scripts/artist_search.py --rebuild
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import sqlite3
+import time
+
+import warehouse
+
+DB = warehouse.db_path(Path("data/processed/vinyl_dw.sqlite"))
+TABLE = "artist_search"
+
+# source -> (table, column)
+SOURCES = {
+    "pitchfork": ("pitchfork_review_artists", "artist"),
+    "artist_spotify": ("dim_artist", "artist_spotify"),
+    "spotify": ("spotify_youtube_clean", "artist"),
+}
+
+# Names fetched from FTS5 per query before re-scoring
+SHORTLIST = 200
+
+
+def ensure(con: sqlite3.Connection) -> None:
+    con.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE}
+        USING fts5(name, source UNINDEXED, tokenize = 'trigram')
+    """)
+
+
+def _has_column(con: sqlite3.Connection, table: str, column: str) -> bool:
+    return any(r[1] == column for r in con.execute(f"PRAGMA table_info({table})"))
+
+
+def refresh(con: sqlite3.Connection, sources: list[str] | None = None) -> dict[str, tuple[int, int]]:
+    """
+    Bring the index in line with the source tables; sources whose table is
+    missing are skipped. Returns {source: (names added, names removed)}.
+    """
+    ensure(con)
+    changes = {}
+    for source in sources or list(SOURCES):
+        table, col = SOURCES[source]
+        if not _has_column(con, table, col):
+            continue
+        con.execute("DROP TABLE IF EXISTS temp.artist_search_src")
+        con.execute(f"""
+            CREATE TEMP TABLE artist_search_src AS
+            SELECT DISTINCT {col} AS name FROM {table}
+            WHERE {col} IS NOT NULL AND TRIM({col}) <> ''
+        """)
+        con.execute("CREATE INDEX temp.ix_artist_search_src ON artist_search_src(name)")
+        con.execute("DROP TABLE IF EXISTS temp.artist_search_cur")
+        con.execute(f"""
+            CREATE TEMP TABLE artist_search_cur AS
+            SELECT rowid AS id, name FROM {TABLE} WHERE source = ?
+        """, (source,))
+        con.execute("CREATE INDEX temp.ix_artist_search_cur ON artist_search_cur(name)")
+
+        removed = con.execute(f"""
+            DELETE FROM {TABLE} WHERE rowid IN (
+              SELECT id FROM temp.artist_search_cur
+              WHERE name NOT IN (SELECT name FROM temp.artist_search_src)
+            )
+        """).rowcount
+        added = con.execute(f"""
+            INSERT INTO {TABLE} (name, source)
+            SELECT name, ? FROM temp.artist_search_src
+            WHERE name NOT IN (SELECT name FROM temp.artist_search_cur)
+        """, (source,)).rowcount
+        changes[source] = (added, removed)
+    con.execute("DROP TABLE IF EXISTS temp.artist_search_src")
+    con.execute("DROP TABLE IF EXISTS temp.artist_search_cur")
+    return changes
+
+
+def refresh_names(con: sqlite3.Connection, source: str, names) -> tuple[int, int]:
+    """
+    Like refresh() for one source, limited to `names`: each is indexed if the
+    source table still holds it and dropped from the index otherwise. Returns
+    (names added, names removed).
+    """
+    ensure(con)
+    table, col = SOURCES[source]
+    added = removed = 0
+    for name in {n for n in names if n is not None and n.strip()}:
+        present = con.execute(f"SELECT 1 FROM {table} WHERE {col} = ? LIMIT 1", (name,)).fetchone()
+        if len(name) >= 3:
+            ids = con.execute(f"""
+                SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH ? AND name = ? AND source = ?
+            """, ['name : "' + name.replace('"', '""') + '"', name, source]).fetchall()
+        else:
+            ids = con.execute(f"SELECT rowid FROM {TABLE} WHERE name = ? AND source = ?",
+                              (name, source)).fetchall()
+        if present and not ids:
+            con.execute(f"INSERT INTO {TABLE} (name, source) VALUES (?, ?)", (name, source))
+            added += 1
+        elif ids and not present:
+            con.executemany(f"DELETE FROM {TABLE} WHERE rowid = ?", ids)
+            removed += 1
+    return added, removed
+
+
+def _trigram_query(text: str) -> str:
+    """FTS5 query matching any trigram of `text` (each one quoted as a phrase)."""
+    s = text.strip()
+    grams = dict.fromkeys(s[i:i + 3].lower() for i in range(len(s) - 2))
+    return " OR ".join('"' + g.replace('"', '""') + '"' for g in grams)
+
+
+def lookup(
+    con: sqlite3.Connection,
+    query: str,
+    limit: int = 10,
+    sources: list[str] | None = None,
+    min_score: float = 0.0,
+) -> list[tuple[str, str, float]]:
+    """Ranked (name, source, WRatio score) matches for `query`, best first."""
+    from rapidfuzz import fuzz, utils
+
+    query = query.strip()
+    if not query:
+        return []
+    where, params = "", []
+    if sources:
+        where = f" AND source IN ({', '.join('?' * len(sources))})"
+        params = list(sources)
+
+    if len(query) >= 3:
+        rows = con.execute(f"""
+            SELECT name, source FROM {TABLE}
+            WHERE {TABLE} MATCH ?{where}
+            ORDER BY rank
+            LIMIT ?
+        """, [_trigram_query(query), *params, SHORTLIST]).fetchall()
+    else:
+        # Too short for a trigram; prefix scan instead
+        rows = con.execute(f"""
+            SELECT name, source FROM {TABLE}
+            WHERE name LIKE ? ESCAPE '\\'{where}
+            LIMIT ?
+        """, [query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%", *params,
+              SHORTLIST]).fetchall()
+
+    scored = [(name, source, round(fuzz.WRatio(query, name, processor=utils.default_process), 1))
+              for name, source in rows]
+    scored = [r for r in scored if r[2] >= min_score]
+    scored.sort(key=lambda r: (-r[2], len(r[0]), r[0], r[1]))
+    return scored[:limit]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Fuzzy artist lookup over the warehouse FTS5 index.")
+    ap.add_argument("query", nargs="?", help="artist name (typos and partial names are fine)")
+    ap.add_argument("--limit", type=int, default=10)
+    ap.add_argument("--source", action="append", choices=sorted(SOURCES),
+                    help="restrict to a source (repeatable)")
+    ap.add_argument("--rebuild", action="store_true", help="refresh the index from every source table first")
+    args = ap.parse_args()
+    if not args.query and not args.rebuild:
+        ap.error("give a query or --rebuild")
+
+    if not DB.exists():
+        raise FileNotFoundError(f"Missing warehouse DB: {DB}")
+    con = sqlite3.connect(DB)
+    try:
+        if args.rebuild:
+            t0 = time.perf_counter()
+            with con:
+                changes = refresh(con)
+            for source, (added, removed) in changes.items():
+                print(f"[ok] {TABLE}[{source}]: +{added:,} / -{removed:,}")
+            print(f"[ok] index refreshed in {time.perf_counter() - t0:.2f}s")
+        if args.query:
+            t0 = time.perf_counter()
+            hits = lookup(con, args.query, limit=args.limit, sources=args.source)
+            print(f"[info] {len(hits)} match(es) for {args.query!r} in {(time.perf_counter() - t0) * 1000:.1f} ms")
+            for name, source, score in hits:
+                print(f"  {score:>5.1f}  {name}  [{source}]")
+    finally:
+        con.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,19 @@
 from pathlib import Path
 import sqlite3
 import pandas as pd
-import unicodedata
 import re
 
-DB = Path("data/processed/vinyl_dw.sqlite")
+import instrument
+import interim_io
+import name_norm
+import warehouse
+
+DB = warehouse.db_path(Path("data/processed/vinyl_dw.sqlite"))
 OUT = Path("data/processed/artist_universe.csv")
 
-FEAT_PAT = re.compile(r"\b(feat\.?|ft\.?)\b.*$", flags=re.IGNORECASE)
 AND_SPLIT = re.compile(r"\s*[&,+/]\s*")
 
-def norm(s: str) -> str:
-    if not isinstance(s, str):
-        return ""
-    s = FEAT_PAT.sub("", s)            # drop trailing features
-    s = unicodedata.normalize("NFKC", s).strip()
-    s = re.sub(r"\s+", " ", s)
-    return s.casefold()
-
+st = instrument.start("build_artist_universe")
 with sqlite3.connect(DB) as con:
     df = pd.read_sql_query("""
         SELECT artist, COUNT(*) AS n_reviews
@@ -25,6 +21,8 @@ with sqlite3.connect(DB) as con:
         GROUP BY artist
     """, con)
 
+st.lap("read", rows_out=len(df))
+
 # Split obvious compound credits (A & B, A/B, A + B) into separate rows too
 rows = []
 for a, n in zip(df["artist"], df["n_reviews"]):
@@ -37,7 +35,7 @@ for a, n in zip(df["artist"], df["n_reviews"]):
 u = pd.DataFrame(rows, columns=["artist", "n_reviews"])
 u = u.groupby("artist", as_index=False)["n_reviews"].sum()
 
-u["artist_norm"] = u["artist"].apply(norm)
+u["artist_norm"] = name_norm.normalize(u["artist"], "universe")
 u["is_various"] = u["artist_norm"].isin({"various artists"})
 u["is_suspicious_token"] = u["artist"].str.len().fillna(0) <= 2
 
@@ -45,7 +43,9 @@ u["is_suspicious_token"] = u["artist"].str.len().fillna(0) <= 2
 u = (u.sort_values(["artist_norm", "n_reviews"], ascending=[True, False])
        .drop_duplicates(subset=["artist_norm"], keep="first"))
 
-OUT.parent.mkdir(parents=True, exist_ok=True)
-u.to_csv(OUT, index=False)
-print(f"[ok] wrote {OUT} ({len(u):,} artists)")
+st.lap("normalize", rows_in=len(df), rows_out=len(u))
+out = interim_io.write_table(u, OUT)
+st.lap("write", rows_out=len(u))
+st.rows(rows_in=len(df), rows_out=len(u))
+print(f"[ok] wrote {out} ({len(u):,} artists)")
 print(u.sort_values("n_reviews", ascending=False).head(15).to_string(index=False))
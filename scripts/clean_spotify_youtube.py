@@ -1,14 +1,41 @@
-import pandas as pd
+# scripts/clean_spotify_youtube.py
+"""
+Project the Spotify/YouTube track dump to the columns the warehouse uses, drop
+rows without an artist or song and exact duplicates, and write:
+
+  spotify_youtube_clean     one row per distinct track row
+  spotify_artist_rollup     per-artist counts, sums and means (the figures in
+                            vw_artist_streams), keyed by the Spotify artist name
+
+With --stream the source is read in chunks of --chunk-rows (only the used
+columns). Duplicates are found through 64-bit row fingerprints kept as sorted
+runs (8 bytes per distinct row, no row data), and the rollup is built from
+per-chunk partial sums, so memory grows with the number of distinct artists
+rather than with the size of the file.
+
+Usage:
+  python scripts/clean_spotify_youtube.py
+  python scripts/clean_spotify_youtube.py --stream --chunk-rows 200000
+"""
+from __future__ import annotations
+
 from pathlib import Path
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import instrument
+import interim_io
 
 SRC = Path(r"D:\Projects\vinyl-critics-vs-streams\data\raw\spotify_youtube\Spotify_Youtube.csv")
 OUT = Path(r"D:\Projects\vinyl-critics-vs-streams\data\interim\spotify_youtube_clean.csv")
+ROLLUP_OUT = Path(r"D:\Projects\vinyl-critics-vs-streams\data\interim\spotify_artist_rollup.csv")
 
-df = pd.read_csv(SRC, low_memory=False)
+# Streaming mode: source rows per chunk
+CHUNK_ROWS = 100_000
 
-df.columns = [c.strip().lower().replace(" ", "_") for c in df.columns]
-
-colmap = {
+COLMAP = {
     "artist": "artist",
     "track": "song",
     "danceability": "danceability",
@@ -19,17 +46,189 @@ colmap = {
     "likes": "yt_likes",
     "comments": "yt_comments",
 }
-# streams column name differs by dataset versions → handle both
-if "stream" in df.columns:
-    colmap["stream"] = "streams"
-elif "streams" in df.columns:
-    colmap["streams"] = "streams"
+TEXT_COLS = ["artist", "song"]
+
+# Rollup columns: (output name, "sum" | "avg", track column), as in vw_artist_streams
+ROLLUP = [
+    ("total_streams", "sum", "streams"),
+    ("avg_streams_per_track", "avg", "streams"),
+    ("total_yt_views", "sum", "yt_views"),
+    ("avg_yt_views_per_track", "avg", "yt_views"),
+    ("total_yt_likes", "sum", "yt_likes"),
+    ("total_yt_comments", "sum", "yt_comments"),
+    ("avg_danceability", "avg", "danceability"),
+    ("avg_energy", "avg", "energy"),
+    ("avg_valence", "avg", "valence"),
+]
+
+
+def normalize_column(c: str) -> str:
+    return c.strip().lower().replace(" ", "_")
+
+
+def column_map(columns: list[str]) -> dict[str, str]:
+    """Normalized source column -> clean column, for the columns present."""
+    colmap = dict(COLMAP)
+    # streams column name differs by dataset versions → handle both
+    if "stream" in columns:
+        colmap["stream"] = "streams"
+    elif "streams" in columns:
+        colmap["streams"] = "streams"
+    return {k: v for k, v in colmap.items() if k in columns}
+
+
+class SeenRows:
+    """
+    Fingerprints of the rows kept so far, as sorted uint64 runs. A new run per
+    chunk, merged with the previous one while it is not smaller (so there are
+    about log2(rows / chunk) runs to probe).
+    """
+
+    def __init__(self):
+        self.runs: list[np.ndarray] = []
+
+    def __len__(self) -> int:
+        return sum(len(r) for r in self.runs)
+
+    def first_seen(self, fp: np.ndarray) -> np.ndarray:
+        """Mask of rows whose fingerprint has not been seen (first occurrence within `fp` too)."""
+        keep = np.zeros(len(fp), dtype=bool)
+        keep[np.unique(fp, return_index=True)[1]] = True
+        for run in self.runs:
+            cand = np.flatnonzero(keep)
+            cand = cand[np.argsort(fp[cand])]             # sorted needles keep the probes cache-friendly
+            pos = np.minimum(np.searchsorted(run, fp[cand]), len(run) - 1)
+            keep[cand[run[pos] == fp[cand]]] = False
+
+        if not keep.any():
+            return keep                                     # all seen before: no run to add
+        self.runs.append(np.sort(fp[keep]))
+        while len(self.runs) > 1 and len(self.runs[-2]) <= len(self.runs[-1]):
+            b, a = self.runs.pop(), self.runs.pop()
+            self.runs.append(np.sort(np.concatenate([a, b]), kind="stable"))
+        return keep
+
+
+def fingerprints(df: pd.DataFrame) -> np.ndarray:
+    # -0.0 and 0.0 hash differently but are the same value to drop_duplicates
+    floats = {c: df[c] + 0.0 for c in df.columns if pd.api.types.is_float_dtype(df[c])}
+    return pd.util.hash_pandas_object(df.assign(**floats), index=False, categorize=False).to_numpy()
+
+
+class ArtistRollup:
+    """
+    Per-artist track count plus sum / non-null count of each rollup column.
+    Chunk partials are buffered and folded into the running totals once they
+    outgrow them, so the state stays proportional to the number of artists.
+    """
+
+    def __init__(self, columns: list[str]):
+        self.cols = [c for c in dict.fromkeys(col for _, _, col in ROLLUP) if c in columns]
+        self.totals: pd.DataFrame | None = None
+        self.pending: list[pd.DataFrame] = []
+        self.pending_rows = 0
+
+    def add(self, tracks: pd.DataFrame) -> None:
+        g = tracks.groupby("artist", sort=False)
+        part = pd.concat(
+            [g.size().rename("track_count")]
+            + [g[c].sum().rename(f"sum_{c}") for c in self.cols]
+            + [g[c].count().rename(f"n_{c}") for c in self.cols],
+            axis=1,
+        )
+        self.pending.append(part)
+        self.pending_rows += len(part)
+        if self.pending_rows > max(len(self.totals) if self.totals is not None else 0, 100_000):
+            self._fold()
+
+    def _fold(self) -> None:
+        parts = ([self.totals] if self.totals is not None else []) + self.pending
+        if parts:
+            self.totals = pd.concat(parts).groupby(level=0, sort=False).sum()
+        self.pending, self.pending_rows = [], 0
+
+    def result(self) -> pd.DataFrame:
+        self._fold()
+        t = self.totals
+        if t is None:
+            t = pd.DataFrame(columns=["track_count"], index=pd.Index([], name="artist"))
+        out = pd.DataFrame({"track_count": t["track_count"].astype("int64")}, index=t.index)
+        for name, kind, col in ROLLUP:
+            if col not in self.cols:
+                continue
+            n = t[f"n_{col}"]
+            s = t[f"sum_{col}"].where(n > 0)                # SUM/AVG of no values is NULL
+            out[name] = s if kind == "sum" else s / n.where(n > 0)
+        out.index.name = "artist"
+        return out.sort_index().reset_index()
+
+
+def clean_in_memory(st) -> tuple[int, pd.DataFrame, pd.DataFrame]:
+    df = pd.read_csv(SRC, low_memory=False)
+    st.lap("read", rows_out=len(df))
+
+    df.columns = [normalize_column(c) for c in df.columns]
+    colmap = column_map(list(df.columns))
+    clean = df[list(colmap)].rename(columns=colmap)
+
+    clean = clean.dropna(subset=["artist","song"]).drop_duplicates()
+    st.lap("clean", rows_in=len(df), rows_out=len(clean))
+
+    rollup = ArtistRollup(list(clean.columns))
+    rollup.add(clean)
+    return len(df), clean, rollup.result()
+
+
+def clean_streaming(st, chunk_rows: int) -> tuple[int, int, pd.DataFrame]:
+    header = pd.read_csv(SRC, nrows=0).columns
+    by_norm = {normalize_column(c): c for c in header}
+    colmap = column_map(list(by_norm))
+    usecols = [by_norm[k] for k in colmap]
+    dtype = {by_norm[k]: ("str" if v in TEXT_COLS else "float64") for k, v in colmap.items()}
+    rename = {by_norm[k]: v for k, v in colmap.items()}
+    order = list(colmap.values())
+
+    seen = SeenRows()
+    rollup = ArtistRollup(order)
+    rows_in = 0
+    with interim_io.TableWriter(OUT) as out:
+        for chunk in pd.read_csv(SRC, usecols=usecols, dtype=dtype, chunksize=chunk_rows):
+            rows_in += len(chunk)
+            chunk = chunk.rename(columns=rename)[order].dropna(subset=["artist", "song"])
+            chunk = chunk[seen.first_seen(fingerprints(chunk))]
+            if len(chunk) or not out.rows:
+                out.write(chunk)
+            rollup.add(chunk)
+        written = out.rows
+    st.lap("stream", rows_in=rows_in, rows_out=written)
+    print(f"[info] {rows_in:,} source rows -> {written:,} distinct tracks "
+          f"({len(seen.runs)} fingerprint run(s), {len(seen) * 8 / 2**20:.1f} MB)")
+    return rows_in, written, rollup.result()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Clean the Spotify/YouTube track dump and roll it up per artist.")
+    ap.add_argument("--stream", action="store_true",
+                    help="chunked read and dedupe with memory bounded by the number of artists")
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = ap.parse_args()
+    st = instrument.start("clean_spotify_youtube")
 
-keep = [k for k in colmap.keys() if k in df.columns]
-clean = df[keep].rename(columns=colmap)
+    if args.stream:
+        rows_in, rows_out, rollup = clean_streaming(st, args.chunk_rows)
+        out = interim_io.target(OUT)
+    else:
+        rows_in, clean, rollup = clean_in_memory(st)
+        rows_out = len(clean)
+        out = interim_io.write_table(clean, OUT)
+        st.lap("write", rows_out=rows_out)
 
+    rollup_out = interim_io.write_table(rollup, ROLLUP_OUT)
+    st.lap("rollup", rows_out=len(rollup))
+    st.rows(rows_in=rows_in, rows_out=rows_out)
+    print(f"Saved {rows_out:,} rows -> {out}")
+    print(f"Saved {len(rollup):,} artist rollups -> {rollup_out}")
 
-clean = clean.dropna(subset=["artist","song"]).drop_duplicates()
 
-clean.to_csv(OUT, index=False)
-print(f"Saved {len(clean):,} rows -> {OUT}")
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,22 @@
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 import sqlite3
-import pandas as pd
 import sys
+import os
+import io
+import csv
 import json
+import gzip
 import hashlib
+import argparse
 from datetime import datetime, timezone
 
-# Source SQLite dump (immutable input) and destination for extracted CSVs.
+import instrument
+import interim_io
+import merkle
+import warehouse
+
+# Source SQLite dump (immutable input) and destination for extracted files (see interim_io).
 RAW_DB = Path(r"D:\Projects\vinyl-critics-vs-streams\data\raw\pitchfork\database.sqlite")
 OUTDIR = Path(r"D:\Projects\vinyl-critics-vs-streams\data\interim")
 
@@ -16,44 +26,236 @@ TABLES = ["artists", "reviews", "genres", "labels", "years", "content"]
 # Where we store a machine-readable snapshot of the export.
 MANIFEST = OUTDIR / "pitchfork_export_meta.json"
 
-print(f"[info] using db: {RAW_DB}")
-print(f"[info] writing to: {OUTDIR.resolve()}")
+# Warehouse targeted by --direct (tables land as pitchfork_<table>, like stage_to_sqlite.py).
+DW_DB = warehouse.db_path(Path(r"D:\Projects\vinyl-critics-vs-streams\data\processed\vinyl_dw.sqlite"))
+
+# Rows per fetchmany() batch (and per Parquet row group) when streaming a table out.
+FETCH_ROWS = 20_000
+
+class HashingWriter(io.RawIOBase):
+    """Binary sink that hashes and counts the bytes on their way to the file."""
+
+    def __init__(self, f):
+        self.f = f
+        self.sha = hashlib.sha256()
+        self.n = 0
 
-# Fail fast if the dump is missing. Early exit beats partial, silent failures.
-if not RAW_DB.exists():
-    print(f"[error] database not found at: {RAW_DB}", file=sys.stderr)
-    sys.exit(1)
+    def writable(self) -> bool:
+        return True
 
-# Idempotent: safe to run repeatedly in local dev or CI.
-OUTDIR.mkdir(parents=True, exist_ok=True)
+    def write(self, b) -> int:
+        self.sha.update(b)
+        self.n += len(b)
+        return self.f.write(b)
 
-def sha256_file(path: Path, chunk_size: int = 1024 * 1024) -> str:
-    """Memory-safe hashing for reproducibility & drift detection."""
+    def tell(self) -> int:
+        return self.n
+
+    def flush(self) -> None:
+        self.f.flush()
+
+def sha256_rows(con: sqlite3.Connection, table: str, batch: int = 10_000,
+                digests: merkle.KeyDigests | None = None) -> tuple[str, int]:
+    """
+    Hash a table's rows in rowid order (one JSON array per line), feeding them
+    to `digests` too when given.
+    Returns (hexdigest, bytes hashed); same data -> same hash, whatever the storage.
+    """
     h = hashlib.sha256()
-    with path.open("rb") as f:
-        for chunk in iter(lambda: f.read(chunk_size), b""):
-            h.update(chunk)
-    return h.hexdigest()
-
-con = sqlite3.connect(str(RAW_DB))
-manifest = {
-    "source_db": str(RAW_DB),
-    "source_db_mtime": datetime.fromtimestamp(RAW_DB.stat().st_mtime, tz=timezone.utc).isoformat(),
-    "exported_at": datetime.now(tz=timezone.utc).isoformat(),
-    "tables": {},
-    "missing_tables": [],
-    "totals": {"tables_exported": 0, "rows_exported": 0, "bytes_exported": 0},
-    "notes": [
-        "sha256 is of the CSV at export time; commit this manifest to detect drift.",
-        "missing_tables indicates expected-but-absent tables in the SQLite dump."
-    ],
-}
-
-try:
-    # Inventory the schema once; avoids hard-coded assumptions about what's present.
-    existing = pd.read_sql(
-        "SELECT name FROM sqlite_master WHERE type='table';", con
-    )["name"].tolist()
+    n = 0
+    cur = con.execute(f'SELECT * FROM "{table}" ORDER BY rowid')
+    while rows := cur.fetchmany(batch):
+        if digests is not None:
+            digests.add(rows)
+        for r in rows:
+            line = (json.dumps(r, ensure_ascii=False, default=repr) + "\n").encode("utf-8")
+            h.update(line)
+            n += len(line)
+    return h.hexdigest(), n
+
+def column_kinds(con: sqlite3.Connection, table: str) -> dict[str, str]:
+    """
+    'int', 'float' or 'text' per column, as pandas would have inferred them for
+    the whole table: declared INTEGER columns holding NULLs become floats. One
+    aggregate pass; the rows themselves are never materialized.
+    """
+    cols = con.execute(f'PRAGMA table_info("{table}")').fetchall()
+    nulls = con.execute(
+        "SELECT " + ", ".join(f'COUNT(*) - COUNT("{c[1]}")' for c in cols) + f' FROM "{table}"'
+    ).fetchone()
+    kinds = {}
+    for (_, name, decl, *_), n_null in zip(cols, nulls):
+        decl = (decl or "").upper()
+        if "INT" in decl:
+            kinds[name] = "float" if n_null else "int"
+        elif any(k in decl for k in ("REAL", "FLOA", "DOUB")):
+            kinds[name] = "float"
+        else:
+            kinds[name] = "text"
+    return kinds
+
+def _csv_field(v, kind: str):
+    # Same text as DataFrame.to_csv: floats keep their repr (2016.0), NULL is empty
+    if v is None:
+        return ""
+    return repr(float(v)) if kind == "float" else v
+
+def key_digests(cur: sqlite3.Cursor) -> merkle.KeyDigests | None:
+    """Merkle accumulator for a result set keyed by reviewid, or None if it has no such column."""
+    names = [d[0] for d in cur.description]
+    return merkle.KeyDigests(names.index(merkle.KEY)) if merkle.KEY in names else None
+
+def _batches(cur: sqlite3.Cursor, digests: merkle.KeyDigests | None):
+    while batch := cur.fetchmany(FETCH_ROWS):
+        if digests is not None:
+            digests.add(batch)
+        yield batch
+
+def _write_csv(batches, kinds: dict[str, str], sink, compression: str | None) -> int:
+    if compression == "gzip":
+        stream = gzip.GzipFile(fileobj=sink, mode="wb", mtime=0)      # mtime=0: same rows -> same bytes
+    elif compression == "zstd":
+        import zstandard
+        stream = zstandard.ZstdCompressor().stream_writer(sink, closefd=False)
+    else:
+        stream = sink
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="", write_through=True)
+    # os.linesep like DataFrame.to_csv, so the committed (CRLF) hashes still match on Windows
+    w = csv.writer(text, lineterminator=os.linesep)
+    w.writerow(list(kinds))
+    types = list(kinds.values())
+    rows = 0
+    for batch in batches:
+        if "float" in types:
+            batch = [[_csv_field(v, k) for v, k in zip(r, types)] for r in batch]
+        w.writerows(batch)
+        rows += len(batch)
+    text.flush()
+    text.detach()
+    if stream is not sink:
+        stream.close()
+    return rows
+
+def _write_parquet(batches, kinds: dict[str, str], sink, compression: str | None) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    arrow = {"int": pa.int64(), "float": pa.float64(), "text": pa.large_string()}
+    schema = pa.schema([(c, arrow[k]) for c, k in kinds.items()])
+    rows = 0
+    with pq.ParquetWriter(sink, schema, compression=compression or interim_io.PARQUET_COMPRESSION) as w:
+        for batch in batches:
+            cols = list(zip(*batch))
+            w.write_batch(pa.record_batch([pa.array(c, type=t) for c, t in zip(cols, schema.types)],
+                                          schema=schema))
+            rows += len(batch)
+    return rows
+
+def export_table(t: str, fmt: str, compression: str | None) -> dict:
+    """
+    Stream one table from its own read-only connection into its interim file,
+    hashing the bytes as they are written and the rows per reviewid range
+    (see merkle.py). Runs in a worker process.
+    """
+    con = sqlite3.connect(RAW_DB.resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        kinds = column_kinds(con, t)
+        out = interim_io.target(OUTDIR / f"pitchfork_{t}.csv", fmt)
+        if fmt == "csv" and compression in interim_io.CSV_COMPRESSION:
+            out = out.with_suffix(".csv" + interim_io.CSV_COMPRESSION[compression])
+        cur = con.execute(f'SELECT * FROM "{t}"')
+        digests = key_digests(cur)
+        tmp = out.with_name(out.name + ".tmp")
+        with tmp.open("wb") as f:
+            sink = HashingWriter(f)
+            write = _write_parquet if fmt == "parquet" else _write_csv
+            rows = write(_batches(cur, digests), kinds, sink, compression)
+        os.replace(tmp, out)
+    finally:
+        con.close()
+
+    if fmt == "csv":
+        # Drop the other CSV variants of this table so readers can't pick up a stale one
+        base = OUTDIR / f"pitchfork_{t}.csv"
+        for stale in [base] + [base.with_suffix(".csv" + e) for e in interim_io.CSV_COMPRESSION.values()]:
+            if stale != out:
+                stale.unlink(missing_ok=True)
+
+    entry = {
+        f"{interim_io.format_of(out)}_path": str(out),
+        "rows": rows,
+        "bytes": sink.n,
+        "sha256": sink.sha.hexdigest(),
+    }
+    if digests is not None:
+        entry["merkle"] = digests.section()
+    return entry
+
+def ingest_direct(manifest: dict, st) -> None:
+    """
+    Copy the expected tables from the raw dump into typed warehouse tables with
+    INSERT ... SELECT, in one transaction. Declared column types come from the
+    dump, so nothing is serialized to text and parsed back.
+    """
+    DW_DB.parent.mkdir(parents=True, exist_ok=True)
+    dw = sqlite3.connect(str(DW_DB), isolation_level=None, uri=True)
+    try:
+        dw.execute("PRAGMA journal_mode=WAL;")
+        dw.execute("PRAGMA synchronous=NORMAL;")
+        dw.execute("ATTACH DATABASE ? AS raw", (RAW_DB.resolve().as_uri() + "?mode=ro",))
+        existing = [r[0] for r in dw.execute("SELECT name FROM raw.sqlite_master WHERE type='table';")]
+        print(f"[info] tables found: {existing}")
+
+        missing = [t for t in TABLES if t not in existing]
+        if missing:
+            print(f"[warn] missing tables in DB: {missing}")
+            manifest["missing_tables"] = missing
+
+        dw.execute("BEGIN")
+        try:
+            for t in TABLES:
+                if t not in existing:
+                    continue
+                out = f"pitchfork_{t}"
+                cols = dw.execute(f'PRAGMA raw.table_info("{t}")').fetchall()
+                ddl = ", ".join(f'"{c[1]}" {c[2]}'.rstrip() for c in cols)
+                dw.execute(f'DROP TABLE IF EXISTS main."{out}"')
+                dw.execute(f'CREATE TABLE main."{out}" ({ddl})')
+                dw.execute(f'INSERT INTO main."{out}" SELECT * FROM raw."{t}" ORDER BY rowid')
+                n_rows = dw.execute(f'SELECT COUNT(*) FROM main."{out}"').fetchone()[0]
+                digests = key_digests(dw.execute(f'SELECT * FROM main."{out}" LIMIT 0'))
+                digest, n_bytes = sha256_rows(dw, out, digests=digests)
+
+                manifest["tables"][t] = {
+                    "table": out,
+                    "db_path": str(DW_DB),
+                    "rows": int(n_rows),
+                    "bytes": int(n_bytes),
+                    "sha256": digest,
+                }
+                if digests is not None:
+                    manifest["tables"][t]["merkle"] = digests.section()
+                manifest["totals"]["tables_exported"] += 1
+                manifest["totals"]["rows_exported"] += int(n_rows)
+                manifest["totals"]["bytes_exported"] += int(n_bytes)
+                st.lap(f"ingest_{t}", rows_out=int(n_rows))
+                print(f"[ok] {t}: {n_rows:,} rows -> {DW_DB}:{out}")
+            dw.execute("COMMIT")
+        except BaseException:
+            dw.execute("ROLLBACK")
+            raise
+        dw.execute("DETACH DATABASE raw")
+    finally:
+        dw.close()
+        print("[info] closed sqlite connection")
+
+def export_files(manifest: dict, st, compression: str | None, workers: int | None) -> None:
+    con = sqlite3.connect(RAW_DB.resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        # Inventory the schema once; avoids hard-coded assumptions about what's present.
+        existing = [r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type='table';")]
+    finally:
+        # Always close the handle; avoids locked files on Windows and flaky reruns.
+        con.close()
     print(f"[info] tables found: {existing}")
 
     # Surface drift explicitly: warn if the upstream dump changed.
@@ -63,37 +265,87 @@ try:
         manifest["missing_tables"] = missing
 
     # Extract only the tables we actually have; skip missing gracefully.
-    for t in TABLES:
-        if t not in existing:
-            continue
-
-        df = pd.read_sql(f"SELECT * FROM {t}", con)
-        out = OUTDIR / f"pitchfork_{t}.csv"
-        # CSV is the neutral interchange format for the staging layer.
-        df.to_csv(out, index=False)
+    todo = [t for t in TABLES if t in existing]
+    fmt = interim_io.active_format()
+    n_workers = min(workers or os.cpu_count() or 1, len(todo)) or 1
+    if n_workers > 1:
+        # One process (and read-only connection) per table at a time
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            futures = {t: pool.submit(export_table, t, fmt, compression) for t in todo}
+            results = {t: f.result() for t, f in futures.items()}
+    else:
+        results = {t: export_table(t, fmt, compression) for t in todo}
 
+    for t in todo:
         # Collect per-table metadata for auditing and reproducibility.
-        bytes_out = out.stat().st_size
-        file_hash = sha256_file(out)
-
-        manifest["tables"][t] = {
-            "csv_path": str(out),
-            "rows": int(len(df)),
-            "bytes": int(bytes_out),
-            "sha256": file_hash,
-        }
+        entry = results[t]
+        manifest["tables"][t] = entry
         manifest["totals"]["tables_exported"] += 1
-        manifest["totals"]["rows_exported"] += int(len(df))
-        manifest["totals"]["bytes_exported"] += int(bytes_out)
+        manifest["totals"]["rows_exported"] += entry["rows"]
+        manifest["totals"]["bytes_exported"] += entry["bytes"]
+        path = next(v for k, v in entry.items() if k.endswith("_path"))
+        print(f"[ok] {t}: {entry['rows']:,} rows -> {path} ({entry['bytes']:,} bytes)")
+    st.lap("export", rows_out=manifest["totals"]["rows_exported"])
+    print(f"[info] {len(todo)} table(s) exported on {n_workers} worker(s)")
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Export the Pitchfork SQLite dump.")
+    ap.add_argument("--direct", action="store_true",
+                    help="ATTACH the dump and copy tables straight into the warehouse (no CSV round trip)")
+    ap.add_argument("--compression", choices=["none", *interim_io.CSV_COMPRESSION],
+                    help="Parquet codec (default zstd), or compress CSV output to .csv.gz/.csv.zst (default none)")
+    ap.add_argument("--workers", type=int, default=None,
+                    help="tables exported in parallel (default: one per CPU, 1 = in-process)")
+    args = ap.parse_args()
+    st = instrument.start("extract_pitchfork")
+
+    print(f"[info] using db: {RAW_DB}")
+    print(f"[info] writing to: {OUTDIR.resolve()}")
+
+    # Fail fast if the dump is missing. Early exit beats partial, silent failures.
+    if not RAW_DB.exists():
+        print(f"[error] database not found at: {RAW_DB}", file=sys.stderr)
+        sys.exit(1)
+
+    # Idempotent: safe to run repeatedly in local dev or CI.
+    OUTDIR.mkdir(parents=True, exist_ok=True)
+
+    if args.compression == "zstd" and interim_io.active_format() == "csv" and not args.direct:
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            print("[error] --compression zstd for CSV output needs the zstandard package", file=sys.stderr)
+            sys.exit(1)
+
+    manifest = {
+        "source_db": str(RAW_DB),
+        "source_db_mtime": datetime.fromtimestamp(RAW_DB.stat().st_mtime, tz=timezone.utc).isoformat(),
+        "exported_at": datetime.now(tz=timezone.utc).isoformat(),
+        "mode": "direct" if args.direct else interim_io.active_format(),
+        "hash_kind": "rows" if args.direct else f"{interim_io.active_format()}_file",
+        "tables": {},
+        "missing_tables": [],
+        "totals": {"tables_exported": 0, "rows_exported": 0, "bytes_exported": 0},
+        "notes": [
+            "sha256 is of the exported file (hash_kind=csv_file/parquet_file) or of the table rows "
+            "in rowid order (hash_kind=rows); commit this manifest to detect drift.",
+            "merkle hashes rows per reviewid range whatever the hash_kind; verify_manifest.py "
+            "diffs two of them down to the changed reviewids.",
+            "missing_tables indicates expected-but-absent tables in the SQLite dump."
+        ],
+    }
+
+    if args.direct:
+        ingest_direct(manifest, st)
+    else:
+        export_files(manifest, st, args.compression, args.workers)
 
-        print(f"[ok] {t}: {len(df):,} rows -> {out} ({bytes_out:,} bytes)")
+    st.rows(rows_in=manifest["totals"]["rows_exported"], rows_out=manifest["totals"]["rows_exported"])
 
-finally:
-    # Always close the handle; avoids locked files on Windows and flaky reruns.
-    con.close()
-    print("[info] closed sqlite connection")
+    # Write manifest last so a partial export won’t leave a misleading manifest.
+    with MANIFEST.open("w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    print(f"[ok] wrote manifest -> {MANIFEST}")
 
-# Write manifest last so a partial export won’t leave a misleading manifest.
-with MANIFEST.open("w", encoding="utf-8") as f:
-    json.dump(manifest, f, indent=2, ensure_ascii=False)
-print(f"[ok] wrote manifest -> {MANIFEST}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+# scripts/instrument.py
+"""
+Per-stage run metrics: wall time, CPU time, peak RSS, rows in/out and timed
+SQLite statements, written to a JSON run manifest next to
+pitchfork_export_meta.json.
+
+Each script calls `start("<stage>")` once; the stage record is written when the
+script exits (status "failed: <Error>" on an uncaught exception, "failed: exit
+<code>" on a non-zero sys.exit()). Scripts leave through sys.exit(), not
+`raise SystemExit`: a raised SystemExit reaches neither sys.excepthook nor the
+exit wrapper, so the stage would be recorded as "ok". Sub-steps are
+recorded with `lap()` (time since the previous lap, handy in top-level scripts)
+or the `step()` context manager, and heavy queries go through `sql()`.
+Data-quality results (quality.py) are attached with `checks()`.
+
+A run groups the stages of one pipeline pass. run_pipeline.py sets
+VINYL_RUN_ID for its children; scripts run by hand start a new run when their
+stage is already in the current one. The replaced manifest is kept as
+pipeline_run_meta.prev.json, so
+  python scripts/verify_manifest.py data/interim/pipeline_run_meta.prev.json data/interim/pipeline_run_meta.json
+compares the last two runs.
+"""
+from __future__ import annotations
+
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+import atexit
+import json
+import os
+import sqlite3
+import sys
+import time
+
+RUN_MANIFEST = Path("data/interim/pipeline_run_meta.json")
+PREV_MANIFEST = RUN_MANIFEST.with_name("pipeline_run_meta.prev.json")
+
+
+def peak_rss_mb() -> float | None:
+    """High-water resident set size of this process so far (None if unavailable)."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # KiB on Linux, bytes on macOS
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        mem = psutil.Process().memory_info()
+        return round(getattr(mem, "peak_wset", mem.rss) / (1024 * 1024), 1)
+    except ImportError:
+        return None
+
+
+def _rate(rows: int | None, seconds: float) -> float | None:
+    return round(rows / seconds, 1) if rows is not None and seconds > 0 else None
+
+
+class Stage:
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = datetime.now(tz=timezone.utc).isoformat()
+        self.t0 = self._lap_t = time.perf_counter()
+        self.cpu0 = self._lap_cpu = time.process_time()
+        self.rows_in: int | None = None
+        self.rows_out: int | None = None
+        self.steps: list[dict] = []
+        self.statements: list[dict] = []
+        self.check_results: list[dict] = []
+        self.finished = False
+
+    def _record_step(self, name: str, t0: float, cpu0: float, rows_in, rows_out) -> None:
+        wall = time.perf_counter() - t0
+        self.steps.append({
+            "step": name,
+            "wall_s": round(wall, 4),
+            "cpu_s": round(time.process_time() - cpu0, 4),
+            "peak_rss_mb": peak_rss_mb(),
+            "rows_in": rows_in,
+            "rows_out": rows_out,
+            "rows_per_s": _rate(rows_out if rows_out is not None else rows_in, wall),
+        })
+
+    def lap(self, name: str, rows_in: int | None = None, rows_out: int | None = None) -> None:
+        """Record the work since the previous lap (or the stage start) as a step."""
+        self._record_step(name, self._lap_t, self._lap_cpu, rows_in, rows_out)
+        self._lap_t, self._lap_cpu = time.perf_counter(), time.process_time()
+
+    @contextmanager
+    def step(self, name: str, rows_in: int | None = None):
+        """Time a block; set `.rows_out` on the yielded dict to record output rows."""
+        info = {"rows_out": None}
+        t0, cpu0 = time.perf_counter(), time.process_time()
+        try:
+            yield info
+        finally:
+            self._record_step(name, t0, cpu0, rows_in, info["rows_out"])
+            self._lap_t, self._lap_cpu = time.perf_counter(), time.process_time()
+
+    def sql(self, con: sqlite3.Connection | sqlite3.Cursor, label: str, sql: str, params=()) -> list:
+        """Execute a statement, fetch all rows and record how long it took."""
+        t0 = time.perf_counter()
+        rows = con.execute(sql, params).fetchall()
+        self.statements.append({"label": label, "seconds": round(time.perf_counter() - t0, 4), "rows": len(rows)})
+        return rows
+
+    def sql_script(self, con: sqlite3.Connection, label: str, script: str) -> None:
+        t0 = time.perf_counter()
+        con.executescript(script)
+        self.statements.append({"label": label, "seconds": round(time.perf_counter() - t0, 4), "rows": None})
+
+    def checks(self, results: list[dict]) -> None:
+        self.check_results.extend(results)
+
+    def rows(self, rows_in: int | None = None, rows_out: int | None = None) -> None:
+        if rows_in is not None:
+            self.rows_in = int(rows_in)
+        if rows_out is not None:
+            self.rows_out = int(rows_out)
+
+    def to_dict(self, status: str) -> dict:
+        wall = time.perf_counter() - self.t0
+        return {
+            "started_at": self.started_at,
+            "status": status,
+            "wall_s": round(wall, 4),
+            "cpu_s": round(time.process_time() - self.cpu0, 4),
+            "peak_rss_mb": peak_rss_mb(),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "rows_per_s": _rate(self.rows_out if self.rows_out is not None else self.rows_in, wall),
+            "steps": self.steps,
+            "sql": self.statements,
+            "checks": self.check_results,
+        }
+
+    def finish(self, status: str = "ok") -> None:
+        if self.finished:
+            return
+        self.finished = True
+        try:
+            write_stage(self.name, self.to_dict(status))
+        except OSError as e:
+            print(f"[warn] could not write run manifest {RUN_MANIFEST}: {e}")
+
+
+def write_stage(name: str, record: dict) -> None:
+    manifest = None
+    if RUN_MANIFEST.exists():
+        with RUN_MANIFEST.open("r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    run_id = os.environ.get("VINYL_RUN_ID")
+    new_run = manifest is None or (manifest.get("run_id") != run_id if run_id
+                                   else name in manifest.get("stages", {}))
+    if new_run:
+        if manifest is not None:
+            os.replace(RUN_MANIFEST, PREV_MANIFEST)
+        manifest = {
+            "run_id": run_id or datetime.now(tz=timezone.utc).strftime("%Y%m%dT%H%M%SZ"),
+            "started_at": record["started_at"],
+            "stages": {},
+        }
+
+    manifest["stages"][name] = record
+    manifest["updated_at"] = datetime.now(tz=timezone.utc).isoformat()
+    RUN_MANIFEST.parent.mkdir(parents=True, exist_ok=True)
+    tmp = RUN_MANIFEST.with_suffix(".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, RUN_MANIFEST)
+
+
+def start(name: str) -> Stage:
+    """Begin recording stage `name`; it is written to the run manifest at exit."""
+    st = Stage(name)
+    prev_hook = sys.excepthook
+
+    def hook(exc_type, exc, tb):
+        st.finish(status=f"failed: {exc_type.__name__}")
+        prev_hook(exc_type, exc, tb)
+
+    prev_exit = sys.exit
+
+    def exit_(status=None):
+        if status not in (None, 0):
+            st.finish(status=f"failed: exit {status}" if isinstance(status, int) else "failed: SystemExit")
+        prev_exit(status)
+
+    sys.excepthook = hook
+    sys.exit = exit_
+    atexit.register(st.finish)
+    return st
@@ -0,0 +1,195 @@
+"""
+Pluggable storage for interim/processed artifacts (Parquet by default, CSV on request).
+
+Scripts keep their `*.csv` path constants; the suffix is swapped for the active
+format on write, and reads fall back to whichever format exists on disk, so CSV
+artifacts from older runs stay readable. Pick the format with the
+VINYL_INTERIM_FORMAT environment variable (`parquet` or `csv`).
+
+Compressed CSVs (`*.csv.gz`, `*.csv.zst`, e.g. from `extract_pitchfork.py
+--compression`) are found as a last resort and read transparently by pandas
+(zstd needs the `zstandard` package).
+
+After `extract_pitchfork.py --direct` there are no Pitchfork interim files: the
+tables were copied straight into the warehouse. `direct_tables()` reads the
+export manifest so the staging scripts can take them from there instead.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from functools import lru_cache
+import json
+import os
+import pandas as pd
+
+FORMATS = {"parquet": ".parquet", "csv": ".csv"}
+EXPORT_MANIFEST = Path("data/interim/pitchfork_export_meta.json")
+PARQUET_COMPRESSION = "zstd"
+CSV_COMPRESSION = {"gzip": ".gz", "zstd": ".zst"}
+
+
+@lru_cache(maxsize=None)
+def _have_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        print("[warn] pyarrow not installed; falling back to CSV for interim files")
+        return False
+    return True
+
+
+def active_format() -> str:
+    fmt = os.environ.get("VINYL_INTERIM_FORMAT", "parquet").strip().lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"VINYL_INTERIM_FORMAT must be one of {sorted(FORMATS)}, got {fmt!r}")
+    if fmt == "parquet" and not _have_pyarrow():
+        return "csv"
+    return fmt
+
+
+def format_of(path: Path) -> str:
+    return "parquet" if Path(path).suffix == ".parquet" else "csv"
+
+
+def _uncompressed(path: Path) -> Path:
+    path = Path(path)
+    return path.with_suffix("") if path.suffix in CSV_COMPRESSION.values() else path
+
+
+def table_name(path: Path) -> str:
+    """Artifact name without its format (and compression) suffix."""
+    return _uncompressed(path).stem
+
+
+def target(path: Path, fmt: str | None = None) -> Path:
+    """Path for writing `path` in `fmt` (default: the active format)."""
+    return _uncompressed(path).with_suffix(FORMATS[fmt or active_format()])
+
+
+def resolve(path: Path) -> Path:
+    """Existing file for `path`, preferring the active format; the preferred path if none exists."""
+    preferred = target(path)
+    if preferred.exists():
+        return preferred
+    base = _uncompressed(path)
+    others = [base.with_suffix(ext) for ext in FORMATS.values()]
+    compressed = [base.with_suffix(".csv" + ext) for ext in CSV_COMPRESSION.values()]
+    for alt in (compressed + others if preferred.suffix == ".csv" else others + compressed):
+        if alt.exists():
+            return alt
+    return preferred
+
+
+def columns(path: Path) -> list[str]:
+    """Column names without reading any rows."""
+    p = resolve(path)
+    if format_of(p) == "parquet":
+        import pyarrow.parquet as pq
+        return list(pq.read_schema(p).names)
+    return pd.read_csv(p, nrows=0).columns.tolist()
+
+
+def read_table(path: Path, columns: list[str] | None = None, dtype=None, **csv_kwargs) -> pd.DataFrame:
+    """
+    Read an artifact, loading only `columns` when given.
+    `dtype` is applied on both formats; extra kwargs only apply to CSV.
+    """
+    p = resolve(path)
+    if not p.exists():
+        raise FileNotFoundError(f"Missing {p}")
+    if format_of(p) == "csv":
+        return pd.read_csv(p, usecols=columns, dtype=dtype, **csv_kwargs)
+
+    df = pd.read_parquet(p, columns=columns)
+    if dtype is str or dtype == "string":
+        df = df.astype("string")
+    elif isinstance(dtype, dict):
+        df = df.astype({c: t for c, t in dtype.items() if c in df.columns})
+    elif dtype is not None:
+        df = df.astype(dtype)
+    return df
+
+
+def write_table(df: pd.DataFrame, path: Path, fmt: str | None = None) -> Path:
+    """Write `df` in `fmt` (default: the active format) and return the real path."""
+    p = target(path, fmt)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    if format_of(p) == "parquet":
+        df.to_parquet(p, index=False, compression=PARQUET_COMPRESSION)
+    else:
+        df.to_csv(p, index=False)
+    return p
+
+
+class TableWriter:
+    """
+    Append DataFrame chunks to one artifact without holding them all in memory.
+    The first chunk fixes the columns (and, for Parquet, the schema); later
+    chunks must match it. Use as a context manager.
+    """
+
+    def __init__(self, path: Path, fmt: str | None = None):
+        self.path = target(path, fmt)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.rows = 0
+        self._started = False
+        self._parquet = None
+
+    def write(self, df: pd.DataFrame) -> None:
+        if format_of(self.path) == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            if self._parquet is None:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                self._parquet = pq.ParquetWriter(self.path, table.schema, compression=PARQUET_COMPRESSION)
+            else:
+                table = pa.Table.from_pandas(df, schema=self._parquet.schema, preserve_index=False)
+            self._parquet.write_table(table)
+        else:
+            df.to_csv(self.path, mode="a" if self._started else "w", header=not self._started, index=False)
+        self._started = True
+        self.rows += len(df)
+
+    def close(self) -> None:
+        if self._parquet is not None:
+            self._parquet.close()
+            self._parquet = None
+
+    def __enter__(self) -> "TableWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def direct_tables(manifest: Path = EXPORT_MANIFEST) -> dict[str, str]:
+    """
+    Raw table -> warehouse table for the Pitchfork tables the last export copied
+    into the warehouse (mode "direct"); empty when it wrote interim files.
+    """
+    path = Path(manifest)
+    if not path.exists():
+        return {}
+    meta = json.loads(path.read_text(encoding="utf-8"))
+    if meta.get("mode") != "direct":
+        return {}
+    return {t: entry["table"] for t, entry in meta.get("tables", {}).items()}
+
+
+def sql_ready(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Make typed frames load into SQLite the way their CSV round trip did:
+    float32 -> float64 via the shortest repr (9.3 stays 9.3), and date-only
+    datetimes -> 'YYYY-MM-DD' text.
+    """
+    df = df.copy()
+    for c in df.columns:
+        s = df[c]
+        if s.dtype == "float32":
+            df[c] = s.astype(str).astype("float64")
+        elif pd.api.types.is_datetime64_any_dtype(s):
+            if (s.dropna() == s.dropna().dt.normalize()).all():
+                df[c] = s.dt.strftime("%Y-%m-%d")
+            else:
+                df[c] = s.dt.strftime("%Y-%m-%d %H:%M:%S")
+    return df
@@ -3,23 +3,193 @@ from pathlib import Path
 import sqlite3
 import pandas as pd
 
-DB = Path("data/processed/vinyl_dw.sqlite")
+import artist_search
+import instrument
+import interim_io
+import name_norm
+import quality
+import warehouse
+
+DB = warehouse.db_path(Path("data/processed/vinyl_dw.sqlite"))
 MAP = Path("data/processed/artist_map.csv")
 
+# Integer-keyed star schema over the text staging tables. dim_artist (built above
+# it) supplies artist_key; Spotify artists get their own dimension so tracks and
+# mapped names share one key. Per-artist streaming figures come from the rollup
+# clean_spotify_youtube.py writes, not from re-aggregating the tracks.
+FACTS_SQL = """
+DROP TABLE IF EXISTS fact_review_artist;
+DROP TABLE IF EXISTS fact_track;
+DROP TABLE IF EXISTS fact_artist_streams;
+DROP TABLE IF EXISTS dim_spotify_artist;
+
+CREATE TABLE dim_spotify_artist (
+  spotify_artist_key  INTEGER PRIMARY KEY,
+  artist              TEXT NOT NULL UNIQUE
+) STRICT;
+
+INSERT INTO dim_spotify_artist (artist)
+SELECT artist FROM (
+  SELECT artist FROM spotify_youtube_clean WHERE artist IS NOT NULL
+  UNION
+  SELECT artist_spotify FROM dim_artist WHERE artist_spotify IS NOT NULL
+)
+ORDER BY artist;
+
+UPDATE dim_artist
+SET spotify_artist_key = (
+  SELECT dsa.spotify_artist_key FROM dim_spotify_artist AS dsa WHERE dsa.artist = dim_artist.artist_spotify
+)
+WHERE artist_spotify IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS ix_dim_artist_spotify_key ON dim_artist(spotify_artist_key);
+
+-- One row per (review, artist); the reverse index serves artist -> reviews lookups
+CREATE TABLE fact_review_artist (
+  reviewid    INTEGER NOT NULL,
+  artist_key  INTEGER NOT NULL REFERENCES dim_artist(artist_key),
+  PRIMARY KEY (reviewid, artist_key)
+) STRICT, WITHOUT ROWID;
+
+INSERT OR IGNORE INTO fact_review_artist (reviewid, artist_key)
+SELECT pra.reviewid, bk.artist_key
+FROM pitchfork_review_artists AS pra
+JOIN temp.bridge_keys AS bk ON bk.artist = pra.artist
+WHERE pra.reviewid IS NOT NULL
+ORDER BY pra.reviewid, bk.artist_key;
+
+CREATE INDEX ix_fact_review_artist_key ON fact_review_artist(artist_key, reviewid);
+
+CREATE TABLE fact_track (
+  track_key           INTEGER PRIMARY KEY,
+  spotify_artist_key  INTEGER REFERENCES dim_spotify_artist(spotify_artist_key),
+  song                TEXT,
+  danceability        REAL,
+  energy              REAL,
+  loudness            REAL,
+  valence             REAL,
+  yt_views            REAL,
+  yt_likes            REAL,
+  yt_comments         REAL,
+  streams             REAL
+) STRICT;
+
+INSERT INTO fact_track (spotify_artist_key, song, danceability, energy, loudness, valence,
+                        yt_views, yt_likes, yt_comments, streams)
+SELECT dsa.spotify_artist_key, s.song, s.danceability, s.energy, s.loudness, s.valence,
+       s.yt_views, s.yt_likes, s.yt_comments, s.streams
+FROM spotify_youtube_clean AS s
+LEFT JOIN dim_spotify_artist AS dsa ON dsa.artist = s.artist
+ORDER BY s.rowid;
+
+CREATE INDEX ix_fact_track_artist ON fact_track(spotify_artist_key);
+
+-- One row per Spotify artist with tracks: the figures of vw_artist_streams
+CREATE TABLE fact_artist_streams (
+  spotify_artist_key      INTEGER PRIMARY KEY REFERENCES dim_spotify_artist(spotify_artist_key),
+  track_count             INTEGER NOT NULL,
+  total_streams           REAL,
+  avg_streams_per_track   REAL,
+  total_yt_views          REAL,
+  avg_yt_views_per_track  REAL,
+  total_yt_likes          REAL,
+  total_yt_comments       REAL,
+  avg_danceability        REAL,
+  avg_energy              REAL,
+  avg_valence             REAL
+) STRICT;
+
+INSERT INTO fact_artist_streams
+SELECT dsa.spotify_artist_key, r.track_count, r.total_streams, r.avg_streams_per_track,
+       r.total_yt_views, r.avg_yt_views_per_track, r.total_yt_likes, r.total_yt_comments,
+       r.avg_danceability, r.avg_energy, r.avg_valence
+FROM spotify_artist_rollup AS r
+JOIN dim_spotify_artist AS dsa ON dsa.artist = r.artist
+ORDER BY dsa.spotify_artist_key;
+"""
+
+
+def build_bridge_keys(con: sqlite3.Connection, scope: str | None = None) -> int:
+    """
+    Fill temp.bridge_keys with an artist_key for every bridge artist (only those
+    credited on the reviewids in the `scope` table, if given). Names missing from
+    dim_artist (e.g. filtered out before matching) reuse the key of their
+    normalized form, or are added as unmapped members. Returns rows added.
+    """
+    in_scope = f"AND reviewid IN (SELECT reviewid FROM {scope})" if scope else ""
+    con.execute("DROP TABLE IF EXISTS temp.bridge_keys")
+    con.execute("CREATE TEMP TABLE bridge_keys (artist TEXT PRIMARY KEY, artist_key INTEGER NOT NULL) WITHOUT ROWID")
+    con.execute(f"""
+        INSERT INTO temp.bridge_keys
+        SELECT pra.artist, MIN(da.artist_key)
+        FROM (SELECT DISTINCT artist FROM pitchfork_review_artists WHERE artist IS NOT NULL {in_scope}) AS pra
+        JOIN dim_artist AS da ON da.artist = pra.artist
+        GROUP BY pra.artist
+    """)
+    missing = con.execute(f"""
+        SELECT artist, COUNT(*) FROM pitchfork_review_artists
+        WHERE artist IS NOT NULL AND TRIM(artist) <> ''
+          AND artist NOT IN (SELECT artist FROM temp.bridge_keys) {in_scope}
+        GROUP BY artist
+        ORDER BY artist
+    """).fetchall()
+
+    added = 0
+    norms = name_norm.normalize([a for a, _ in missing], "universe")
+    for (artist, n), norm in zip(missing, norms):
+        norm = norm or artist.strip().casefold()
+        row = con.execute("SELECT artist_key FROM dim_artist WHERE artist_norm = ?", (norm,)).fetchone()
+        if row is None:
+            row = (con.execute("INSERT INTO dim_artist (artist, artist_norm, n_reviews) VALUES (?, ?, ?)",
+                               (artist, norm, n)).lastrowid,)
+            added += 1
+        con.execute("INSERT INTO temp.bridge_keys VALUES (?, ?)", (artist, row[0]))
+    return added
+
+
+def sync_fact_review_artist(con: sqlite3.Connection, scope: str) -> tuple[int, int, int]:
+    """
+    Bring fact_review_artist in line with the bridge for the reviewids in the
+    `scope` table, after the bridge was written in place: stale (review, artist)
+    rows are deleted and new ones inserted, keyed through dim_artist as in a full
+    build. Runs in the caller's transaction. Returns (inserted, deleted, dim_artist rows added).
+    """
+    n_unmapped = build_bridge_keys(con, scope)
+    con.execute("DROP TABLE IF EXISTS temp.fact_review_artist_batch")
+    con.execute(f"""
+        CREATE TEMP TABLE fact_review_artist_batch AS
+        SELECT DISTINCT pra.reviewid, bk.artist_key
+        FROM pitchfork_review_artists AS pra
+        JOIN temp.bridge_keys AS bk ON bk.artist = pra.artist
+        WHERE pra.reviewid IN (SELECT reviewid FROM {scope})
+    """)
+    deleted = con.execute(f"""
+        DELETE FROM fact_review_artist
+        WHERE reviewid IN (SELECT reviewid FROM {scope})
+          AND (reviewid, artist_key) NOT IN (SELECT reviewid, artist_key FROM temp.fact_review_artist_batch)
+    """).rowcount
+    inserted = con.execute("""
+        INSERT OR IGNORE INTO fact_review_artist (reviewid, artist_key)
+        SELECT reviewid, artist_key FROM temp.fact_review_artist_batch
+        ORDER BY reviewid, artist_key
+    """).rowcount
+    return inserted, deleted, n_unmapped
+
 def main():
+    st = instrument.start("load_dim_artist")
     if not DB.exists():
         raise FileNotFoundError(f"Missing warehouse DB: {DB}")
-    if not MAP.exists():
-        raise FileNotFoundError(f"Missing artist map CSV: {MAP}")
-
-    df = pd.read_csv(MAP)
+    if not interim_io.resolve(MAP).exists():
+        raise FileNotFoundError(f"Missing artist map: {interim_io.resolve(MAP)}")
 
-    # Keep only columns we intend to publish into the dim table
+    # Read only the columns we intend to publish into the dim table
     keep = [
         "artist", "artist_norm", "n_reviews",
         "artist_spotify", "match_type", "score", "spotify_artist_id"
     ]
-    df = df[[c for c in keep if c in df.columns]].copy()
+    available = interim_io.columns(MAP)
+    df = interim_io.read_table(MAP, columns=[c for c in keep if c in available])
+    st.lap("read_map", rows_out=len(df))
 
     # Basic hygiene
     df["artist"] = df["artist"].astype(str)
@@ -43,24 +213,30 @@ def main():
 
     con = sqlite3.connect(DB)
     try:
+        if not con.execute("SELECT 1 FROM sqlite_master WHERE name = 'spotify_artist_rollup'").fetchone():
+            raise RuntimeError("Missing table spotify_artist_rollup (fact_artist_streams is built from it); "
+                               "run clean_spotify_youtube.py and stage_to_sqlite.py first")
+
         # Stage into a temp table first
         df.to_sql("dim_artist_stage", con, if_exists="replace", index=False)
+        st.lap("stage", rows_out=len(df))
 
         # Build the final constrained table. If multiple rows share artist_norm,
         # keep the best by score desc, then n_reviews desc.
-        con.executescript("""
+        st.sql_script(con, "build_dim_artist", """
         DROP TABLE IF EXISTS dim_artist;
 
         CREATE TABLE dim_artist (
-          artist_key        INTEGER PRIMARY KEY AUTOINCREMENT,
-          artist            TEXT NOT NULL,
-          artist_norm       TEXT NOT NULL UNIQUE,
-          n_reviews         INTEGER,
-          artist_spotify    TEXT,
-          match_type        TEXT,
-          score             REAL,
-          spotify_artist_id TEXT
-        );
+          artist_key         INTEGER PRIMARY KEY AUTOINCREMENT,
+          artist             TEXT NOT NULL,
+          artist_norm        TEXT NOT NULL UNIQUE,
+          n_reviews          INTEGER,
+          artist_spotify     TEXT,
+          match_type         TEXT,
+          score              REAL,
+          spotify_artist_id  TEXT,
+          spotify_artist_key INTEGER
+        ) STRICT;
 
         INSERT INTO dim_artist (artist, artist_norm, n_reviews, artist_spotify, match_type, score, spotify_artist_id)
         WITH ranked AS (
@@ -80,54 +256,39 @@ def main():
         CREATE INDEX IF NOT EXISTS ix_dim_artist_spotify ON dim_artist(artist_spotify);
         """)
 
-        # Coverage stats: how many Pitchfork bridge artists map to a Spotify name
-        cur = con.cursor()
-        total_artists = cur.execute("""
-            SELECT COUNT(DISTINCT artist) FROM pitchfork_review_artists
-        """).fetchone()[0]
-
-        mapped_artists = cur.execute("""
-            SELECT COUNT(DISTINCT pra.artist)
-            FROM pitchfork_review_artists pra
-            JOIN dim_artist da ON da.artist = pra.artist
-            WHERE da.artist_spotify IS NOT NULL
-        """).fetchone()[0]
-
-        exact_mapped = cur.execute("""
-            SELECT COUNT(DISTINCT pra.artist)
-            FROM pitchfork_review_artists pra
-            JOIN dim_artist da ON da.artist = pra.artist
-            WHERE da.match_type = 'exact_norm'
-        """).fetchone()[0]
-
-        fuzzy_mapped = cur.execute("""
-            SELECT COUNT(DISTINCT pra.artist)
-            FROM pitchfork_review_artists pra
-            JOIN dim_artist da ON da.artist = pra.artist
-            WHERE da.match_type = 'jaccard_token'
-        """).fetchone()[0]
-
-        print(f"[ok] dim_artist loaded: {cur.execute('SELECT COUNT(*) FROM dim_artist').fetchone()[0]:,} rows")
-        if total_artists:
-            pct = mapped_artists / total_artists
-            print(f"[coverage] pitchfork artists mapped: {mapped_artists:,}/{total_artists:,} ({pct:.1%})")
-        print(f"[coverage] exact_norm: {exact_mapped:,} | jaccard_token: {fuzzy_mapped:,}")
-
-        # Quick sanity: uniqueness and nulls
-        dup_norms = cur.execute("""
-            SELECT COUNT(*) FROM (
-              SELECT artist_norm, COUNT(*) c FROM dim_artist GROUP BY artist_norm HAVING c > 1
-            )
-        """).fetchone()[0]
-        null_norms = cur.execute("""
-            SELECT COUNT(*) FROM dim_artist WHERE artist_norm IS NULL OR TRIM(artist_norm)=''
-        """).fetchone()[0]
-
-        if dup_norms != 0:
-            raise RuntimeError(f"Duplicate artist_norm keys in dim_artist: {dup_norms}")
-        if null_norms != 0:
-            raise RuntimeError(f"Null/blank artist_norm in dim_artist: {null_norms}")
+        # Every bridge artist needs a key; the ones the matcher never saw become unmapped members
+        n_unmapped = build_bridge_keys(con)
+        st.sql_script(con, "build_facts", FACTS_SQL)
+        n_fact_ra = con.execute("SELECT COUNT(*) FROM fact_review_artist").fetchone()[0]
+        n_fact_tr = con.execute("SELECT COUNT(*) FROM fact_track").fetchone()[0]
+        n_fact_as = con.execute("SELECT COUNT(*) FROM fact_artist_streams").fetchone()[0]
+        st.lap("build_facts", rows_out=n_fact_ra + n_fact_tr + n_fact_as)
+        print(f"[ok] fact_review_artist: {n_fact_ra:,} rows | fact_track: {n_fact_tr:,} rows "
+              f"| fact_artist_streams: {n_fact_as:,} rows "
+              f"| {n_unmapped:,} unmapped bridge artists added to dim_artist")
+
+        # Coverage of the bridge artists plus dim_artist key checks, one pass per table
+        results = {r.name: r for r in quality.run(DB, quality.DIM_ARTIST_CHECKS)}
+        st.lap("checks")
+        quality.report(results.values(), st)
+
+        n_dim = results["rows:dim_artist"].value
+        st.rows(rows_in=len(df), rows_out=n_dim)
+        print(f"[ok] dim_artist loaded: {n_dim:,} rows")
+        mapped = results["coverage:mapped"]
+        if mapped.detail["total"]:
+            print(f"[coverage] pitchfork artists mapped: {mapped.detail['matched']:,}/{mapped.detail['total']:,} "
+                  f"({mapped.value:.1%})")
+        print("[coverage] " + " | ".join(f"{m}: {results[f'coverage:{m}'].detail['matched']:,}"
+                                         for m in ("exact_norm", "jaccard_token", "tfidf_ngram")))
+
+        failed = quality.failures(results.values())
+        if failed:
+            raise RuntimeError("dim_artist checks failed: " + "; ".join(
+                f"{r.name} ({quality.describe(r)})" for r in failed))
 
+        added, removed = artist_search.refresh(con, ["artist_spotify"])["artist_spotify"]
+        print(f"[ok] artist_search index: +{added:,} / -{removed:,} mapped Spotify names")
         con.commit()
     finally:
         con.close()
@@ -1,34 +1,88 @@
+# scripts/load_reviews_and_bridge.py
+"""
+Load the typed reviews and the review-artist bridge into the warehouse.
+
+Full load (default): replace pitchfork_reviews and pitchfork_review_artists
+from the interim files and build their indexes.
+
+Incremental load (--incremental): stage the batch in temp tables, upsert the
+reviews on reviewid (rows whose values didn't change are left alone) and
+merge-diff the bridge per reviewid: credits missing from the batch are deleted,
+new ones inserted. fact_review_artist (once load_dim_artist.py has built it) is
+diffed for the same reviewids in the same transaction. Tables, indexes and
+change-capture triggers stay in place, so refresh_marts.py picks up exactly the
+rows written; the tables written get new dw_build fingerprints
+(warehouse.restamp), so snapshots exported before the load read as stale and
+run_pipeline.py reruns the stages that read them. With --keys (the JSON
+from verify_manifest.py --changed-keys) only those reviewids are loaded, and
+the ones no longer in the batch are deleted. The reviewids and artists touched
+are written to --touched for downstream consumers.
+
+Usage:
+  python scripts/load_reviews_and_bridge.py
+  python scripts/load_reviews_and_bridge.py --incremental --reviews new_reviews.csv --bridge new_bridge.csv
+  python scripts/load_reviews_and_bridge.py --incremental --keys changed_keys.json
+"""
+from __future__ import annotations
+
+from datetime import datetime, timezone
 from pathlib import Path
+import argparse
+import json
 import sqlite3
+import sys
+import time
+
 import pandas as pd
 
-DB = Path("data/processed/vinyl_dw.sqlite")
+import artist_search
+import instrument
+import interim_io
+import load_dim_artist
+import merkle
+import quality
+import warehouse
+
+DB = warehouse.db_path(Path("data/processed/vinyl_dw.sqlite"))
 REV = Path("data/interim/pitchfork_reviews_typed.csv")
 BRIDGE = Path("data/interim/pitchfork_review_artists.csv")
+TOUCHED = Path("data/interim/load_reviews_touched.json")
 
-def create_index(conn, table, index_name, columns_or_expr):
+def create_index(conn, table, index_name, columns_or_expr, unique=False):
     cur = conn.execute(f"PRAGMA table_info({table});")
     cols = {r[1] for r in cur.fetchall()}
     needed_cols = {c for c in columns_or_expr.replace("LOWER(", "").replace(")", "").split(",") if c.isidentifier()}
     if needed_cols.issubset(cols):
-        conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table}({columns_or_expr});")
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        conn.execute(f"CREATE {kind} IF NOT EXISTS {index_name} ON {table}({columns_or_expr});")
+
+def read_reviews(path: Path) -> pd.DataFrame:
+    df_rev = interim_io.read_table(path, parse_dates=["pub_date"])
+    df_rev["pub_date"] = pd.to_datetime(df_rev["pub_date"]).dt.strftime("%Y-%m-%d")
+    # The dump lists a few reviews twice; reviewid is the key, so a later row supersedes earlier ones
+    n = len(df_rev)
+    df_rev = df_rev.drop_duplicates("reviewid", keep="last")
+    if len(df_rev) < n:
+        print(f"[info] dropped {n - len(df_rev):,} duplicate reviewid row(s)")
+    return interim_io.sql_ready(df_rev)
 
-with sqlite3.connect(DB) as con:
-    con.execute("PRAGMA journal_mode=WAL;")
-    con.execute("PRAGMA synchronous=NORMAL;")
-    con.execute("PRAGMA foreign_keys=ON;")
+def read_bridge(path: Path) -> pd.DataFrame:
+    return interim_io.read_table(path)
 
-    df_rev = pd.read_csv(REV, parse_dates=["pub_date"])
-    df_rev["pub_date"] = df_rev["pub_date"].dt.strftime("%Y-%m-%d")
+def full_load(con: sqlite3.Connection, st) -> None:
+    df_rev = read_reviews(REV)
     df_rev.to_sql("pitchfork_reviews", con, if_exists="replace", index=False)
+    st.lap("load_reviews", rows_out=len(df_rev))
     print(f"[ok] loaded pitchfork_reviews ({len(df_rev):,} rows)")
 
-    df_bridge = pd.read_csv(BRIDGE)
+    df_bridge = read_bridge(BRIDGE)
     df_bridge.to_sql("pitchfork_review_artists", con, if_exists="replace", index=False)
+    st.lap("load_bridge", rows_out=len(df_bridge))
+    st.rows(rows_in=len(df_rev) + len(df_bridge), rows_out=len(df_rev) + len(df_bridge))
     print(f"[ok] loaded pitchfork_review_artists ({len(df_bridge):,} rows)")
 
-    # Indexes (created only if columns exist)
-    create_index(con, "pitchfork_reviews", "ix_reviews_reviewid", "reviewid")
+    # Indexes (created only if columns exist); the unique reviewid index is what --incremental upserts on
+    create_index(con, "pitchfork_reviews", "ix_reviews_reviewid", "reviewid", unique=True)
     create_index(con, "pitchfork_reviews", "ix_reviews_pub_date", "pub_date")
     create_index(con, "pitchfork_reviews", "ix_reviews_pub_year_month", "pub_year,pub_month")
     create_index(con, "pitchfork_reviews", "ix_reviews_bnm", "best_new_music")
@@ -36,32 +90,22 @@ with sqlite3.connect(DB) as con:
     create_index(con, "pitchfork_review_artists", "ix_bridge_artist", "artist")
     create_index(con, "pitchfork_review_artists", "ix_bridge_artist_lower", "LOWER(artist)")
     con.commit()
+    st.lap("indexes")
     print("[ok] indexes ensured")
 
-    # Verifications
-    cur = con.cursor()
-    cur.execute("SELECT COUNT(*) FROM pitchfork_review_artists;")
-    print(f"[check] bridge rows: {cur.fetchone()[0]:,}")
-
-    cur.execute("""
-        SELECT COUNT(*) FROM (
-          SELECT reviewid, artist, COUNT(*) c
-          FROM pitchfork_review_artists
-          GROUP BY reviewid, artist
-          HAVING c > 1
-        );
-    """)
-    print(f"[check] duplicate (reviewid, artist) pairs: {cur.fetchone()[0]}")
+    added, removed = artist_search.refresh(con, ["pitchfork"])["pitchfork"]
+    con.commit()
+    st.lap("artist_search", rows_out=added + removed)
+    print(f"[ok] artist_search index: +{added:,} / -{removed:,} pitchfork names")
 
-    cur.execute("""
-        SELECT COUNT(*)
-        FROM pitchfork_review_artists pra
-        LEFT JOIN pitchfork_reviews pr ON pr.reviewid = pra.reviewid
-        WHERE pr.reviewid IS NULL;
-    """)
-    print(f"[check] orphans (no matching review): {cur.fetchone()[0]}")
+    # Verifications: one pass per table (quality.REVIEW_CHECKS)
+    results = quality.run(DB, quality.REVIEW_CHECKS)
+    st.lap("checks")
+    quality.report(results, st)
+    if quality.failures(results):
+        raise RuntimeError(f"{len(quality.failures(results))} review check(s) failed")
 
-    cur.execute("""
+    top = st.sql(con, "top_artists", """
         SELECT artist, COUNT(*) AS n
         FROM pitchfork_review_artists
         GROUP BY artist
@@ -69,5 +113,185 @@ with sqlite3.connect(DB) as con:
         LIMIT 10;
     """)
     print("[sample] top artists by review count:")
-    for artist, n in cur.fetchall():
+    for artist, n in top:
         print(f"  {n:>5}  {artist}")
+
+def has_unique_reviewid(con: sqlite3.Connection) -> bool:
+    for _, name, unique, *_ in con.execute("PRAGMA index_list(pitchfork_reviews)"):
+        cols = [r[2] for r in con.execute(f'PRAGMA index_info("{name}")')]
+        if unique and cols == ["reviewid"]:
+            return True
+    return False
+
+def stage_batch(con: sqlite3.Connection, table: str, temp: str, df: pd.DataFrame) -> list[str]:
+    """Copy `df` into temp.<temp>, typed like `table`. Returns the columns staged."""
+    table_cols = [r[1] for r in con.execute(f"PRAGMA table_info({table})")]
+    extra = [c for c in df.columns if c not in table_cols]
+    if extra:
+        sys.exit(f"[fail] batch has columns {extra} that {table} lacks; run a full load")
+    cols = [c for c in table_cols if c in df.columns]
+    con.execute(f"DROP TABLE IF EXISTS temp.{temp}")
+    con.execute(f"CREATE TEMP TABLE {temp} AS SELECT {', '.join(cols)} FROM {table} LIMIT 0")
+    con.executemany(f"INSERT INTO temp.{temp} VALUES ({', '.join('?' * len(cols))})",
+                    df[cols].to_numpy(dtype=object, na_value=None).tolist())
+    return cols
+
+def incremental_load(con: sqlite3.Connection, st, reviews: Path, bridge: Path, keys: list | None) -> dict:
+    """Upsert a batch of reviews and diff their bridge rows; returns what was touched."""
+    if not has_unique_reviewid(con):
+        sys.exit("[fail] pitchfork_reviews has no unique reviewid index; run a full load first")
+
+    df_rev, df_bridge = read_reviews(reviews), read_bridge(bridge)
+    scope = set(keys) if keys is not None else set(df_rev["reviewid"])
+    df_rev = df_rev[df_rev["reviewid"].isin(scope)]
+    # Credits only count for reviews in the batch; a review deleted here loses all of its credits
+    df_bridge = df_bridge[df_bridge["reviewid"].isin(df_rev["reviewid"])].drop_duplicates()
+    st.lap("read_batch", rows_out=len(df_rev) + len(df_bridge))
+
+    con.execute("BEGIN")
+    try:
+        con.execute("DROP TABLE IF EXISTS temp.load_scope")
+        con.execute("CREATE TEMP TABLE load_scope (reviewid INTEGER PRIMARY KEY)")
+        con.executemany("INSERT INTO temp.load_scope VALUES (?)", [(int(k),) for k in scope])
+        rev_cols = stage_batch(con, "pitchfork_reviews", "batch_reviews", df_rev)
+        br_cols = stage_batch(con, "pitchfork_review_artists", "batch_bridge", df_bridge)
+        con.execute("CREATE INDEX temp.ix_batch_bridge ON batch_bridge(reviewid)")
+
+        values = [c for c in rev_cols if c != "reviewid"]
+        upserted = con.execute(f"""
+            INSERT INTO pitchfork_reviews ({', '.join(rev_cols)})
+            SELECT {', '.join(rev_cols)} FROM temp.batch_reviews WHERE true
+            ON CONFLICT(reviewid) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in values)}
+            WHERE ({', '.join(values)}) IS NOT ({', '.join(f'excluded.{c}' for c in values)})
+            RETURNING reviewid
+        """).fetchall()
+        deleted = con.execute("""
+            DELETE FROM pitchfork_reviews
+            WHERE reviewid IN (SELECT reviewid FROM temp.load_scope)
+              AND reviewid NOT IN (SELECT reviewid FROM temp.batch_reviews)
+            RETURNING reviewid
+        """).fetchall()
+        st.lap("upsert_reviews", rows_out=len(upserted) + len(deleted))
+
+        same = " AND ".join(f"b.{c} IS p.{c}" for c in br_cols)
+        credits_out = con.execute(f"""
+            DELETE FROM pitchfork_review_artists AS p
+            WHERE reviewid IN (SELECT reviewid FROM temp.load_scope)
+              AND NOT EXISTS (SELECT 1 FROM temp.batch_bridge AS b WHERE {same})
+            RETURNING reviewid, artist
+        """).fetchall()
+        credits_in = con.execute(f"""
+            INSERT INTO pitchfork_review_artists ({', '.join(br_cols)})
+            SELECT {', '.join(br_cols)} FROM temp.batch_bridge AS b
+            WHERE NOT EXISTS (SELECT 1 FROM pitchfork_review_artists AS p WHERE {same})
+            RETURNING reviewid, artist
+        """).fetchall()
+        st.lap("merge_bridge", rows_out=len(credits_out) + len(credits_in))
+
+        reviewids = {r for r, in upserted + deleted} | {r for r, _ in credits_out + credits_in}
+        con.execute("DROP TABLE IF EXISTS temp.load_touched")
+        con.execute("CREATE TEMP TABLE load_touched (reviewid INTEGER PRIMARY KEY)")
+        con.executemany("INSERT INTO temp.load_touched VALUES (?)", [(r,) for r in reviewids])
+        artists = {a for _, a in credits_out + credits_in} | {a for a, in con.execute("""
+            SELECT DISTINCT artist FROM pitchfork_review_artists
+            WHERE reviewid IN (SELECT reviewid FROM temp.load_touched)
+        """)}
+        artists.discard(None)
+
+        added, removed = artist_search.refresh_names(con, "pitchfork", {a for _, a in credits_out + credits_in})
+
+        # Keep the review-artist facts in step; the marts' triggers log the rows written
+        fact_in = fact_out = n_unmapped = 0
+        has_facts = con.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'fact_review_artist'").fetchone()
+        if has_facts:
+            fact_in, fact_out, n_unmapped = load_dim_artist.sync_fact_review_artist(con, "temp.load_touched")
+            st.lap("fact_review_artist", rows_out=fact_in + fact_out)
+
+        written = [t for t, n in (("pitchfork_reviews", len(upserted) + len(deleted)),
+                                  ("pitchfork_review_artists", len(credits_in) + len(credits_out)),
+                                  ("artist_search", added + removed),
+                                  ("fact_review_artist", fact_in + fact_out),
+                                  ("dim_artist", n_unmapped)) if n]
+        warehouse.restamp(con, written, f"load_reviews --incremental {datetime.now(tz=timezone.utc).isoformat()}")
+        con.execute("COMMIT")
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+    st.lap("artist_search", rows_out=added + removed)
+
+    print(f"[ok] pitchfork_reviews: {len(upserted):,} upserted, {len(deleted):,} deleted "
+          f"({len(df_rev):,} in batch)")
+    print(f"[ok] pitchfork_review_artists: +{len(credits_in):,} / -{len(credits_out):,} credits")
+    print(f"[ok] artist_search index: +{added:,} / -{removed:,} pitchfork names")
+    if has_facts:
+        print(f"[ok] fact_review_artist: +{fact_in:,} / -{fact_out:,} rows "
+              f"| {n_unmapped:,} unmapped bridge artists added to dim_artist")
+    if written:
+        print(f"[info] restamped in dw_build: {', '.join(written)}")
+
+    orphans = st.sql(con, "bridge_orphans", """
+        SELECT COUNT(*)
+        FROM pitchfork_review_artists pra
+        LEFT JOIN pitchfork_reviews pr ON pr.reviewid = pra.reviewid
+        WHERE pra.reviewid IN (SELECT reviewid FROM temp.load_touched) AND pr.reviewid IS NULL;
+    """)[0][0]
+    print(f"[check] orphans among touched reviews: {orphans}")
+
+    n_in = len(df_rev) + len(df_bridge)
+    st.rows(rows_in=n_in, rows_out=len(upserted) + len(deleted) + len(credits_in) + len(credits_out))
+    return {
+        "key": merkle.KEY,
+        "reviewids": sorted(reviewids),
+        "artists": sorted(artists),
+        "reviews": {"upserted": len(upserted), "deleted": len(deleted)},
+        "bridge": {"inserted": len(credits_in), "deleted": len(credits_out)},
+        "fact_review_artist": {"inserted": fact_in, "deleted": fact_out},
+    }
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Load pitchfork_reviews and pitchfork_review_artists.")
+    ap.add_argument("--incremental", action="store_true",
+                    help="upsert the batch into the existing tables instead of replacing them")
+    ap.add_argument("--reviews", type=Path, default=REV, help="typed reviews batch (incremental)")
+    ap.add_argument("--bridge", type=Path, default=BRIDGE, help="review-artist batch (incremental)")
+    ap.add_argument("--keys", type=Path, metavar="CHANGED_KEYS_JSON",
+                    help="incremental: only these reviewids (verify_manifest.py --changed-keys)")
+    ap.add_argument("--touched", type=Path, default=TOUCHED,
+                    help="incremental: where to write the reviewids and artists touched")
+    args = ap.parse_args()
+    if args.keys and not args.incremental:
+        ap.error("--keys needs --incremental")
+    st = instrument.start("load_reviews_and_bridge")
+
+    if not args.incremental:
+        con = sqlite3.connect(DB)
+        try:
+            con.execute("PRAGMA journal_mode=WAL;")
+            con.execute("PRAGMA synchronous=NORMAL;")
+            con.execute("PRAGMA foreign_keys=ON;")
+            full_load(con, st)
+        finally:
+            con.close()
+        return
+
+    keys = None
+    if args.keys:
+        changed = json.loads(args.keys.read_text(encoding="utf-8"))
+        keys = [k for k in changed["reviewids"] if k is not None]
+    t0 = time.perf_counter()
+    con = sqlite3.connect(DB, isolation_level=None)
+    try:
+        con.execute("PRAGMA journal_mode=WAL;")
+        con.execute("PRAGMA synchronous=NORMAL;")
+        con.execute("PRAGMA foreign_keys=ON;")
+        touched = incremental_load(con, st, args.reviews, args.bridge, keys)
+    finally:
+        con.close()
+    args.touched.parent.mkdir(parents=True, exist_ok=True)
+    args.touched.write_text(json.dumps(touched, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"[ok] {len(touched['reviewids']):,} reviewid(s) and {len(touched['artists']):,} artist(s) touched "
+          f"in {time.perf_counter() - t0:.2f}s -> {args.touched}")
+
+if __name__ == "__main__":
+    main()
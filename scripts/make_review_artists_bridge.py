@@ -1,49 +1,75 @@
 from pathlib import Path
-import unicodedata
+import numpy as np
 import pandas as pd
 import re
 
+import instrument
+import interim_io
+
 SRC = Path("data/interim/pitchfork_reviews_typed.csv")
 OUT = Path("data/interim/pitchfork_review_artists.csv")
 
 # Split only on true separators; never split inside words like "Islands" or "Hands".
 SEP_RE = re.compile(r"\s*(?:,|&|/|\+|\band\b|\bfeat\.?\b|\bfeaturing\b|\bwith\b)\s*", re.IGNORECASE)
+# Every SEP_RE match contains one of these (same IGNORECASE rules); credits without one aren't split
+SEP_HINT_RE = re.compile(r"[,&/+]|and|feat|with", re.IGNORECASE)
 
 # Allow a few legitimate short names; drop other 1–2 char tokens.
 VALID_SHORT = {"x", "u2", "m", "bj", "om", "vv", "xx"}
 
-def clean_token(s: str) -> str:
-    s = unicodedata.normalize("NFKC", (s or "")).strip()
-    s = re.sub(r"\s+", " ", s)
-    return s
-
-def split_artists(s: str) -> list[str]:
-    s = clean_token(s)
-    if not s:
-        return []
-    parts = [clean_token(p) for p in SEP_RE.split(s) if p]
-    # drop junk tokens like lone "s"
-    parts = [p for p in parts if len(p) > 2 or p.casefold() in VALID_SHORT]
-    return parts
-
-print(f"[info] source: {SRC.resolve()}")
-if not SRC.exists():
-    raise FileNotFoundError(f"Missing {SRC}. Run stage_reviews.py first.")
-
-df = pd.read_csv(SRC, dtype={"reviewid": "int64", "artist": "string"})
-df = df[["reviewid", "artist"]].copy()
-
-df["artist"] = df["artist"].fillna("").map(split_artists)
-df = df.explode("artist").dropna(subset=["artist"])
-df["artist"] = df["artist"].astype(str).str.strip()
-df = df[df["artist"] != ""]
-
-before = len(df)
-df = df.drop_duplicates(["reviewid", "artist"]).reset_index(drop=True)
-
-print(f"[ok] exploded pairs: {before:,} -> after de-dup: {len(df):,}")
-print(f"[ok] example:\n{df.head(5)}")
-
-OUT.parent.mkdir(parents=True, exist_ok=True)
-df.to_csv(OUT, index=False)
-print(f"[ok] wrote bridge -> {OUT.resolve()} ({OUT.stat().st_size:,} bytes)") 
+def clean_tokens(s: pd.Series) -> pd.Series:
+    return s.str.normalize("NFKC").str.strip().str.replace(r"\s+", " ", regex=True)
+
+def split_credits(credits: pd.Series) -> pd.DataFrame:
+    """
+    Split a whole column of credit strings at once: each distinct credit is
+    cleaned and split a single time, then mapped back to its rows.
+    Returns (row, artist) with rows in order and artists in credit order.
+    """
+    codes, uniq = pd.factorize(credits.fillna("").astype(object))
+    uniq = clean_tokens(pd.Series(uniq, dtype=object))
+    multi = uniq.str.contains(SEP_HINT_RE, regex=True)
+    parts = pd.concat([uniq[~multi], uniq[multi].str.split(SEP_RE, regex=True).explode()])
+    parts = clean_tokens(parts.sort_index(kind="stable"))
+    # drop empty and junk tokens like lone "s"
+    parts = parts[(parts.str.len() > 2) | parts.str.casefold().isin(VALID_SHORT)]
+
+    by_credit = pd.DataFrame({"code": parts.index.to_numpy(), "artist": parts.to_numpy()})
+    by_credit["part"] = by_credit.groupby("code").cumcount()   # position within the credit
+    rows = pd.DataFrame({"row": np.arange(len(codes)), "code": codes})
+    pairs = rows.merge(by_credit, on="code", how="inner", sort=False)
+    return pairs.sort_values(["row", "part"], kind="stable")[["row", "artist"]].reset_index(drop=True)
+
+def main():
+    st = instrument.start("make_review_artists_bridge")
+    src = interim_io.resolve(SRC)
+    print(f"[info] source: {src.resolve()}")
+    if not src.exists():
+        raise FileNotFoundError(f"Missing {src}. Run stage_reviews.py first.")
+
+    # Only the two columns the bridge needs are read (projected on Parquet and CSV)
+    df = interim_io.read_table(src, columns=["reviewid", "artist"], dtype={"reviewid": "int64", "artist": "string"})
+    n_reviews = len(df)
+    st.lap("read", rows_out=n_reviews)
+
+    pairs = split_credits(df["artist"])
+    df = pd.DataFrame({
+        "reviewid": df["reviewid"].to_numpy()[pairs["row"].to_numpy()],
+        "artist": pairs["artist"].astype(str).to_numpy(),
+    })
+
+    before = len(df)
+    df = df.drop_duplicates(["reviewid", "artist"]).reset_index(drop=True)
+
+    st.lap("split", rows_in=n_reviews, rows_out=len(df))
+    print(f"[ok] exploded pairs: {before:,} -> after de-dup: {len(df):,}")
+    print(f"[ok] example:\n{df.head(5)}")
+
+    out = interim_io.write_table(df, OUT)
+    st.lap("write", rows_out=len(df))
+    st.rows(rows_in=n_reviews, rows_out=len(df))
+    print(f"[ok] wrote bridge -> {out.resolve()} ({out.stat().st_size:,} bytes)") 
+
+
+if __name__ == "__main__":
+    main()
@@ -1,60 +1,109 @@
 # scripts/match_artists.py
 from pathlib import Path
+import argparse
+import numpy as np
 import pandas as pd
 from rapidfuzz import process, fuzz
 
+import instrument
+import interim_io
+import match_cache
+import name_norm
+from match_guards import name_features, ok_pairs
+
 OUT_MAP = Path("data/overrides/artist_map.csv")
 OUT_REVIEW = Path("data/overrides/artist_review_queue.csv")
-BLOCKLIST = {"various artists", "soundtrack", "original soundtrack", "va", "ost"}
+CUTOFF = 93
+# Key for this matcher's rows in the persistent match cache
+CACHE_MATCHER = "rapidfuzz_wratio"
 
-pitchfork = pd.read_csv("data/interim/pitchfork_artists.csv", dtype=str)
-spotify = pd.read_csv("data/interim/spotify_youtube_clean.csv", dtype=str)
+ap = argparse.ArgumentParser(description="Fuzzy-match Pitchfork artists to Spotify artists.")
+ap.add_argument("--engine", choices=["cdist", "loop"], default="cdist",
+                help="cdist: batched score matrix per chunk (default); loop: one extractOne per name")
+ap.add_argument("--workers", type=int, default=-1,
+                help="threads used by rapidfuzz cdist (-1 = all cores)")
+ap.add_argument("--chunk-size", type=int, default=256,
+                help="Pitchfork names scored per cdist call; memory is chunk_size x n_spotify x 8 bytes")
+ap.add_argument("--no-cache", action="store_true",
+                help=f"ignore and leave untouched the match cache ({match_cache.CACHE_DB})")
+args = ap.parse_args()
+
+st = instrument.start("match_artists")
+pitchfork = interim_io.read_table(Path("data/interim/pitchfork_artists.csv"), columns=["artist"], dtype=str)
+spotify = interim_io.read_table(Path("data/interim/spotify_youtube_clean.csv"), columns=["artist"], dtype=str)
 
 pf_names = (pitchfork["artist"].fillna("").str.strip().str.replace(r"\s+", " ", regex=True))
 sp_names = (spotify["artist"].fillna("").str.strip().str.replace(r"\s+", " ", regex=True))
 pf_names = pf_names[pf_names.ne("")].drop_duplicates().tolist()
 sp_names = pd.Series(sp_names[sp_names.ne("")].drop_duplicates().tolist()).tolist()
 
-def clean(name: str) -> str:
-    name = name.lower().strip()
-    if name.startswith("the "):
-        name = name[4:]
-    return "".join(ch for ch in name if ch.isalnum() or ch.isspace())
+def best_matches(queries: list[str], choices: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """Position of the best choice (-1 if below CUTOFF) and its score, per query."""
+    best_j = np.full(len(queries), -1, dtype=np.int64)
+    best_s = np.zeros(len(queries))
+    if not queries or not choices:
+        return best_j, best_s
+    if args.engine == "loop":
+        for i, q in enumerate(queries):
+            res = process.extractOne(q, choices, scorer=fuzz.WRatio, score_cutoff=CUTOFF)
+            if res is not None:
+                best_j[i], best_s[i] = res[2], res[1]
+        return best_j, best_s
+    for start in range(0, len(queries), args.chunk_size):
+        chunk = queries[start:start + args.chunk_size]
+        # Scores under the cutoff come back as 0; float64 keeps extractOne's tie order
+        m = process.cdist(chunk, choices, scorer=fuzz.WRatio, score_cutoff=CUTOFF,
+                          dtype=np.float64, workers=args.workers)
+        j = m.argmax(axis=1)               # first maximum, same as extractOne
+        s = m[np.arange(len(chunk)), j]
+        hit = s >= CUTOFF
+        best_j[start:start + len(chunk)] = np.where(hit, j, -1)
+        best_s[start:start + len(chunk)] = np.where(hit, s, 0.0)
+    return best_j, best_s
 
-def ok_pair(a_raw: str, b_raw: str, score: int) -> bool:
-    a = a_raw.lower(); b = b_raw.lower()
-    if a in BLOCKLIST or b in BLOCKLIST:
-        return False
-    if a[0] != b[0]:                 # first-letter must match
-        return False
-    la, lb = len(a), len(b)
-    r = (min(la, lb) / max(la, lb)) if max(la, lb) else 0
-    if r < 0.6:                       # avoid crazy length mismatches
-        return False
-    # token overlap (cheap Jaccard on words)
-    ta, tb = set(a.split()), set(b.split())
-    if ta and tb and (len(ta & tb) / len(ta | tb)) < 0.25:
-        # allow short-name exceptions if very high score
-        if score < 95:
-            return False
-    return True
+def score_keys(keys: list[str], choice_pos: list[int]) -> dict[str, tuple[str | None, float]]:
+    """Best Spotify name (raw) and score per clean Pitchfork key, among sp positions `choice_pos`."""
+    best_j, best_s = best_matches(keys, [sp_clean[j] for j in choice_pos])
+    return {k: ((sp_names[choice_pos[j]], float(s)) if j >= 0 else (None, 0.0))
+            for k, j, s in zip(keys, best_j, best_s)}
 
-pf_clean = [clean(x) for x in pf_names]
-sp_clean = [clean(x) for x in sp_names]
+st.lap("read", rows_out=len(pitchfork) + len(spotify))
+pf_clean = name_norm.normalize(pf_names, "fuzzy")
+sp_clean = name_norm.normalize(sp_names, "fuzzy")
+pf_feat, sp_feat = name_features(pf_names), name_features(sp_names)
+sp_pos = {n: j for j, n in enumerate(sp_names)}
 
-CUTOFF = 93
-rows, review = [], []
+keys = list(dict.fromkeys(pf_clean))
+st.lap("prepare", rows_in=len(pf_names) + len(sp_names), rows_out=len(keys))
+if args.no_cache:
+    picks = score_keys(keys, list(range(len(sp_names))))
+else:
+    settings_fp = match_cache.fingerprint({"matcher": CACHE_MATCHER, "scorer": "WRatio", "CUTOFF": CUTOFF,
+                                           "rules": name_norm.rules_version("fuzzy")})
+    con = match_cache.open_cache()
+    try:
+        cached, prev = match_cache.load(con, CACHE_MATCHER, settings_fp, sp_names)
+        full, delta, added = match_cache.plan(keys, sp_names, cached, prev)
+        picks = {k: cached[k] for k in keys if k in cached}
+        picks.update(score_keys(full, list(range(len(sp_names)))))
+        match_cache.merge(picks, score_keys(delta, added), sp_names)   # new candidates vs cached picks
+        print(f"[cache] {CACHE_MATCHER}: reused {len(keys) - len(full):,}, scored {len(full):,} in full, "
+              f"re-checked {len(delta):,} against {len(added):,} new candidates")
+        match_cache.save(con, CACHE_MATCHER, settings_fp, picks, sp_names, cached, prev)
+    finally:
+        con.close()
+
+st.lap("score", rows_in=len(keys), rows_out=sum(c is not None for c, _ in picks.values()))
+pf_idx = np.array([i for i, p in enumerate(pf_clean) if picks[p][0] is not None], dtype=np.int64)
+sp_idx = np.array([sp_pos[picks[pf_clean[i]][0]] for i in pf_idx], dtype=np.int64)
+scores = np.array([int(picks[pf_clean[i]][1]) for i in pf_idx], dtype=np.int64)
 
-for i, p in enumerate(pf_clean):
-    res = process.extractOne(p, sp_clean, scorer=fuzz.WRatio, score_cutoff=CUTOFF)
-    if res is None:
-        continue
-    match_clean, score, j = res
-    a_raw = pf_names[i]; b_raw = sp_names[j]
-    if ok_pair(a_raw, b_raw, int(score)):
-        rows.append((a_raw, b_raw, int(score)))
+rows, review = [], []
+for i, j, s, ok in zip(pf_idx, sp_idx, scores, ok_pairs(pf_feat, sp_feat, pf_idx, sp_idx, scores)):
+    if ok:
+        rows.append((pf_names[i], sp_names[j], int(s)))
     else:
-        review.append((a_raw, b_raw, int(score), pf_clean[i], sp_clean[j]))
+        review.append((pf_names[i], sp_names[j], int(s), pf_clean[i], sp_clean[j]))
 
 df = pd.DataFrame(rows, columns=["pitchfork_artist", "spotify_artist", "score"]).drop_duplicates()
 df_review = pd.DataFrame(review, columns=["pf_artist","sp_artist","score","pf_clean","sp_clean"]).drop_duplicates()
@@ -62,6 +111,8 @@ df_review = pd.DataFrame(review, columns=["pf_artist","sp_artist","score","pf_cl
 OUT_MAP.parent.mkdir(parents=True, exist_ok=True)
 df.to_csv(OUT_MAP, index=False, encoding="utf-8")
 df_review.to_csv(OUT_REVIEW, index=False, encoding="utf-8")
+st.lap("guards_and_write", rows_in=len(pf_idx), rows_out=len(df) + len(df_review))
+st.rows(rows_in=len(pf_names), rows_out=len(df) + len(df_review))
 
 print(f"[ok] saved {len(df):,} high-confidence matches (≥{CUTOFF}) → {OUT_MAP}")
 print(f"[review] queued {len(df_review):,} borderline pairs → {OUT_REVIEW}")
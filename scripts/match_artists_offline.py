@@ -2,11 +2,20 @@ from __future__ import annotations
 
 from pathlib import Path
 from collections import defaultdict
-import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import os
+import math
+import numpy as np
 import pandas as pd
 import re
 import json
 
+import instrument
+import interim_io
+import match_cache
+import name_norm
+
 # Repo-local IO only (no secrets / network)
 UNIVERSE_CSV = Path("data/processed/artist_universe.csv")
 RAW_DIRS = [Path("data/raw/spotify_attributes"), Path("data/raw/spotify_youtube")]
@@ -15,87 +24,127 @@ OUT_CSV = Path("data/processed/artist_map.csv")
 # Only accept fuzzy matches at/above this confidence
 MIN_FUZZY = 0.65
 
+# Fuzzy engines: match_type written for their picks, cache key
+ENGINES = {
+    "jaccard": {"match_type": "jaccard_token", "cache": "offline_jaccard"},
+    "tfidf": {"match_type": "tfidf_ngram", "cache": "offline_tfidf"},
+}
+
+
+def engine_min_score(engine: str) -> float:
+    """Minimum score for an engine's picks (tfidf_match needs scipy, so it's imported only for tfidf)."""
+    if engine == "tfidf":
+        import tfidf_match
+        return tfidf_match.MIN_SIM
+    return MIN_FUZZY
 
-# Normalization: stable keys for matching
-def norm(s: str) -> str:
-    if not isinstance(s, str):
-        return ""
-    s = unicodedata.normalize("NFKC", s)
-    s = s.replace("µ", "mu").replace("μ", "mu")           # μ/µ -> mu
-    s = re.sub(r"\b(feat\.?|ft\.?|featuring)\b.*$", "", s, flags=re.I)
-    s = re.sub(r"[’`']", "", s)                           # unify apostrophes
-    s = re.sub(r"[\s._\-]+", " ", s).strip()
-    return s.casefold()
 
+# Raw CSV columns that hold artist names (matched case-insensitively)
+CANDIDATE_COLS = {"artist", "artist_name", "artists", "primary_artist"}
 
 LABEL_RE = re.compile(
-    r"\b(records?|recordings?|music|music\s+group|entertainment|studios?|llc|inc\.?|ltd\.?)\b",
+    r"\b(?:records?|recordings?|music|music\s+group|entertainment|studios?|llc|inc\.?|ltd\.?)\b",
     re.I,
 )
-def looks_like_label(name: str) -> bool:
-    return bool(LABEL_RE.search(name))
 
 
 def tokenize(s: str) -> set[str]:
     return set(re.findall(r"[a-z0-9]+", s))
 
 
-def jaccard(a: str, b: str) -> float:
-    ta, tb = tokenize(a), tokenize(b)
-    if not ta or not tb:
-        return 0.0
-    return len(ta & tb) / len(ta | tb)
+def json_list(v: str) -> list[str] | None:
+    """Items of a JSON list cell like '["Drake","21 Savage"]', or None if it isn't one."""
+    try:
+        obj = json.loads(v)
+    except (ValueError, RecursionError):
+        return None
+    return [str(w).strip() for w in obj] if isinstance(obj, list) else None
 
 
-def load_spotify_candidates() -> pd.DataFrame:
+def extract_names(df: pd.DataFrame) -> list[str]:
+    """
+    Distinct candidate names in `df`'s artist columns, in first-seen order
+    (column, row, item). JSON list cells are expanded, other cells are split on
+    ';', and label-like names are dropped.
+    """
+    found = []
+    for c in df.columns:
+        v = df[c].dropna().astype(str).str.strip()
+        v = v[v.ne("")].reset_index(drop=True)
+        # Only bracketed cells can be JSON lists; everything else skips the parser
+        bracketed = v[v.str.startswith("[") & v.str.endswith("]")]
+        lists = bracketed.map(json_list).dropna()
+        delimited = v.drop(lists.index).str.split(";")
+        found.append(pd.concat([lists, delimited]).sort_index(kind="stable").explode())
+    if not found:
+        return []
+    # object dtype keeps Python's re semantics (Unicode \b) for the label regex
+    names = pd.concat(found, ignore_index=True).dropna().astype(object).str.strip()
+    names = names[names.ne("")]
+    names = names[~names.str.contains(LABEL_RE)]
+    return list(pd.unique(names.to_numpy(dtype=object)))
+
+
+def scan_file(p: Path) -> list[str]:
+    """Candidate names in one CSV (empty if it has no artist column or can't be read)."""
+    try:
+        df = pd.read_csv(p, usecols=lambda c: str(c).lower() in CANDIDATE_COLS)
+    except Exception:
+        return []
+    return extract_names(df)
+
+
+def load_spotify_candidates(use_cache: bool = True, workers: int | None = None) -> pd.DataFrame:
     """
     Scan local CSVs for likely artist columns. No network calls.
+    Files are scanned in parallel; with the cache, files whose path, size and
+    mtime are unchanged reuse the names extracted last time.
     """
-    candidate_cols = {"artist", "artist_name", "artists", "primary_artist"}
-    names: set[str] = set()
+    files = [p for root in RAW_DIRS if root.exists() for p in root.rglob("*.csv")]
+    stats = {p.as_posix(): p.stat() for p in files}
+    rules_fp = match_cache.fingerprint({"cols": sorted(CANDIDATE_COLS), "label_re": LABEL_RE.pattern})
+
+    con = match_cache.open_cache() if use_cache else None
+    try:
+        cached = match_cache.load_file_names(con, rules_fp) if con else {}
+        per_file: dict[str, list[str]] = {}
+        todo = []
+        for p in files:
+            key, st = p.as_posix(), stats[p.as_posix()]
+            hit = cached.get(key)
+            if hit and hit[0] == st.st_size and hit[1] == st.st_mtime_ns:
+                per_file[key] = hit[2]
+            else:
+                todo.append(p)
+
+        n_workers = min(workers or os.cpu_count() or 1, len(todo))
+        if n_workers > 1:
+            with ProcessPoolExecutor(max_workers=n_workers) as pool:
+                scanned = dict(zip((p.as_posix() for p in todo), pool.map(scan_file, todo)))
+        else:
+            scanned = {p.as_posix(): scan_file(p) for p in todo}
+        per_file.update(scanned)
+        print(f"[info] candidate files: {len(files):,} ({len(todo):,} scanned on {max(n_workers, 1)} worker(s), "
+              f"{len(files) - len(todo):,} from cache)")
+
+        if con:
+            match_cache.save_file_names(
+                con, rules_fp,
+                {k: (stats[k].st_size, stats[k].st_mtime_ns, v) for k, v in scanned.items()},
+                set(stats),
+            )
+    finally:
+        if con:
+            con.close()
 
-    for root in RAW_DIRS:
-        if not root.exists():
-            continue
-        for p in root.rglob("*.csv"):
-            try:
-                cols = pd.read_csv(p, nrows=0).columns
-                wanted = [c for c in cols if str(c).lower() in candidate_cols]
-                if not wanted:
-                    continue
-                df = pd.read_csv(p, usecols=wanted)
-            except Exception:
-                continue
-
-            for c in df.columns:
-                for v in df[c].dropna().astype(str).values:
-                    v = v.strip()
-                    if not v:
-                        continue
-                    # JSON list like '["Drake","21 Savage"]'
-                    try:
-                        obj = json.loads(v)
-                        if isinstance(obj, list):
-                            for w in obj:
-                                w = str(w).strip()
-                                if w and not looks_like_label(w):
-                                    names.add(w)
-                            continue
-                    except Exception:
-                        pass
-                    # Delimited
-                    if ";" in v:
-                        for w in (x.strip() for x in v.split(";")):
-                            if w and not looks_like_label(w):
-                                names.add(w)
-                    else:
-                        if not looks_like_label(v):
-                            names.add(v)
+    names: set[str] = set()
+    for p in files:
+        names.update(per_file[p.as_posix()])
 
     # Collapse to one display value per normalized key
     canon: dict[str, str] = {}
-    for raw in names:
-        k = norm(raw)
+    raw_names = list(names)
+    for raw, k in zip(raw_names, name_norm.normalize(raw_names, "match")):
         if k and k not in canon:
             canon[k] = raw
 
@@ -104,85 +153,200 @@ def load_spotify_candidates() -> pd.DataFrame:
     return cand
 
 
-def bucket_by_prefix(keys: list[str]) -> dict[str, list[str]]:
+def build_token_index(keys: list[str]) -> tuple[list[frozenset[str]], dict[str, list[int]]]:
+    """
+    Tokenize every candidate once and build an inverted token -> candidate index.
+    Postings hold ascending positions into `keys`, so ties resolve to the earliest key.
     """
-    Light bucketing by first alnum char to avoid O(N^2) when fuzzing.
+    token_sets = [frozenset(tokenize(k)) for k in keys]
+    postings: dict[str, list[int]] = defaultdict(list)
+    for i, ts in enumerate(token_sets):
+        for t in ts:
+            postings[t].append(i)
+    return token_sets, dict(postings)
+
+
+def best_jaccard(
+    k: str,
+    keys: list[str],
+    token_sets: list[frozenset[str]],
+    postings: dict[str, list[int]],
+    min_score: float = MIN_FUZZY,
+) -> tuple[str | None, float]:
+    """
+    Best Jaccard candidate for `k` at/above `min_score`, without scanning every key.
+
+    A candidate can only reach `min_score` if its token count lies within
+    [n * min_score, n / min_score] and it shares at least ceil(n * min_score)
+    tokens with `k`; so it must contain one of the n - overlap + 1 rarest tokens
+    of `k` (prefix filter). Only those candidates get scored.
     """
-    buckets: dict[str, list[str]] = defaultdict(list)
-    for k in keys:
-        m = re.search(r"[a-z0-9]", k)
-        b = m.group(0) if m else "_"
-        buckets[b].append(k)
-    return buckets
+    if not isinstance(k, str) or not k:
+        return None, 0.0
+    ta = tokenize(k)
+    if not ta:
+        return None, 0.0
+
+    n = len(ta)
+    eps = 1e-9  # keep the bounds conservative under float rounding
+    min_overlap = max(1, math.ceil(n * min_score - eps))
+    lo, hi = math.ceil(n * min_score - eps), math.floor(n / min_score + eps)
+
+    rarest = sorted(ta, key=lambda t: (len(postings.get(t, ())), t))
+    pool: set[int] = set()
+    for t in rarest[: n - min_overlap + 1]:
+        pool.update(postings.get(t, ()))
+
+    bi, bs = -1, 0.0
+    for i in pool:
+        tb = token_sets[i]
+        if not lo <= len(tb) <= hi:
+            continue
+        s = len(ta & tb) / len(ta | tb)
+        if s > bs or (s == bs and i < bi):
+            bi, bs = i, s
+    if bi < 0 or bs < min_score:
+        return None, 0.0
+    return keys[bi], bs
+
+
+class JaccardScorer:
+    """Token Jaccard over an inverted index, built per candidate subset."""
+
+    settings = {"MIN_FUZZY": MIN_FUZZY}
+
+    def __init__(self, cand_keys: list[str]):
+        self.cand_keys = cand_keys
+
+    def score(self, keys: list[str], positions: list[int] | None = None) -> dict[str, tuple[str | None, float]]:
+        cands = self.cand_keys if positions is None else [self.cand_keys[i] for i in positions]
+        token_sets, postings = build_token_index(cands)
+        return {k: best_jaccard(k, cands, token_sets, postings) for k in keys}
 
 
-def main() -> None:
-    if not UNIVERSE_CSV.exists():
+class TfidfScorer:
+    """
+    Trigram TF-IDF cosine; the index (and its IDF weights) always covers every candidate.
+    Scores from different candidate sets are not comparable, so the candidate set is
+    part of the settings: any change to it discards the cached picks.
+    """
+
+    def __init__(self, cand_keys: list[str], rescore: bool = False):
+        import tfidf_match
+        self.cand_keys = cand_keys
+        self.rescore = rescore
+        self.settings = {"NGRAM": tfidf_match.NGRAM, "MIN_SIM": tfidf_match.MIN_SIM, "TOP_K": tfidf_match.TOP_K,
+                         "rescore": rescore, "candidates": match_cache.fingerprint(sorted(set(cand_keys)))}
+        self._index = None
+
+    def score(self, keys: list[str], positions: list[int] | None = None) -> dict[str, tuple[str | None, float]]:
+        import tfidf_match
+        if self._index is None:
+            self._index = tfidf_match.TfidfIndex(self.cand_keys)
+        rows = None if positions is None else np.asarray(positions, dtype=np.int64)
+        return tfidf_match.best_matches(self._index, self.cand_keys, keys, rows=rows, rescore=self.rescore)
+
+
+def fuzzy_matches(
+    keys: list[str], cand_keys: list[str], use_cache: bool = True, engine: str = "jaccard", rescore: bool = False
+) -> dict[str, tuple[str | None, float]]:
+    """
+    Best fuzzy pick per key. With the cache, only keys without a usable cached
+    pick are scored against all candidates; the rest are only checked against
+    candidates added since the last run.
+    """
+    keys = list(dict.fromkeys(k for k in keys if isinstance(k, str) and k))
+    scorer = TfidfScorer(cand_keys, rescore) if engine == "tfidf" else JaccardScorer(cand_keys)
+    if not use_cache:
+        return scorer.score(keys)
+
+    matcher = ENGINES[engine]["cache"]
+    settings_fp = match_cache.fingerprint({"matcher": matcher, **scorer.settings,
+                                           "rules": name_norm.rules_version("match")})
+    con = match_cache.open_cache()
+    try:
+        cached, prev = match_cache.load(con, matcher, settings_fp, cand_keys)
+        full, delta, added = match_cache.plan(keys, cand_keys, cached, prev)
+        results = {k: cached[k] for k in keys if k in cached}
+
+        if full:
+            results.update(scorer.score(full))
+        if delta:
+            match_cache.merge(results, scorer.score(delta, added), cand_keys)
+
+        print(f"[cache] {matcher}: reused {len(keys) - len(full):,}, scored {len(full):,} in full, "
+              f"re-checked {len(delta):,} against {len(added):,} new candidates")
+        match_cache.save(con, matcher, settings_fp, results, cand_keys, cached, prev)
+    finally:
+        con.close()
+    return results
+
+
+def main(use_cache: bool = True, workers: int | None = None, engine: str = "jaccard", rescore: bool = False) -> None:
+    st = instrument.start("match_artists_offline")
+    if not interim_io.resolve(UNIVERSE_CSV).exists():
         raise FileNotFoundError(f"Missing {UNIVERSE_CSV}. Build it first.")
 
-    u = pd.read_csv(UNIVERSE_CSV)
-    cols = [c for c in ["artist", "artist_norm", "n_reviews", "is_various", "is_suspicious_token"] if c in u.columns]
-    u = u[cols].copy()
+    available = interim_io.columns(UNIVERSE_CSV)
+    cols = [c for c in ["artist", "artist_norm", "n_reviews", "is_various", "is_suspicious_token"] if c in available]
+    u = interim_io.read_table(UNIVERSE_CSV, columns=cols)
     if "is_various" in u.columns:
         u = u[u["is_various"] == False]
     if "is_suspicious_token" in u.columns:
         u = u[u["is_suspicious_token"] == False]
     if "artist_norm" not in u.columns:
-        u["artist_norm"] = u["artist"].astype(str).map(norm)
+        u["artist_norm"] = name_norm.normalize(u["artist"].astype(str), "match")
+    # artist_norm (universe profile) stays the stored key; both joins compare match-profile keys,
+    # the profile the candidates were normalized with ("guns n' roses" vs "guns n roses")
+    u["match_key"] = name_norm.normalize(u["artist"].astype(str), "match")
 
     print(f"[info] universe artists: {len(u):,}")
+    st.lap("read_universe", rows_out=len(u))
 
-    cand = load_spotify_candidates()
+    cand = load_spotify_candidates(use_cache=use_cache, workers=workers)
+    st.lap("load_candidates", rows_out=len(cand))
+    st.rows(rows_in=len(u))
     if cand.empty:
         out = u.assign(artist_spotify=pd.NA, match_type="none", score=0.0, spotify_artist_id=pd.NA)
-        OUT_CSV.parent.mkdir(parents=True, exist_ok=True)
-        out.to_csv(OUT_CSV, index=False)
-        print(f"[warn] no local spotify candidates found; wrote skeleton {OUT_CSV} ({len(out):,} rows)")
+        path = interim_io.write_table(out, OUT_CSV)
+        print(f"[warn] no local spotify candidates found; wrote skeleton {path} ({len(out):,} rows)")
         return
 
     print(f"[info] candidate names found: {len(cand):,}")
 
     # Exact normalized match
-    left = u.merge(cand.drop_duplicates("artist_norm"), on="artist_norm", how="left")
+    left = u.merge(cand.drop_duplicates("artist_norm").rename(columns={"artist_norm": "match_key"}),
+                   on="match_key", how="left")
     left["match_type"] = left["artist_spotify"].notna().map({True: "exact_norm", False: ""})
     left["score"] = left["match_type"].map({"exact_norm": 1.0}).fillna(0.0)
+    st.lap("exact", rows_in=len(u), rows_out=int(left["artist_spotify"].notna().sum()))
 
-    # Fuzzy for the rest (token Jaccard within prefix bucket)
+    # Fuzzy for the rest (token Jaccard over an inverted token index, or trigram TF-IDF)
+    fuzzy_type, min_score = ENGINES[engine]["match_type"], engine_min_score(engine)
     missing = left["artist_spotify"].isna()
     if missing.any():
         cand_keys = cand["artist_norm"].unique().tolist()
-        buckets = bucket_by_prefix(cand_keys)
         key_to_disp = cand.set_index("artist_norm")["artist_spotify"].to_dict()
 
-        def best(k: str) -> tuple[str | None, float]:
-            if not isinstance(k, str) or not k:
-                return None, 0.0
-            m = re.search(r"[a-z0-9]", k)
-            b = m.group(0) if m else "_"
-            pool = buckets.get(b, cand_keys)
-            bk, bs = None, 0.0
-            for c in pool:
-                s = jaccard(k, c)
-                if s > bs:
-                    bk, bs = c, s
-            return bk, bs
-
-        miss_keys = left.loc[missing, "artist_norm"].tolist()
-        bests = [best(k) for k in miss_keys]
+        miss_keys = left.loc[missing, "match_key"].tolist()
+        picks = fuzzy_matches(miss_keys, cand_keys, use_cache=use_cache, engine=engine, rescore=rescore)
+        bests = [picks.get(k, (None, 0.0)) for k in miss_keys]
         best_norms = [bk for bk, _ in bests]
         best_scores = [bs for _, bs in bests]
         best_disp = [key_to_disp.get(k) for k in best_norms]
 
         left.loc[missing, "artist_spotify"] = best_disp
         left.loc[missing, "score"] = best_scores
-        left.loc[missing, "match_type"] = "jaccard_token"
+        left.loc[missing, "match_type"] = fuzzy_type
 
         # Reject weak fuzzies
-        weak = (left["match_type"].eq("jaccard_token")) & (left["score"] < MIN_FUZZY)
+        weak = (left["match_type"].eq(fuzzy_type)) & (left["score"] < min_score)
         left.loc[weak, ["artist_spotify", "match_type", "score"]] = [pd.NA, "", 0.0]
+        st.lap("fuzzy", rows_in=len(miss_keys), rows_out=int(left["match_type"].eq(fuzzy_type).sum()))
 
     # Placeholder for future API enrichment (keep public-safe)
     left["spotify_artist_id"] = pd.NA
+    left = left.drop(columns="match_key")
 
     # De-dupe by key: keep best-scoring, then higher n_reviews
     if left["artist_norm"].duplicated().any():
@@ -194,14 +358,26 @@ def main() -> None:
     # Summary
     n_total = len(left)
     n_exact = int((left["match_type"] == "exact_norm").sum())
-    n_fuzzy = int((left["match_type"] == "jaccard_token").sum())
+    n_fuzzy = int((left["match_type"] == fuzzy_type).sum())
     print(f"[summary] matched exact={n_exact} ({n_exact/n_total:.1%}), fuzzy={n_fuzzy} ({n_fuzzy/n_total:.1%}), total={n_total}")
 
-    OUT_CSV.parent.mkdir(parents=True, exist_ok=True)
-    left.sort_values(["score", "n_reviews"], ascending=[False, False]).to_csv(OUT_CSV, index=False)
-    print(f"[ok] wrote {OUT_CSV} ({len(left):,} rows)")
+    path = interim_io.write_table(left.sort_values(["score", "n_reviews"], ascending=[False, False]), OUT_CSV)
+    st.lap("write", rows_out=len(left))
+    st.rows(rows_out=len(left))
+    print(f"[ok] wrote {path} ({len(left):,} rows)")
     print(left.head(15).to_string(index=False))
 
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser(description="Offline Pitchfork -> Spotify artist matching.")
+    ap.add_argument("--no-cache", action="store_true",
+                    help=f"ignore and leave untouched the match cache ({match_cache.CACHE_DB})")
+    ap.add_argument("--workers", type=int, default=None,
+                    help="processes for scanning candidate CSVs (default: one per CPU)")
+    ap.add_argument("--engine", choices=sorted(ENGINES), default="jaccard",
+                    help="fuzzy matcher for names without an exact match: token Jaccard (default) "
+                         "or character-trigram TF-IDF, which scales to catalogue-size candidate sets")
+    ap.add_argument("--rescore", action="store_true",
+                    help="tfidf only: re-rank each short list with rapidfuzz WRatio and the match_guards rules")
+    args = ap.parse_args()
+    main(use_cache=not args.no_cache, workers=args.workers, engine=args.engine, rescore=args.rescore)
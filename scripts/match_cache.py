@@ -0,0 +1,233 @@
+"""
+Persistent, incremental cache for the artist matchers.
+
+One sidecar SQLite file holds, per matcher:
+  - the best candidate and score for every artist key it has scored,
+  - the candidate names that were present when those scores were computed,
+  - a fingerprint of the matcher settings (cutoffs, scorer) and of the candidate set.
+
+On rerun a matcher only scores artists that are new (or whose cached pick has
+disappeared) against the full candidate set, and scores every other cached
+artist against just the candidates added since the last run. A cached pick is
+replaced only when a new candidate strictly beats its score; on an exact tie the
+cached (older) candidate is kept. Changing the settings drops the matcher's cache.
+When the candidate set's fingerprint is unchanged, its stored name list is not
+read back and there is no delta pass.
+
+It also keeps the candidate names extracted from each raw Spotify file, keyed
+by path, size and mtime (plus a fingerprint of the extraction rules), so
+unchanged files are not re-read.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from datetime import datetime, timezone
+import hashlib
+import json
+import sqlite3
+
+CACHE_DB = Path("data/processed/match_cache.sqlite")
+
+
+def fingerprint(obj) -> str:
+    """Stable sha256 of a JSON-serialisable object (settings dict or sorted names)."""
+    blob = json.dumps(obj, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def open_cache(path: Path = CACHE_DB) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(path)
+    con.executescript("""
+    CREATE TABLE IF NOT EXISTS match_cache_meta (
+      matcher          TEXT PRIMARY KEY,
+      settings_fp      TEXT NOT NULL,
+      candidates_fp    TEXT NOT NULL,
+      n_candidates     INTEGER NOT NULL,
+      updated_at       TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS match_cache (
+      matcher          TEXT NOT NULL,
+      artist_norm      TEXT NOT NULL,
+      candidate        TEXT,
+      score            REAL NOT NULL,
+      PRIMARY KEY (matcher, artist_norm)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS match_cache_candidates (
+      matcher          TEXT NOT NULL,
+      candidate        TEXT NOT NULL,
+      PRIMARY KEY (matcher, candidate)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS candidate_file_cache (
+      path             TEXT PRIMARY KEY,
+      size             INTEGER NOT NULL,
+      mtime_ns         INTEGER NOT NULL,
+      rules_fp         TEXT NOT NULL,
+      names            TEXT NOT NULL      -- JSON array, first-seen order
+    ) WITHOUT ROWID;
+    """)
+    return con
+
+
+def clear(con: sqlite3.Connection, matcher: str) -> None:
+    with con:
+        for t in ("match_cache_meta", "match_cache", "match_cache_candidates"):
+            con.execute(f"DELETE FROM {t} WHERE matcher = ?", (matcher,))
+
+
+def load(
+    con: sqlite3.Connection, matcher: str, settings_fp: str, candidates: list[str] | None = None
+) -> tuple[dict[str, tuple[str | None, float]], set[str]]:
+    """
+    Cached picks and the candidate set they were scored against.
+    Returns empty results (and clears the matcher) if the settings changed.
+    If `candidates` has the cached candidate fingerprint it is returned as that
+    set, without reading the stored names.
+    """
+    meta = con.execute(
+        "SELECT settings_fp, candidates_fp FROM match_cache_meta WHERE matcher = ?", (matcher,)
+    ).fetchone()
+    if meta is None:
+        return {}, set()
+    if meta[0] != settings_fp:
+        print(f"[cache] {matcher}: settings changed; discarding cached matches")
+        clear(con, matcher)
+        return {}, set()
+
+    cached = {
+        k: (c, float(s))
+        for k, c, s in con.execute(
+            "SELECT artist_norm, candidate, score FROM match_cache WHERE matcher = ?", (matcher,)
+        )
+    }
+    if candidates is not None:
+        current = set(candidates)
+        if fingerprint(sorted(current)) == meta[1]:
+            return cached, current
+    prev = {
+        c for (c,) in con.execute(
+            "SELECT candidate FROM match_cache_candidates WHERE matcher = ?", (matcher,)
+        )
+    }
+    return cached, prev
+
+
+def plan(
+    keys: list[str],
+    candidates: list[str],
+    cached: dict[str, tuple[str | None, float]],
+    prev: set[str],
+) -> tuple[list[str], list[str], list[int]]:
+    """
+    Split `keys` into (full, delta) work lists and return the positions of
+    candidates added since the cached run.
+
+    full:  not cached, or the cached pick is no longer a candidate -> score against everything
+    delta: cached -> score only against the added candidates
+    """
+    current = set(candidates)
+    added = [i for i, c in enumerate(candidates) if c not in prev]
+    full, delta = [], []
+    for k in keys:
+        hit = cached.get(k)
+        if hit is None or (hit[0] is not None and hit[0] not in current):
+            full.append(k)
+        elif added:
+            delta.append(k)
+    return full, delta, added
+
+
+def merge(
+    picks: dict[str, tuple[str | None, float]],
+    rechecked: dict[str, tuple[str | None, float]],
+    candidates: list[str],
+) -> None:
+    """
+    Fold the delta keys' picks among the added candidates into `picks`, in place.
+    A higher score wins; on a tie the candidate listed first wins, as in a full pass.
+    """
+    pos = {}
+    for i, c in enumerate(candidates):
+        pos.setdefault(c, i)
+    for k, (c, s) in rechecked.items():
+        old_c, old_s = picks[k]
+        if c is None:
+            continue
+        if s > old_s or (s == old_s and pos[c] < pos.get(old_c, len(candidates))):
+            picks[k] = (c, s)
+
+
+def save(
+    con: sqlite3.Connection,
+    matcher: str,
+    settings_fp: str,
+    results: dict[str, tuple[str | None, float]],
+    candidates: list[str],
+    cached: dict[str, tuple[str | None, float]] | None = None,
+    prev: set[str] | None = None,
+) -> None:
+    """
+    Persist `results` scored against `candidates`. Only the difference against
+    the previously loaded `cached` / `prev` state is written.
+    """
+    cached = cached or {}
+    prev = prev or set()
+    current = set(candidates)
+    changed = [(matcher, k, c, float(s)) for k, (c, s) in results.items() if cached.get(k) != (c, s)]
+    dropped = [(matcher, k) for k in cached.keys() - results.keys()]
+    with con:
+        con.executemany("DELETE FROM match_cache WHERE matcher = ? AND artist_norm = ?", dropped)
+        con.executemany(
+            "INSERT OR REPLACE INTO match_cache (matcher, artist_norm, candidate, score) VALUES (?, ?, ?, ?)",
+            changed,
+        )
+        con.executemany(
+            "DELETE FROM match_cache_candidates WHERE matcher = ? AND candidate = ?",
+            ((matcher, c) for c in prev - current),
+        )
+        con.executemany(
+            "INSERT INTO match_cache_candidates (matcher, candidate) VALUES (?, ?)",
+            ((matcher, c) for c in current - prev),
+        )
+        con.execute(
+            """
+            INSERT INTO match_cache_meta (matcher, settings_fp, candidates_fp, n_candidates, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(matcher) DO UPDATE SET
+              settings_fp = excluded.settings_fp,
+              candidates_fp = excluded.candidates_fp,
+              n_candidates = excluded.n_candidates,
+              updated_at = excluded.updated_at
+            """,
+            (matcher, settings_fp, fingerprint(sorted(current)), len(current),
+             datetime.now(tz=timezone.utc).isoformat()),
+        )
+    print(f"[cache] {matcher}: {len(changed):,} picks updated, "
+          f"{len(current - prev):,} candidates added, {len(prev - current):,} removed")
+
+
+def load_file_names(con: sqlite3.Connection, rules_fp: str) -> dict[str, tuple[int, int, list[str]]]:
+    """Cached (size, mtime_ns, names) per candidate file extracted under `rules_fp`."""
+    return {
+        p: (size, mtime_ns, json.loads(names))
+        for p, size, mtime_ns, names in con.execute(
+            "SELECT path, size, mtime_ns, names FROM candidate_file_cache WHERE rules_fp = ?", (rules_fp,)
+        )
+    }
+
+
+def save_file_names(
+    con: sqlite3.Connection,
+    rules_fp: str,
+    scanned: dict[str, tuple[int, int, list[str]]],
+    present: set[str],
+) -> None:
+    """Store newly `scanned` files and forget files that are no longer `present`."""
+    stale = [(p,) for (p,) in con.execute("SELECT path FROM candidate_file_cache") if p not in present]
+    with con:
+        con.executemany("DELETE FROM candidate_file_cache WHERE path = ?", stale)
+        con.executemany(
+            "INSERT OR REPLACE INTO candidate_file_cache (path, size, mtime_ns, rules_fp, names) VALUES (?, ?, ?, ?, ?)",
+            ((p, size, mtime_ns, rules_fp, json.dumps(names, ensure_ascii=False))
+             for p, (size, mtime_ns, names) in scanned.items()),
+        )
@@ -0,0 +1,46 @@
+# scripts/match_guards.py
+"""
+Acceptance guards for fuzzy artist pairs, shared by match_artists.py and the
+TF-IDF engine (tfidf_match.py).
+
+A scored pair is accepted only if neither side is a compilation placeholder,
+both names start with the same letter, the shorter name is at least 60% of the
+longer one, and - below a score of 95 - the two names share enough words.
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+BLOCKLIST = {"various artists", "soundtrack", "original soundtrack", "va", "ost"}
+
+
+def word_jaccard_low(a: str, b: str) -> bool:
+    ta, tb = set(a.split()), set(b.split())
+    return bool(ta and tb and (len(ta & tb) / len(ta | tb)) < 0.25)
+
+
+def name_features(names: list[str]) -> dict[str, np.ndarray]:
+    """Per-name inputs to the ok_pairs guards, computed once per side."""
+    low = pd.Series(names, dtype=object).str.lower()
+    return {
+        "low": low.to_numpy(),
+        "first": low.str[0].to_numpy(),
+        "len": low.str.len().to_numpy(),
+        "blocked": low.isin(BLOCKLIST).to_numpy(),
+    }
+
+
+def ok_pairs(a_feat: dict, b_feat: dict, a_idx: np.ndarray, b_idx: np.ndarray, scores: np.ndarray) -> np.ndarray:
+    """Acceptance guards over aligned (a, b, score) arrays; scores are on a 0-100 scale."""
+    la, lb = a_feat["len"][a_idx], b_feat["len"][b_idx]
+    hi = np.maximum(la, lb)
+    r = np.divide(np.minimum(la, lb), hi, out=np.zeros(len(hi)), where=hi > 0)
+    ok = (~a_feat["blocked"][a_idx] & ~b_feat["blocked"][b_idx]
+          & (a_feat["first"][a_idx] == b_feat["first"][b_idx])     # first-letter must match
+          & (r >= 0.6))                                            # avoid crazy length mismatches
+    # token overlap (cheap Jaccard on words); allow short-name exceptions if very high score
+    for k in np.flatnonzero(ok & (scores < 95)):
+        if word_jaccard_low(a_feat["low"][a_idx[k]], b_feat["low"][b_idx[k]]):
+            ok[k] = False
+    return ok
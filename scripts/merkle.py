@@ -0,0 +1,163 @@
+# scripts/merkle.py
+"""
+Chunked content hash trees over keyed tables (reviewid), for row-level drift
+detection between two export manifests.
+
+A key's digest is the sum (mod 2**256) of the sha256 of each of its rows,
+serialized as in extract_pitchfork.sha256_rows, so it depends on the rows and
+not on their order or on the file format they were exported to. Keys fall into
+fixed ranges [i * range_size, (i + 1) * range_size); a leaf hashes the digests
+of its keys in key order, and each parent hashes its two children up to the
+root. Trees are positional over range indexes, so two manifests line up node
+by node and a diff only descends where hashes differ.
+
+Manifest section (under each table entry, next to sha256):
+
+  "merkle": {"key": "reviewid", "range_size": 128, "root": "<sha256>",
+             "leaves": {"<range index>": {"hash": ..., "rows": ...,
+                        "keys": "<key> <key> ...", "digests": "<8 hex per key>"}}}
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+
+KEY = "reviewid"
+RANGE_SIZE = 128
+DIGEST_HEX = 8          # per-key digest kept in the manifest, enough to tell keys apart
+_MOD = 1 << 256
+
+# Same text as json.dumps(row, ensure_ascii=False, default=repr), without building an encoder per row
+_ENCODER = json.JSONEncoder(ensure_ascii=False, default=repr)
+
+
+def row_digest(row) -> int:
+    line = (_ENCODER.encode(row) + "\n").encode("utf-8")
+    return int.from_bytes(hashlib.sha256(line).digest(), "big")
+
+
+def _h(*parts: str) -> str:
+    return hashlib.sha256("|".join(parts).encode("ascii")).hexdigest()
+
+
+class KeyDigests:
+    """Accumulates per-key row digests while rows stream past (any order)."""
+
+    def __init__(self, key_index: int, key: str = KEY, range_size: int = RANGE_SIZE):
+        self.key_index = key_index
+        self.key = key
+        self.range_size = range_size
+        self.digests: dict[int, int] = {}
+        self.rows: dict[int, int] = {}
+
+    def add(self, rows) -> None:
+        d, n, i = self.digests, self.rows, self.key_index
+        for r in rows:
+            k = r[i]
+            d[k] = (d.get(k, 0) + row_digest(r)) % _MOD
+            n[k] = n.get(k, 0) + 1
+
+    def section(self) -> dict:
+        leaves: dict[int, dict] = {}
+        for k in sorted(self.digests, key=lambda k: (k is None, k if isinstance(k, int) else 0)):
+            if not isinstance(k, int):
+                # Rows without an integer key go to their own leaf past every range
+                idx = -1
+            else:
+                idx = k // self.range_size
+            leaf = leaves.setdefault(idx, {"keys": [], "full": [], "rows": 0})
+            leaf["keys"].append(k)
+            leaf["full"].append(f"{self.digests[k]:064x}")
+            leaf["rows"] += self.rows[k]
+        out = {}
+        for idx, leaf in sorted(leaves.items()):
+            out[str(idx)] = {
+                "hash": _h(*(f"{k}:{d}" for k, d in zip(leaf["keys"], leaf["full"]))),
+                "rows": leaf["rows"],
+                "keys": " ".join("null" if k is None else str(k) for k in leaf["keys"]),
+                "digests": "".join(d[:DIGEST_HEX] for d in leaf["full"]),
+            }
+        return {
+            "key": self.key,
+            "range_size": self.range_size,
+            "root": root(out),
+            "leaves": out,
+        }
+
+
+def _height(*sections: dict) -> int:
+    top = max((int(i) for s in sections for i in s["leaves"] if int(i) >= 0), default=0)
+    return max(top, 0).bit_length()
+
+
+def _levels(leaves: dict, height: int) -> list[dict[int, str]]:
+    """Node hashes per level, leaves first; absent subtrees are simply missing."""
+    levels = [{int(i): leaf["hash"] for i, leaf in leaves.items() if int(i) >= 0}]
+    for _ in range(height):
+        below, up = levels[-1], {}
+        for i in {j // 2 for j in below}:
+            up[i] = _h(below.get(2 * i, ""), below.get(2 * i + 1, ""))
+        levels.append(up)
+    return levels
+
+
+def root(leaves: dict, height: int | None = None) -> str:
+    h = _height({"leaves": leaves}) if height is None else height
+    top = _levels(leaves, h)[-1]
+    extra = leaves.get("-1", {}).get("hash", "")
+    return _h(top.get(0, ""), extra)
+
+
+def _keys(leaf: dict | None) -> dict[str, str]:
+    if not leaf:
+        return {}
+    keys = leaf["keys"].split(" ") if leaf["keys"] else []
+    d = leaf["digests"]
+    return {k: d[i * DIGEST_HEX:(i + 1) * DIGEST_HEX] for i, k in enumerate(keys)}
+
+
+def diff(old: dict, new: dict) -> tuple[list[tuple[int, int]], list]:
+    """
+    Key ranges whose leaves differ, as [lo, hi) pairs, and the keys inside them
+    that were added, removed or changed. Only subtrees with different hashes are
+    visited.
+    """
+    if old.get("key") != new.get("key") or old.get("range_size") != new.get("range_size"):
+        raise ValueError("manifests use different keys or range sizes; their trees are not comparable")
+    if old["root"] == new["root"]:
+        return [], []
+
+    size = new["range_size"]
+    height = _height(old, new)
+    lo, ln = _levels(old["leaves"], height), _levels(new["leaves"], height)
+
+    changed_idx = []
+    stack = [(height, 0)]
+    while stack:
+        level, i = stack.pop()
+        if lo[level].get(i) == ln[level].get(i):
+            continue
+        if level == 0:
+            changed_idx.append(i)
+        else:
+            stack += [(level - 1, 2 * i + 1), (level - 1, 2 * i)]
+    if old["leaves"].get("-1", {}).get("hash") != new["leaves"].get("-1", {}).get("hash"):
+        changed_idx.append(-1)
+
+    ranges, keys = [], []
+    for i in sorted(changed_idx):
+        a, b = _keys(old["leaves"].get(str(i))), _keys(new["leaves"].get(str(i)))
+        keys += [k for k in set(a) | set(b) if a.get(k) != b.get(k)]
+        if i >= 0:
+            ranges.append((i * size, (i + 1) * size))
+    keys = [_parse_key(k) for k in keys]
+    return ranges, sorted(keys, key=lambda k: (not isinstance(k, int), k if isinstance(k, int) else 0, str(k)))
+
+
+def _parse_key(k: str):
+    if k == "null":
+        return None
+    try:
+        return int(k)
+    except ValueError:
+        return k
@@ -0,0 +1,119 @@
+# scripts/name_norm.py
+"""
+Artist-name normalization shared by the universe builder and both matchers.
+
+Each caller keeps its own rule profile, because the keys they produce are
+already stored downstream (dim_artist.artist_norm, the match cache, the
+override CSVs):
+
+  universe  build_artist_universe.py   drop trailing "feat./ft." credits, NFKC,
+                                       squeeze whitespace, casefold
+  match     match_artists_offline.py   NFKC, µ/μ -> "mu", drop "feat./ft./featuring"
+                                       credits, drop apostrophes, [space . _ -] -> " ",
+                                       casefold
+  fuzzy     match_artists.py           lowercase, strip, drop a leading "the ",
+                                       keep only letters, digits and whitespace
+
+`normalize()` works on whole columns: it factorizes the input, applies the
+precompiled rules once per distinct name (names already seen in this process
+are reused, and results are interned), then maps the codes back. `norm()` is
+the memoized single-name version.
+
+RULES_VERSION must be bumped whenever a rule changes; the matchers put
+`rules_version(profile)` in their cache fingerprints so cached picks made
+under older keys are discarded.
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+import re
+import sys
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+RULES_VERSION = 1
+
+# Distinct names remembered per profile across normalize() calls
+CACHE_MAX = 1_000_000
+
+UNIVERSE_FEAT_RE = re.compile(r"\b(feat\.?|ft\.?)\b.*$", flags=re.IGNORECASE)
+MATCH_FEAT_RE = re.compile(r"\b(feat\.?|ft\.?|featuring)\b.*$", flags=re.IGNORECASE)
+APOSTROPHE_RE = re.compile(r"[’`']")
+SEPARATOR_RE = re.compile(r"[\s._\-]+")
+WHITESPACE_RE = re.compile(r"\s+")
+# \w is str.isalnum() plus "_" and \s is str.isspace(), so this drops everything else
+NON_ALNUM_RE = re.compile(r"[^\w\s]|_")
+
+
+def _universe(s: str) -> str:
+    s = unicodedata.normalize("NFKC", UNIVERSE_FEAT_RE.sub("", s)).strip()
+    return WHITESPACE_RE.sub(" ", s).casefold()
+
+
+def _match(s: str) -> str:
+    s = unicodedata.normalize("NFKC", s).replace("µ", "mu").replace("μ", "mu")
+    s = APOSTROPHE_RE.sub("", MATCH_FEAT_RE.sub("", s))
+    return SEPARATOR_RE.sub(" ", s).strip().casefold()
+
+
+def _fuzzy(s: str) -> str:
+    s = s.lower().strip()
+    if s.startswith("the "):
+        s = s[4:]
+    return NON_ALNUM_RE.sub("", s)
+
+
+PROFILES = {"universe": _universe, "match": _match, "fuzzy": _fuzzy}
+
+_seen: dict[str, dict[str, str]] = {p: {} for p in PROFILES}
+
+
+def rules_version(profile: str) -> str:
+    """Identifier of the rules behind `profile`, for cache fingerprints."""
+    if profile not in PROFILES:
+        raise ValueError(f"unknown normalization profile {profile!r}; expected one of {sorted(PROFILES)}")
+    return f"{profile}/v{RULES_VERSION}"
+
+
+def _normalize_unique(names: list[str], profile: str) -> list[str]:
+    """Normalize distinct strings, computing only the ones not seen before."""
+    seen = _seen[profile]
+    todo = [n for n in names if n not in seen]
+    if todo:
+        if len(seen) + len(todo) > CACHE_MAX:
+            seen.clear()
+        rule = PROFILES[profile]
+        seen.update((n, sys.intern(rule(n))) for n in todo)
+    return [seen[n] for n in names]
+
+
+def normalize(values, profile: str = "match"):
+    """
+    Normalize a column of names. Non-strings (None, NaN, numbers) become "".
+    Returns a Series aligned with a Series input, otherwise a list.
+    """
+    rules_version(profile)
+    is_series = isinstance(values, pd.Series)
+    s = values if is_series else pd.Series(list(values), dtype=object)
+
+    codes, uniques = pd.factorize(s.astype(object), use_na_sentinel=True)
+    uniques = list(uniques)
+    keep = [i for i, u in enumerate(uniques) if isinstance(u, str)]
+    table = np.full(len(uniques) + 1, "", dtype=object)      # last slot: NA / non-str
+    table[keep] = _normalize_unique([uniques[i] for i in keep], profile)
+    out = table[np.where(codes < 0, len(uniques), codes)]
+
+    if is_series:
+        return pd.Series(out.tolist(), index=values.index, name=values.name)
+    return out.tolist()
+
+
+@lru_cache(maxsize=65_536)
+def norm(name, profile: str = "match") -> str:
+    """Normalize one name (memoized)."""
+    if not isinstance(name, str):
+        return ""
+    return normalize([name], profile)[0]
+
@@ -0,0 +1,323 @@
+# scripts/quality.py
+"""
+Declarative data-quality checks for the warehouse tables.
+
+A check is declared with one of the constructors below (rows, not_null,
+unique, in_range, references, coverage) and names the table it is about.
+`run()` groups the checks by table and compiles each group into a single
+aggregate SELECT - one scan of the table however many checks it carries:
+
+  not_null / in_range   SUM of the violating condition (plus MIN/MAX for ranges)
+  unique                COUNT(key) - COUNT(DISTINCT key)
+  references            SUM of rows whose key has no match in the parent (index probe)
+  coverage              COUNT(DISTINCT key) with / without a match in the parent
+
+Identical expressions are computed once per pass. Tables are checked
+concurrently, each on its own read-only connection. Results carry the check,
+its value, pass/fail status and the time of the pass that computed it.
+
+Severity: "error" checks fail the caller (`failures()`), "warn" ones are only
+reported, "info" ones are measurements without a threshold.
+
+Usage:
+  python scripts/quality.py                    # every check set, against the warehouse
+  python scripts/quality.py --json checks.json --workers 4
+"""
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import warehouse
+
+DB = warehouse.db_path(Path("data/processed/vinyl_dw.sqlite"))
+
+
+@dataclass(frozen=True)
+class Check:
+    name: str
+    table: str
+    kind: str                         # rows | not_null | unique | range | references | coverage
+    cols: tuple[str, ...] = ()
+    lo: float | None = None
+    hi: float | None = None
+    nulls_ok: bool = True             # range: whether NULL counts as in range
+    blank: bool = False               # not_null: blank text counts as missing too
+    parent: str | None = None         # references / coverage: looked-up table and key
+    parent_key: str | None = None
+    where: str | None = None          # coverage: condition on the parent row (alias p)
+    min_rows: int = 1
+    min_ratio: float | None = None
+    severity: str = "error"
+
+
+@dataclass
+class Result:
+    name: str
+    table: str
+    kind: str
+    severity: str
+    status: str                       # pass | fail | warn | info
+    value: float | None
+    detail: dict = field(default_factory=dict)
+    seconds: float = 0.0              # duration of the table pass that computed it
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def rows(table: str, min_rows: int = 1, severity: str = "error") -> Check:
+    return Check(f"rows:{table}", table, "rows", min_rows=min_rows, severity=severity)
+
+
+def not_null(table: str, col: str, blank: bool = False, severity: str = "error") -> Check:
+    return Check(f"null:{table}.{col}", table, "not_null", (col,), blank=blank, severity=severity)
+
+
+def unique(table: str, *cols: str, severity: str = "error") -> Check:
+    return Check(f"unique:{table}({', '.join(cols)})", table, "unique", cols, severity=severity)
+
+
+def in_range(table: str, col: str, lo: float | None, hi: float | None, nulls_ok: bool = True,
+             severity: str = "error") -> Check:
+    return Check(f"range:{table}.{col}", table, "range", (col,), lo=lo, hi=hi, nulls_ok=nulls_ok,
+                 severity=severity)
+
+
+def references(table: str, col: str, parent: str, parent_key: str, severity: str = "error") -> Check:
+    return Check(f"fk:{table}.{col}->{parent}.{parent_key}", table, "references", (col,),
+                 parent=parent, parent_key=parent_key, severity=severity)
+
+
+def coverage(name: str, table: str, key: str, parent: str, parent_key: str, where: str | None = None,
+             min_ratio: float | None = None, severity: str = "info") -> Check:
+    """Share of distinct `key` values with a `parent` row satisfying `where`."""
+    return Check(f"coverage:{name}", table, "coverage", (key,), parent=parent, parent_key=parent_key,
+                 where=where, min_ratio=min_ratio, severity=severity)
+
+
+# Checks run by the loaders after they write their tables
+REVIEW_CHECKS = [
+    rows("pitchfork_reviews"),
+    unique("pitchfork_reviews", "reviewid"),
+    in_range("pitchfork_reviews", "score", 0, 10),
+    rows("pitchfork_review_artists"),
+    unique("pitchfork_review_artists", "reviewid", "artist", severity="warn"),
+    references("pitchfork_review_artists", "reviewid", "pitchfork_reviews", "reviewid", severity="warn"),
+]
+
+DIM_ARTIST_CHECKS = [
+    rows("dim_artist"),
+    unique("dim_artist", "artist_norm"),
+    not_null("dim_artist", "artist_norm", blank=True),
+    references("fact_review_artist", "artist_key", "dim_artist", "artist_key"),
+    coverage("mapped", "fact_review_artist", "artist_key", "dim_artist", "artist_key",
+             "p.artist_spotify IS NOT NULL"),
+    coverage("exact_norm", "fact_review_artist", "artist_key", "dim_artist", "artist_key",
+             "p.match_type = 'exact_norm'"),
+    coverage("jaccard_token", "fact_review_artist", "artist_key", "dim_artist", "artist_key",
+             "p.match_type = 'jaccard_token'"),
+    coverage("tfidf_ngram", "fact_review_artist", "artist_key", "dim_artist", "artist_key",
+             "p.match_type = 'tfidf_ngram'"),
+]
+
+# Publish gate (warehouse.check): row counts are compared with the live file and
+# null counts must not grow, so the not_null checks only measure here
+WAREHOUSE_CHECKS = [
+    rows("pitchfork_reviews"),
+    rows("pitchfork_artists"),
+    rows("spotify_youtube_clean"),
+    in_range("pitchfork_reviews", "score", 0, 10),
+    not_null("pitchfork_artists", "artist", blank=True, severity="info"),
+    not_null("spotify_youtube_clean", "artist", severity="info"),
+    not_null("spotify_youtube_clean", "song", severity="info"),
+]
+
+CHECK_SETS = {"reviews": REVIEW_CHECKS, "dim_artist": DIM_ARTIST_CHECKS, "warehouse": WAREHOUSE_CHECKS}
+
+
+def _q(ident: str) -> str:
+    return '"' + ident.replace('"', '""') + '"'
+
+
+def _exprs(c: Check) -> list[str]:
+    """Aggregate expressions over `t` whose values make up the check's result."""
+    cols = [f"t.{_q(col)}" for col in c.cols]
+    if c.kind == "rows":
+        return ["COUNT(*)"]
+    if c.kind == "not_null":
+        cond = f"{cols[0]} IS NULL" + (f" OR TRIM({cols[0]}) = ''" if c.blank else "")
+        return [f"COALESCE(SUM({cond}), 0)"]
+    if c.kind == "unique":
+        if len(cols) == 1:
+            key = cols[0]
+        else:
+            # quote() keeps 1 and '1' apart; rows with a NULL in the key are not compared (like UNIQUE)
+            key = (f"CASE WHEN {' AND '.join(f'{k} IS NOT NULL' for k in cols)} "
+                   f"THEN {' || char(31) || '.join(f'quote({k})' for k in cols)} END")
+        return [f"COUNT({key}) - COUNT(DISTINCT {key})"]
+    if c.kind == "range":
+        bad = [f"{cols[0]} < {c.lo}" if c.lo is not None else None,
+               f"{cols[0]} > {c.hi}" if c.hi is not None else None,
+               None if c.nulls_ok else f"{cols[0]} IS NULL"]
+        cond = " OR ".join(b for b in bad if b) or "0"
+        return [f"COALESCE(SUM({cond}), 0)", f"MIN({cols[0]})", f"MAX({cols[0]})"]
+    lookup = f"SELECT 1 FROM {_q(c.parent)} AS p WHERE p.{_q(c.parent_key)} = {cols[0]}"
+    if c.kind == "references":
+        return [f"COALESCE(SUM({cols[0]} IS NOT NULL AND NOT EXISTS ({lookup})), 0)"]
+    if c.kind == "coverage":
+        if c.where:
+            lookup += f" AND ({c.where})"
+        return [f"COUNT(DISTINCT CASE WHEN EXISTS ({lookup}) THEN {cols[0]} END)", f"COUNT(DISTINCT {cols[0]})"]
+    raise ValueError(f"Unknown check kind {c.kind!r}")
+
+
+def compile_table(table: str, checks: list[Check]) -> tuple[str, list[list[int]]]:
+    """One SELECT for every check on `table`, and each check's positions in its row."""
+    exprs: dict[str, int] = {}
+    slots = [[exprs.setdefault(e, len(exprs)) for e in _exprs(c)] for c in checks]
+    return f"SELECT {', '.join(exprs)} FROM {_q(table)} AS t", slots
+
+
+def _result(c: Check, values: list, seconds: float) -> Result:
+    detail: dict = {}
+    if c.kind == "rows":
+        value = values[0]
+        ok = value >= c.min_rows
+    elif c.kind == "coverage":
+        num, den = values
+        value = num / den if den else None
+        detail = {"matched": num, "total": den}
+        ok = c.min_ratio is None or (value is not None and value >= c.min_ratio)
+    else:
+        value = values[0]
+        if c.kind == "range":
+            detail = {"min": values[1], "max": values[2]}
+        ok = value == 0
+    if c.severity == "info":
+        status = "info"
+    else:
+        status = "pass" if ok else ("fail" if c.severity == "error" else "warn")
+    return Result(c.name, c.table, c.kind, c.severity, status, value, detail, round(seconds, 4))
+
+
+def _check_table(con: sqlite3.Connection, table: str, checks: list[Check]) -> list[Result]:
+    sql, slots = compile_table(table, checks)
+    t0 = time.perf_counter()
+    try:
+        row = con.execute(sql).fetchone()
+    except sqlite3.Error as e:
+        dt = time.perf_counter() - t0
+        return [Result(c.name, c.table, c.kind, c.severity, "fail", None, {"error": str(e)}, round(dt, 4))
+                for c in checks]
+    dt = time.perf_counter() - t0
+    return [_result(c, [row[i] for i in s], dt) for c, s in zip(checks, slots)]
+
+
+def _by_table(checks: list[Check]) -> dict[str, list[Check]]:
+    groups: dict[str, list[Check]] = {}
+    for c in dict.fromkeys(checks):
+        groups.setdefault(c.table, []).append(c)
+    return groups
+
+
+def run(db: Path | sqlite3.Connection, checks: list[Check], workers: int | None = None) -> list[Result]:
+    """
+    Run `checks` (one pass per table) and return their results in order.
+    Given a path, tables are checked in parallel on read-only connections;
+    given a connection, sequentially on it (sees its uncommitted writes).
+    """
+    groups = _by_table(checks)
+    if isinstance(db, sqlite3.Connection):
+        done = {t: _check_table(db, t, cs) for t, cs in groups.items()}
+    else:
+        uri = Path(db).resolve().as_uri() + "?mode=ro"
+
+        def task(table: str) -> list[Result]:
+            con = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            try:
+                return _check_table(con, table, groups[table])
+            finally:
+                con.close()
+
+        n = max(1, min(workers or os.cpu_count() or 1, len(groups)))
+        if n > 1:
+            with ThreadPoolExecutor(max_workers=n) as pool:
+                done = dict(zip(groups, pool.map(task, groups)))
+        else:
+            done = {t: task(t) for t in groups}
+    by_name = {r.name: r for rs in done.values() for r in rs}
+    return [by_name[c.name] for c in dict.fromkeys(checks)]
+
+
+def check_frame(df, table: str, checks: list[Check]) -> list[Result]:
+    """Run single-table checks on a DataFrame (only the columns they use are copied)."""
+    cols = list(dict.fromkeys(col for c in checks for col in c.cols))
+    if any(c.parent for c in checks):
+        raise ValueError("check_frame() only runs checks that don't look up other tables")
+    con = sqlite3.connect(":memory:")
+    try:
+        df[cols].to_sql(table, con, index=False)
+        return run(con, checks)
+    finally:
+        con.close()
+
+
+def failures(results: list[Result]) -> list[Result]:
+    return [r for r in results if r.status == "fail"]
+
+
+def describe(r: Result) -> str:
+    if "error" in r.detail:
+        return r.detail["error"]
+    if r.kind == "rows":
+        return f"{r.value:,} rows"
+    if r.kind == "coverage":
+        ratio = "n/a" if r.value is None else f"{r.value:.1%}"
+        return f"{r.detail['matched']:,}/{r.detail['total']:,} ({ratio})"
+    text = f"{r.value:,} violating rows"
+    if r.kind == "range":
+        text += f" (min {r.detail['min']}, max {r.detail['max']})"
+    return text
+
+
+def report(results: list[Result], st=None) -> None:
+    """Print one line per result; record them in the stage's run metrics when `st` is given."""
+    tags = {"pass": "[check]", "info": "[check]", "warn": "[warn]", "fail": "[fail]"}
+    for r in results:
+        print(f"{tags[r.status]} {r.name}: {describe(r)}")
+    if st is not None:
+        st.checks([r.to_dict() for r in results])
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Run the data-quality checks against the warehouse.")
+    ap.add_argument("--set", action="append", choices=list(CHECK_SETS), dest="sets",
+                    help="check set to run (repeatable; default all)")
+    ap.add_argument("--workers", type=int, default=None, help="tables checked in parallel (default: one per CPU)")
+    ap.add_argument("--json", type=Path, help="also write the results here")
+    args = ap.parse_args()
+
+    if not DB.exists():
+        raise FileNotFoundError(f"Missing warehouse DB: {DB}")
+    checks = [c for s in (args.sets or CHECK_SETS) for c in CHECK_SETS[s]]
+    t0 = time.perf_counter()
+    results = run(DB, checks, args.workers)
+    report(results)
+    passes = len(_by_table(checks))
+    print(f"[info] {len(results)} check(s) in {passes} table pass(es), {time.perf_counter() - t0:.2f}s")
+    if args.json:
+        args.json.write_text(json.dumps([r.to_dict() for r in results], indent=2), encoding="utf-8")
+    if failures(results):
+        sys.exit(f"[fail] {len(failures(results))} check(s) failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+# scripts/query_service.py
+"""
+Read API over the warehouse marts for notebooks and dashboards: pooled
+read-only connections, fixed parameterized queries and an LRU result cache.
+
+  artist           one artist's critics-vs-streams row     (mart_artist_critics_vs_streams,
+                   name matched ignoring ASCII case)
+  top_divergence   artists whose critic and streaming ranks disagree most
+  years            per-year review / coverage figures      (cube_review_rollup, pub_year set)
+
+Connections are opened read-only (mode=ro, query_only) with a large mmap and
+page cache, and handed out from a pool. Each query has fixed SQL text, so every
+pooled connection prepares it once and then reuses the statement from its
+statement cache. Results are cached by (query, parameters) in an LRU and served
+without touching SQLite until the warehouse generation changes: the cache is
+keyed on the file's identity (inode, size, mtime, and those of its -wal), so a
+published shadow build (a new file swapped in by rename) or an in-place write
+both empty it, and connections to a replaced file are closed rather than reused.
+
+Divergence is the artist's critic percentile minus their streams percentile
+among artists with at least `min_reviews` reviews and `min_tracks` tracks:
+positive = acclaimed but little streamed ("underrated"), negative = the reverse.
+
+HTTP (optional, standard library only): GET /artist?name=..., /top_divergence?
+n=20&direction=underrated, /years?start=2000&end=2010, /stats. `serve()` runs
+it in the foreground; `stand_in()` starts one on a free local port in a
+background thread, for tests and dashboard development.
+
+Usage:
+  python scripts/query_service.py top_divergence --param n=10 --param direction=overrated
+  python scripts/query_service.py artist --param "name=bon iver"
+  python scripts/query_service.py --serve --port 8765
+  python scripts/query_service.py --bench 2000
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qsl, urlparse
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import warehouse
+
+DB = warehouse.db_path(Path("data/processed/vinyl_dw.sqlite"))
+
+POOL_SIZE = 4
+CACHE_ENTRIES = 1024
+READ_PRAGMAS = [
+    "PRAGMA query_only=ON;",
+    "PRAGMA mmap_size=268435456;",    # 256 MB: pages are read straight from the OS page cache
+    "PRAGMA cache_size=-65536;",      # 64 MB per connection
+    "PRAGMA temp_store=MEMORY;",
+]
+
+CVS_COLS = """artist, review_count, avg_score, min_score, max_score, first_review_year, last_review_year,
+       track_count, total_streams, avg_streams_per_track, total_yt_views, avg_yt_views_per_track,
+       total_yt_likes, total_yt_comments, avg_danceability, avg_energy, avg_valence"""
+
+
+def _direction(value: str) -> str:
+    if value not in ("underrated", "overrated"):
+        raise ValueError(f"direction must be 'underrated' or 'overrated', got {value!r}")
+    return value
+
+
+@dataclass(frozen=True)
+class Query:
+    sql: str
+    params: tuple[str, ...]            # bound in this order
+    defaults: dict
+    types: dict
+
+
+QUERIES = {
+    "artist": Query(
+        # Served by ix_mart_cvs_artist_nocase (create_marts.sql)
+        f"SELECT {CVS_COLS} FROM mart_artist_critics_vs_streams WHERE artist = ? COLLATE NOCASE ORDER BY artist",
+        ("name",), {}, {"name": str},
+    ),
+    "top_divergence": Query(
+        """
+        WITH ranked AS (
+          SELECT artist, review_count, avg_score, track_count, total_streams,
+                 PERCENT_RANK() OVER (ORDER BY avg_score)
+                   - PERCENT_RANK() OVER (ORDER BY total_streams) AS divergence
+          FROM mart_artist_critics_vs_streams
+          WHERE avg_score IS NOT NULL AND total_streams > 0
+            AND review_count >= ? AND track_count >= ?
+        )
+        SELECT artist, review_count, avg_score, track_count, total_streams, ROUND(divergence, 4) AS divergence
+        FROM ranked
+        ORDER BY CASE WHEN ? = 'overrated' THEN divergence ELSE -divergence END, artist
+        LIMIT ?
+        """,
+        ("min_reviews", "min_tracks", "direction", "n"),
+        {"min_reviews": 2, "min_tracks": 5, "direction": "underrated", "n": 20},
+        {"min_reviews": int, "min_tracks": int, "direction": _direction, "n": int},
+    ),
+    "years": Query(
+        """
+        SELECT pub_year, review_count, score_sum / NULLIF(scored_count, 0) AS avg_score,
+               mapped_review_count, streams_sum, artist_count, mapped_artist_count,
+               ROUND(1.0 * mapped_artist_count / NULLIF(artist_count, 0), 3) AS pct_mapped
+        FROM cube_review_rollup
+        WHERE dims_mask = 1 AND pub_year BETWEEN ? AND ?
+        ORDER BY pub_year
+        """,
+        ("start", "end"),
+        {"start": 0, "end": 9999},
+        {"start": int, "end": int},
+    ),
+}
+
+
+@dataclass(frozen=True)
+class Result:
+    columns: tuple[str, ...]
+    rows: tuple[tuple, ...]
+
+    def records(self) -> list[dict]:
+        return [dict(zip(self.columns, r)) for r in self.rows]
+
+    def to_frame(self):
+        import pandas as pd
+        return pd.DataFrame(list(self.rows), columns=list(self.columns))
+
+
+def generation(db: Path) -> tuple:
+    """Identity of the warehouse contents: changes on publish (new inode) and on any write."""
+    out = []
+    for p in (db, Path(f"{db}-wal")):
+        try:
+            s = os.stat(p)
+            out.append((s.st_ino, s.st_size, s.st_mtime_ns))
+        except FileNotFoundError:
+            out.append(None)
+    return tuple(out)
+
+
+class ConnectionPool:
+    """Read-only connections to one warehouse file; ones opened on a replaced file are dropped."""
+
+    def __init__(self, db: Path, size: int = POOL_SIZE):
+        self.db = Path(db)
+        self.size = size
+        self.idle: queue.LifoQueue = queue.LifoQueue()
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    def _open(self) -> tuple[sqlite3.Connection, int]:
+        inode = os.stat(self.db).st_ino          # which file (generation) the connection reads
+        con = sqlite3.connect(self.db.resolve().as_uri() + "?mode=ro", uri=True,
+                              check_same_thread=False, cached_statements=256)
+        for p in READ_PRAGMAS:
+            con.execute(p)
+        return con, inode
+
+    def _discard(self, con: sqlite3.Connection) -> None:
+        con.close()
+        with self.lock:
+            self.opened -= 1
+
+    def _checkout(self) -> tuple[sqlite3.Connection, int]:
+        while True:
+            try:
+                con, inode = self.idle.get_nowait()
+            except queue.Empty:
+                with self.lock:
+                    grow = self.opened < self.size
+                    if grow:
+                        self.opened += 1
+                if grow:
+                    return self._open()
+                try:
+                    # Timeout: a busy connection on a replaced file is closed, not returned
+                    con, inode = self.idle.get(timeout=0.05)
+                except queue.Empty:
+                    continue
+            if inode == os.stat(self.db).st_ino:
+                return con, inode
+            self._discard(con)              # opened on a file that has since been replaced
+
+    @contextmanager
+    def connection(self):
+        con, inode = self._checkout()
+        try:
+            yield con
+        finally:
+            if inode == os.stat(self.db).st_ino:
+                self.idle.put((con, inode))
+            else:
+                self._discard(con)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self.idle.get_nowait()[0].close()
+            except queue.Empty:
+                break
+            with self.lock:
+                self.opened -= 1
+
+
+class QueryService:
+    def __init__(self, db: Path = DB, pool_size: int = POOL_SIZE, cache_entries: int = CACHE_ENTRIES):
+        if not Path(db).exists():
+            raise FileNotFoundError(f"Missing warehouse DB: {db}")
+        self.db = Path(db)
+        self.pool = ConnectionPool(self.db, pool_size)
+        self.cache_entries = cache_entries
+        self.cache: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.gen = generation(self.db)
+        self.hits = self.misses = self.invalidations = 0
+
+    def _bind(self, name: str, params: dict) -> tuple:
+        if name not in QUERIES:
+            raise KeyError(f"Unknown query {name!r}; expected one of {sorted(QUERIES)}")
+        q = QUERIES[name]
+        unknown = set(params) - set(q.params)
+        if unknown:
+            raise ValueError(f"{name}: unknown parameter(s) {sorted(unknown)}; expected {list(q.params)}")
+        args = {**q.defaults, **params}
+        missing = [p for p in q.params if p not in args]
+        if missing:
+            raise ValueError(f"{name}: missing parameter(s) {missing}")
+        return tuple(q.types[p](args[p]) for p in q.params)
+
+    def query(self, name: str, /, **params) -> Result:
+        """Run a named query (cached until the warehouse changes)."""
+        args = self._bind(name, params)
+        key = (name, args)
+        gen = generation(self.db)
+        with self.lock:
+            if gen != self.gen:
+                self.cache.clear()
+                self.gen = gen
+                self.invalidations += 1
+            hit = self.cache.get(key)
+            if hit is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return hit
+            self.misses += 1
+
+        with self.pool.connection() as con:
+            cur = con.execute(QUERIES[name].sql, args)
+            result = Result(tuple(d[0] for d in cur.description), tuple(cur.fetchall()))
+        with self.lock:
+            if gen == self.gen:
+                self.cache[key] = result
+                if len(self.cache) > self.cache_entries:
+                    self.cache.popitem(last=False)
+        return result
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "invalidations": self.invalidations,
+                    "cached": len(self.cache), "connections": self.pool.opened}
+
+    def close(self) -> None:
+        self.pool.close()
+
+
+def _handler(service: QueryService):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            name = url.path.strip("/")
+            try:
+                if name == "stats":
+                    body, status = service.stats(), 200
+                else:
+                    r = service.query(name, **dict(parse_qsl(url.query)))
+                    body, status = {"columns": r.columns, "rows": r.rows}, 200
+            except KeyError as e:
+                body, status = {"error": e.args[0]}, 404
+            except (ValueError, sqlite3.Error) as e:
+                body, status = {"error": str(e)}, 400
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(service: QueryService, host: str = "127.0.0.1", port: int = 8765) -> None:
+    server = ThreadingHTTPServer((host, port), _handler(service))
+    print(f"[ok] serving {service.db} on http://{host}:{server.server_port}/ (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+@contextmanager
+def stand_in(service: QueryService | None = None, db: Path = DB):
+    """The HTTP endpoint on a free local port in a background thread; yields its base URL."""
+    own = service is None
+    service = service or QueryService(db)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(service))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+        if own:
+            service.close()
+
+
+def bench(service: QueryService, n: int) -> None:
+    calls = [("top_divergence", {}), ("top_divergence", {"direction": "overrated"}),
+             ("years", {"start": 2000, "end": 2010})]
+    first = service.query("top_divergence", n=1).rows
+    if first:
+        calls.append(("artist", {"name": first[0][0]}))
+    for name, params in calls:
+        t0 = time.perf_counter()
+        service.query(name, **params)
+        cold = time.perf_counter() - t0
+        times = []
+        for _ in range(n):
+            t0 = time.perf_counter()
+            service.query(name, **params)
+            times.append(time.perf_counter() - t0)
+        times.sort()
+        p50, p99 = times[len(times) // 2], times[min(len(times) - 1, int(len(times) * 0.99))]
+        print(f"[bench] {name} {params}: cold {cold * 1000:.2f} ms | cached p50 {p50 * 1e6:.1f} us, "
+              f"p99 {p99 * 1e6:.1f} us")
+    print(f"[info] {service.stats()}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Cached, pooled read queries over the warehouse marts.")
+    ap.add_argument("query", nargs="?", choices=sorted(QUERIES))
+    ap.add_argument("--param", action="append", default=[], metavar="NAME=VALUE")
+    ap.add_argument("--serve", action="store_true", help="serve the queries over HTTP")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--bench", type=int, metavar="N", help="time N repeated calls of each query")
+    args = ap.parse_args()
+    if not (args.query or args.serve or args.bench):
+        ap.error("give a query, --serve or --bench")
+
+    service = QueryService(DB)
+    if args.serve:
+        serve(service, args.host, args.port)
+        return
+    try:
+        if args.bench:
+            bench(service, args.bench)
+        if args.query:
+            params = dict(p.split("=", 1) for p in args.param)
+            t0 = time.perf_counter()
+            r = service.query(args.query, **params)
+            elapsed = time.perf_counter() - t0
+            print(r.to_frame().to_string(index=False))
+            print(f"[info] {len(r.rows):,} row(s) in {elapsed * 1000:.1f} ms")
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
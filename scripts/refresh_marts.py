@@ -0,0 +1,245 @@
+# scripts/refresh_marts.py
+"""
+Materialize the critics-vs-streams marts and keep them fresh incrementally.
+
+Full refresh: rebuild mart_artist_summary, mart_artist_streams and
+mart_artist_critics_vs_streams from the star schema the views read
+(fact_review_artist, fact_artist_streams, dim_artist, dim_spotify_artist), then
+install change-capture triggers on fact_review_artist, pitchfork_reviews and
+fact_artist_streams.
+
+Incremental refresh: collect the spotify_artist_keys touched since the last refresh
+  - review-artist / review / artist-streams rows written in place (logged by the triggers),
+  - dim_artist mappings that changed (diffed against a snapshot),
+and recompute only those artists' rows. If a base table was replaced wholesale
+(its triggers are gone), the change log can't be trusted and a full refresh runs.
+"""
+from pathlib import Path
+from datetime import datetime, timezone
+import argparse
+import sqlite3
+import time
+
+import instrument
+import warehouse
+
+DB = warehouse.db_path(Path("data/processed/vinyl_dw.sqlite"))
+MARTS_SQL = Path("sql/dw/create_marts.sql")
+
+# (table, source tag, key column) for change capture
+TRACKED = [
+    ("fact_review_artist", "artist_key", "artist_key"),
+    ("pitchfork_reviews", "reviewid", "reviewid"),
+    ("fact_artist_streams", "spotify_artist_key", "spotify_artist_key"),
+]
+
+# {where} is empty for a full refresh, or restricts to temp.mart_touched
+SUMMARY_SQL = """
+INSERT INTO mart_artist_summary
+SELECT
+  dsa.artist                      AS artist,
+  COUNT(DISTINCT pr.reviewid)     AS review_count,
+  AVG(pr.score)                   AS avg_score,
+  MIN(pr.score)                   AS min_score,
+  MAX(pr.score)                   AS max_score,
+  MIN(pr.pub_year)                AS first_review_year,
+  MAX(pr.pub_year)                AS last_review_year,
+  dsa.spotify_artist_key
+FROM dim_artist AS da
+JOIN dim_spotify_artist AS dsa ON dsa.spotify_artist_key = da.spotify_artist_key
+JOIN fact_review_artist AS fra ON fra.artist_key = da.artist_key
+JOIN pitchfork_reviews AS pr ON pr.reviewid = fra.reviewid
+WHERE da.spotify_artist_key IS NOT NULL {where}
+GROUP BY dsa.spotify_artist_key;
+"""
+
+STREAMS_SQL = """
+INSERT INTO mart_artist_streams
+SELECT
+  dsa.artist, fas.track_count, fas.total_streams, fas.avg_streams_per_track,
+  fas.total_yt_views, fas.avg_yt_views_per_track, fas.total_yt_likes, fas.total_yt_comments,
+  fas.avg_danceability, fas.avg_energy, fas.avg_valence,
+  fas.spotify_artist_key
+FROM fact_artist_streams AS fas
+JOIN dim_spotify_artist AS dsa ON dsa.spotify_artist_key = fas.spotify_artist_key
+WHERE 1 {where};
+"""
+
+CVS_SQL = """
+INSERT INTO mart_artist_critics_vs_streams
+SELECT
+  c.artist, c.review_count, c.avg_score, c.min_score, c.max_score,
+  c.first_review_year, c.last_review_year,
+  s.track_count, s.total_streams, s.avg_streams_per_track,
+  s.total_yt_views, s.avg_yt_views_per_track, s.total_yt_likes, s.total_yt_comments,
+  s.avg_danceability, s.avg_energy, s.avg_valence,
+  c.spotify_artist_key
+FROM mart_artist_summary AS c
+LEFT JOIN mart_artist_streams AS s ON s.spotify_artist_key = c.spotify_artist_key
+WHERE 1 {where};
+"""
+
+MARTS = [
+    ("mart_artist_summary", SUMMARY_SQL, "da.spotify_artist_key"),
+    ("mart_artist_streams", STREAMS_SQL, "fas.spotify_artist_key"),
+    ("mart_artist_critics_vs_streams", CVS_SQL, "c.spotify_artist_key"),
+]
+
+
+def trigger_names(table: str) -> list[str]:
+    return [f"trg_mart_{table}_{op}" for op in ("ins", "upd", "del")]
+
+
+def drop_outdated(con: sqlite3.Connection) -> bool:
+    """
+    Drop marts (and their dim_artist snapshot) built by the older refresh that
+    keyed them on Spotify artist names. Returns True if anything was dropped.
+    """
+    cols = {r[1] for r in con.execute("PRAGMA table_info(mart_artist_summary)")}
+    if not cols or "spotify_artist_key" in cols:
+        return False
+    for mart, _, _ in MARTS:
+        con.execute(f"DROP TABLE IF EXISTS {mart}")
+    con.execute("DROP TABLE IF EXISTS mart_dim_artist_snapshot")
+    return True
+
+
+def install_triggers(con: sqlite3.Connection) -> None:
+    # Triggers on tables the marts no longer read from would only add noise to mart_changes
+    current = {name for table, _, _ in TRACKED for name in trigger_names(table)}
+    triggers = con.execute("SELECT name FROM sqlite_master WHERE type='trigger' AND name LIKE 'trg_mart_%'")
+    for (name,) in triggers.fetchall():
+        if name not in current:
+            con.execute(f"DROP TRIGGER {name}")
+    for table, src, col in TRACKED:
+        ins, upd, dele = trigger_names(table)
+        con.executescript(f"""
+        CREATE TRIGGER IF NOT EXISTS {ins} AFTER INSERT ON {table} BEGIN
+          INSERT INTO mart_changes (src, key) VALUES ('{src}', NEW.{col});
+        END;
+        CREATE TRIGGER IF NOT EXISTS {upd} AFTER UPDATE ON {table} BEGIN
+          INSERT INTO mart_changes (src, key) VALUES ('{src}', OLD.{col});
+          INSERT INTO mart_changes (src, key) VALUES ('{src}', NEW.{col});
+        END;
+        CREATE TRIGGER IF NOT EXISTS {dele} AFTER DELETE ON {table} BEGIN
+          INSERT INTO mart_changes (src, key) VALUES ('{src}', OLD.{col});
+        END;
+        """)
+
+
+def needs_full(con: sqlite3.Connection) -> str | None:
+    """Reason a full refresh is required, or None if an incremental one is safe."""
+    if con.execute("SELECT COUNT(*) FROM mart_refresh_log").fetchone()[0] == 0:
+        return "no previous refresh"
+    existing = {r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type='trigger'")}
+    for table, _, _ in TRACKED:
+        if not set(trigger_names(table)) <= existing:
+            return f"{table} was replaced since the last refresh"
+    return None
+
+
+def collect_touched(con: sqlite3.Connection, max_seq: int) -> None:
+    """Fill temp.mart_touched with the Spotify artist keys whose mart rows must be recomputed."""
+    con.execute("DROP TABLE IF EXISTS temp.mart_touched")
+    con.execute("CREATE TEMP TABLE mart_touched (spotify_artist_key INTEGER PRIMARY KEY)")
+    con.execute("""
+        INSERT OR IGNORE INTO mart_touched
+        SELECT key FROM mart_changes WHERE src = 'spotify_artist_key' AND seq <= ? AND key IS NOT NULL
+    """, (max_seq,))
+    con.execute("""
+        INSERT OR IGNORE INTO mart_touched
+        SELECT da.spotify_artist_key
+        FROM mart_changes AS ch
+        JOIN dim_artist AS da ON da.artist_key = ch.key
+        WHERE ch.src = 'artist_key' AND ch.seq <= ? AND da.spotify_artist_key IS NOT NULL
+    """, (max_seq,))
+    con.execute("""
+        INSERT OR IGNORE INTO mart_touched
+        SELECT da.spotify_artist_key
+        FROM mart_changes AS ch
+        JOIN fact_review_artist AS fra ON fra.reviewid = ch.key
+        JOIN dim_artist AS da ON da.artist_key = fra.artist_key
+        WHERE ch.src = 'reviewid' AND ch.seq <= ? AND da.spotify_artist_key IS NOT NULL
+    """, (max_seq,))
+    # Mapping changes: old and new Spotify artists are both affected
+    for a, b in (("dim_artist", "mart_dim_artist_snapshot"), ("mart_dim_artist_snapshot", "dim_artist")):
+        con.execute(f"""
+            INSERT OR IGNORE INTO mart_touched
+            SELECT spotify_artist_key FROM (
+              SELECT artist_key, spotify_artist_key FROM {a}
+              EXCEPT
+              SELECT artist_key, spotify_artist_key FROM {b}
+            )
+            WHERE spotify_artist_key IS NOT NULL
+        """)
+
+
+def refresh(con: sqlite3.Connection, full: bool) -> None:
+    t0 = time.perf_counter()
+    outdated = drop_outdated(con)
+    con.executescript(MARTS_SQL.read_text(encoding="utf-8"))
+
+    reason = "requested" if full else "mart layout changed" if outdated else needs_full(con)
+    full = reason is not None
+    max_seq = con.execute("""
+        SELECT COALESCE((SELECT MAX(seq) FROM mart_changes),
+                        (SELECT MAX(change_seq) FROM mart_refresh_log), 0)
+    """).fetchone()[0]
+
+    con.execute("BEGIN")
+    try:
+        if full:
+            print(f"[info] full refresh ({reason})")
+            for mart, sql, _ in MARTS:
+                con.execute(f"DELETE FROM {mart}")
+                con.execute(sql.format(where=""))
+            touched = con.execute("SELECT COUNT(*) FROM mart_artist_critics_vs_streams").fetchone()[0]
+        else:
+            collect_touched(con, max_seq)
+            touched = con.execute("SELECT COUNT(*) FROM temp.mart_touched").fetchone()[0]
+            print(f"[info] incremental refresh: {touched:,} artists touched")
+            for mart, sql, col in MARTS:
+                con.execute(f"DELETE FROM {mart} WHERE spotify_artist_key IN "
+                            "(SELECT spotify_artist_key FROM temp.mart_touched)")
+                con.execute(sql.format(where=f"AND {col} IN (SELECT spotify_artist_key FROM temp.mart_touched)"))
+
+        con.execute("DELETE FROM mart_changes WHERE seq <= ?", (max_seq,))
+        con.execute("DELETE FROM mart_dim_artist_snapshot")
+        con.execute("INSERT INTO mart_dim_artist_snapshot SELECT artist_key, spotify_artist_key FROM dim_artist")
+        con.execute("""
+            INSERT INTO mart_refresh_log (refreshed_at, mode, change_seq, artists_touched, seconds)
+            VALUES (?, ?, ?, ?, ?)
+        """, (datetime.now(tz=timezone.utc).isoformat(), "full" if full else "incremental",
+              max_seq, touched, time.perf_counter() - t0))
+        con.execute("COMMIT")
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+
+    if full:
+        install_triggers(con)
+
+    n = con.execute("SELECT COUNT(*) FROM mart_artist_critics_vs_streams").fetchone()[0]
+    print(f"[ok] marts refreshed in {time.perf_counter() - t0:.2f}s; "
+          f"mart_artist_critics_vs_streams has {n:,} rows (watermark seq={max_seq})")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build or incrementally refresh the critics-vs-streams marts.")
+    ap.add_argument("--full", action="store_true", help="rebuild every mart row")
+    args = ap.parse_args()
+    st = instrument.start("refresh_marts")
+
+    if not DB.exists():
+        raise FileNotFoundError(f"Missing warehouse DB: {DB}")
+    con = sqlite3.connect(DB, isolation_level=None)
+    try:
+        refresh(con, args.full)
+        n = con.execute("SELECT artists_touched FROM mart_refresh_log ORDER BY refresh_id DESC LIMIT 1").fetchone()[0]
+        st.rows(rows_out=n)
+    finally:
+        con.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+# scripts/review_cube.py
+"""
+Rollup cube of Pitchfork reviews over pub_year, genre, label and best_new_music.
+
+`build()` fills cube_review (one row per review: score, whether any of its
+artists maps to Spotify, and those artists' total streams) and then
+cube_review_rollup with every grouping set of the four dimensions, like
+GROUP BY GROUPING SETS (...) over the 16 subsets. Each grouping set is
+computed from the reviews rather than summed from a finer one: genres and
+labels are multi-valued, so a review tagged rock and pop would otherwise be
+counted twice in the genre-less totals.
+
+`query()` answers a slice - group-by dimensions plus filters - from the
+grouping set covering exactly those dimensions. Counts and sums are re-added
+when a filter keeps several years or best_new_music values (each review has
+one of each). A filter keeping several genres or labels that are not grouped
+by would double count, so that slice is computed from cube_review instead.
+Distinct artist counts are only returned when no re-adding was needed.
+
+The pipeline rebuilds the cube whenever one of its input tables changes.
+
+Usage:
+  python scripts/review_cube.py                                  # rebuild
+  python scripts/review_cube.py --by genre --by pub_year
+  python scripts/review_cube.py --by label --where genre=rock --where best_new_music=1
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import sqlite3
+import time
+
+import instrument
+import warehouse
+
+DB = warehouse.db_path(Path("data/processed/vinyl_dw.sqlite"))
+CUBE_SQL = Path("sql/dw/create_cube.sql")
+
+# dimension -> (bit in dims_mask, column expression over the review cell)
+DIMS = {
+    "pub_year": (1, "r.pub_year"),
+    "genre": (2, "g.genre"),
+    "label": (4, "l.label"),
+    "best_new_music": (8, "r.best_new_music"),
+}
+MULTI_VALUED = {"genre", "label"}
+
+ADDITIVE = ["review_count", "scored_count", "score_sum", "mapped_review_count", "streams_sum"]
+DISTINCT = ["artist_count", "mapped_artist_count"]
+
+REVIEW_SQL = """
+INSERT INTO cube_review (reviewid, pub_year, best_new_music, score, mapped, streams)
+WITH artist_streams AS (
+  SELECT spotify_artist_key, SUM(streams) AS streams
+  FROM fact_track
+  GROUP BY spotify_artist_key
+),
+review_streams AS (
+  SELECT rs.reviewid, SUM(ast.streams) AS streams
+  FROM (
+    SELECT DISTINCT fra.reviewid, da.spotify_artist_key
+    FROM fact_review_artist AS fra
+    JOIN dim_artist AS da ON da.artist_key = fra.artist_key
+    WHERE da.spotify_artist_key IS NOT NULL
+  ) AS rs
+  LEFT JOIN artist_streams AS ast ON ast.spotify_artist_key = rs.spotify_artist_key
+  GROUP BY rs.reviewid
+)
+SELECT pr.reviewid, pr.pub_year, pr.best_new_music, pr.score,
+       rs.reviewid IS NOT NULL, rs.streams
+FROM pitchfork_reviews AS pr
+LEFT JOIN review_streams AS rs ON rs.reviewid = pr.reviewid
+WHERE pr.reviewid IS NOT NULL
+  AND pr.rowid IN (SELECT MIN(rowid) FROM pitchfork_reviews GROUP BY reviewid)
+"""
+
+
+def mask_of(dims) -> int:
+    return sum(DIMS[d][0] for d in dims)
+
+
+def dims_of(mask: int) -> list[str]:
+    return [d for d, (bit, _) in DIMS.items() if mask & bit]
+
+
+def _filters(where: dict[str, list], qualified: bool = True) -> tuple[str, list]:
+    """
+    SQL conditions (ANDed, with a leading AND) and their parameters, over the
+    review cell columns, or over the plain dimension columns of the rollup.
+    """
+    sql, params = "", []
+    for d, values in where.items():
+        col = DIMS[d][1] if qualified else d
+        vals = [v for v in values if v is not None]
+        terms = []
+        if vals:
+            terms.append(f"{col} IN ({', '.join('?' * len(vals))})")
+            params += vals
+        if len(vals) < len(values):
+            terms.append(f"{col} IS NULL")
+        sql += f" AND ({' OR '.join(terms)})"
+    return sql, params
+
+
+def cells_sql(dims: list[str], where: dict[str, list] | None = None) -> tuple[str, list]:
+    """
+    Aggregate over cube_review grouped by `dims`, restricted by `where`. Each
+    review is counted once per cell, whatever its number of genres or labels.
+    """
+    where = where or {}
+    used = set(dims) | set(where)
+    joins = ""
+    if "genre" in used:
+        joins += " LEFT JOIN pitchfork_genres AS g ON g.reviewid = r.reviewid"
+    if "label" in used:
+        joins += " LEFT JOIN pitchfork_labels AS l ON l.reviewid = r.reviewid"
+    cond, params = _filters(where)
+    cols = ", ".join(f"{DIMS[d][1]} AS {d}" for d in dims)
+    keys = ", ".join(f"cell.{d}" for d in dims)
+    group = f"GROUP BY {keys}" if dims else ""
+    on = " AND ".join(f"a.{d} IS m.{d}" for d in dims) or "1"
+
+    sql = f"""
+    WITH cell AS (
+      SELECT DISTINCT r.reviewid{', ' + cols if dims else ''}
+      FROM cube_review AS r{joins}
+      WHERE 1{cond}
+    ),
+    m AS (
+      SELECT {keys + ', ' if dims else ''}
+             COUNT(*)             AS review_count,
+             COUNT(r.score)       AS scored_count,
+             SUM(r.score)         AS score_sum,
+             SUM(r.mapped)        AS mapped_review_count,
+             SUM(r.streams)       AS streams_sum
+      FROM cell JOIN cube_review AS r ON r.reviewid = cell.reviewid
+      {group}
+    ),
+    a AS (
+      SELECT {keys + ', ' if dims else ''}
+             COUNT(DISTINCT fra.artist_key) AS artist_count,
+             COUNT(DISTINCT CASE WHEN da.spotify_artist_key IS NOT NULL THEN fra.artist_key END)
+                                            AS mapped_artist_count
+      FROM cell
+      JOIN fact_review_artist AS fra ON fra.reviewid = cell.reviewid
+      JOIN dim_artist AS da ON da.artist_key = fra.artist_key
+      {group}
+    )
+    SELECT {', '.join(f'm.{d}' for d in dims) + ', ' if dims else ''}
+           m.review_count, m.scored_count, m.score_sum, m.mapped_review_count, m.streams_sum,
+           COALESCE(a.artist_count, 0) AS artist_count,
+           COALESCE(a.mapped_artist_count, 0) AS mapped_artist_count
+    FROM m LEFT JOIN a ON {on}
+    WHERE m.review_count > 0
+    """
+    return sql, params
+
+
+def build(con: sqlite3.Connection) -> dict[int, int]:
+    """Rebuild cube_review and every grouping set. Returns {dims_mask: rows}."""
+    con.executescript(CUBE_SQL.read_text(encoding="utf-8"))
+    con.execute("DELETE FROM cube_review")
+    con.execute("DELETE FROM cube_review_rollup")
+    con.execute(REVIEW_SQL)
+    rows = {}
+    for mask in range(1 << len(DIMS)):
+        dims = dims_of(mask)
+        sql, params = cells_sql(dims)
+        dim_cols = ", ".join(d if d in dims else "NULL" for d in DIMS)
+        rows[mask] = con.execute(f"""
+            INSERT INTO cube_review_rollup
+            SELECT {mask}, {dim_cols}, {', '.join(ADDITIVE + DISTINCT)} FROM ({sql})
+        """, params).rowcount
+    return rows
+
+
+def query(con: sqlite3.Connection, by=(), where: dict | None = None):
+    """
+    A slice of the cube as a DataFrame: one row per combination of the `by`
+    dimensions, restricted by `where` ({dimension: value or list of values,
+    None matching a missing value}), with the counts, sums and avg_score.
+    """
+    import pandas as pd
+
+    by = list(by)
+    where = {d: list(v) if isinstance(v, (list, tuple, set)) else [v] for d, v in (where or {}).items()}
+    unknown = (set(by) | set(where)) - set(DIMS)
+    if unknown:
+        raise ValueError(f"Unknown dimension(s) {sorted(unknown)}; expected some of {list(DIMS)}")
+
+    folded = [d for d, v in where.items() if d not in by and len(v) > 1]
+    if any(d in MULTI_VALUED for d in folded):
+        # Re-adding genre/label rows would count multi-tagged reviews more than once
+        sql, params = cells_sql(by, where)
+        out = pd.read_sql_query(sql, con, params=params)
+    else:
+        cond, params = _filters(where, qualified=False)
+        measures = ", ".join(f"SUM({m}) AS {m}" for m in ADDITIVE)
+        if folded:
+            measures += ", " + ", ".join(f"NULL AS {m}" for m in DISTINCT)
+        else:
+            measures += ", " + ", ".join(f"MAX({m}) AS {m}" for m in DISTINCT)
+        group = f"GROUP BY {', '.join(by)} ORDER BY {', '.join(by)}" if by else ""
+        out = pd.read_sql_query(f"""
+            SELECT {', '.join(by) + ', ' if by else ''}{measures}
+            FROM cube_review_rollup
+            WHERE dims_mask = ?{cond}
+            {group}
+        """, con, params=[mask_of(set(by) | set(where)), *params])
+        out = out[out["review_count"].notna()]
+    out["avg_score"] = out["score_sum"] / out["scored_count"].where(out["scored_count"] > 0)
+    return out.reset_index(drop=True)
+
+
+def _parse_where(items: list[str]) -> dict[str, list]:
+    where: dict[str, list] = {}
+    for item in items:
+        d, _, raw = item.partition("=")
+        if d not in DIMS or not _:
+            raise SystemExit(f"--where expects <dimension>=<value>, got {item!r}")
+        value = None if raw == "" else int(float(raw)) if d in ("pub_year", "best_new_music") else raw
+        where.setdefault(d, []).append(value)
+    return where
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Build the review rollup cube, or query a slice of it.")
+    ap.add_argument("--by", action="append", default=[], choices=list(DIMS), help="group by (repeatable)")
+    ap.add_argument("--where", action="append", default=[], metavar="DIM=VALUE",
+                    help="keep only these values (repeat a dimension for several; empty value = missing)")
+    args = ap.parse_args()
+
+    if not DB.exists():
+        raise FileNotFoundError(f"Missing warehouse DB: {DB}")
+    con = sqlite3.connect(DB)
+    try:
+        if args.by or args.where:
+            t0 = time.perf_counter()
+            out = query(con, args.by, _parse_where(args.where))
+            print(out.to_string(index=False))
+            print(f"[info] {len(out):,} row(s) in {(time.perf_counter() - t0) * 1000:.1f} ms")
+            return
+
+        st = instrument.start("review_cube")
+        t0 = time.perf_counter()
+        with con:
+            rows = build(con)
+        n_reviews = con.execute("SELECT COUNT(*) FROM cube_review").fetchone()[0]
+        st.rows(rows_in=n_reviews, rows_out=sum(rows.values()))
+        print(f"[ok] cube_review: {n_reviews:,} reviews | cube_review_rollup: {sum(rows.values()):,} rows "
+              f"in {len(rows)} grouping sets ({time.perf_counter() - t0:.2f}s)")
+        for mask, n in rows.items():
+            print(f"  {' x '.join(dims_of(mask)) or '(total)'}: {n:,}")
+    finally:
+        con.close()
+
+
+if __name__ == "__main__":
+    main()
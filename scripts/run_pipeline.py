@@ -0,0 +1,394 @@
+# scripts/run_pipeline.py
+"""
+Incremental runner for the ETL scripts.
+
+Stages are declared below in execution order, with the files and warehouse
+tables each one reads and writes. A stage is skipped when its key - a hash of
+its code (script plus the local modules it imports), its input file hashes and
+the lineage of its input tables - matches the last successful run and its
+outputs are still in place.
+
+  - File outputs are hashed after each run, so a stage that rewrites identical
+    bytes doesn't trigger its downstream stages.
+  - Warehouse tables aren't hashed; a table's fingerprint is the key of the stage
+    that last wrote it. A stage also reruns if another stage overwrote one of its
+    tables (stage_to_sqlite.py and load_reviews_and_bridge.py share two).
+  - File hashes are cached by (size, mtime), so a no-op run only stats files.
+  - The fingerprints are also stamped into the warehouse itself (dw_build, see
+    warehouse.py) before each stage runs, so outputs derived from it can tell
+    which build they came from. A table restamped there by a loader run outside
+    the pipeline (load_reviews_and_bridge.py --incremental) takes the new
+    fingerprint, so the stages reading it rerun; the stage that owns the table
+    does not.
+
+With --shadow the stages write to a copy of the warehouse instead of the live
+file (see warehouse.py). The copy is checked and then swapped in atomically;
+the stage state is only committed with it, so a build that fails its checks
+leaves both the live warehouse and the state untouched.
+
+Usage:
+  python scripts/run_pipeline.py                 # run whatever is stale
+  python scripts/run_pipeline.py --from match    # force `match` and everything downstream
+  python scripts/run_pipeline.py --only views    # run just `views`
+  python scripts/run_pipeline.py --dry-run       # show the plan
+  python scripts/run_pipeline.py --shadow        # build in a shadow file, check, then publish
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import time
+
+import warehouse
+
+SCRIPTS = Path("scripts")
+DB = Path("data/processed/vinyl_dw.sqlite")
+STATE = Path("data/processed/pipeline_state.json")
+
+INTERIM = Path("data/interim")
+PROCESSED = Path("data/processed")
+PF_TABLES = ["artists", "reviews", "genres", "labels", "years", "content"]
+
+
+@dataclass
+class Stage:
+    name: str
+    script: Path | None = None            # python script, run from the repo root
+    sql: Path | None = None               # or a SQL file executed against DB
+    inputs: list[Path] = field(default_factory=list)
+    outputs: list[Path] = field(default_factory=list)
+    table_inputs: list[str] = field(default_factory=list)
+    table_outputs: list[str] = field(default_factory=list)
+
+
+STAGES = [
+    Stage("extract", SCRIPTS / "extract_pitchfork.py",
+          inputs=[Path("data/raw/pitchfork/database.sqlite")],
+          outputs=[INTERIM / f"pitchfork_{t}.csv" for t in PF_TABLES]),
+    Stage("clean_spotify", SCRIPTS / "clean_spotify_youtube.py",
+          inputs=[Path("data/raw/spotify_youtube/Spotify_Youtube.csv")],
+          outputs=[INTERIM / "spotify_youtube_clean.csv", INTERIM / "spotify_artist_rollup.csv"]),
+    Stage("stage_reviews", SCRIPTS / "stage_reviews.py",
+          inputs=[INTERIM / "pitchfork_reviews.csv"],
+          outputs=[INTERIM / "pitchfork_reviews_typed.csv"]),
+    Stage("bridge", SCRIPTS / "make_review_artists_bridge.py",
+          inputs=[INTERIM / "pitchfork_reviews_typed.csv"],
+          outputs=[INTERIM / "pitchfork_review_artists.csv"]),
+    Stage("stage_to_sqlite", SCRIPTS / "stage_to_sqlite.py",
+          inputs=[INTERIM / f"pitchfork_{t}.csv" for t in PF_TABLES]
+                 + [INTERIM / "pitchfork_reviews_typed.csv", INTERIM / "pitchfork_review_artists.csv",
+                    INTERIM / "spotify_youtube_clean.csv", INTERIM / "spotify_artist_rollup.csv"],
+          table_outputs=[f"pitchfork_{t}" for t in PF_TABLES]
+                        + ["pitchfork_reviews_typed", "pitchfork_review_artists", "spotify_youtube_clean",
+                           "spotify_artist_rollup", "artist_search"]),
+    Stage("load_reviews", SCRIPTS / "load_reviews_and_bridge.py",
+          inputs=[INTERIM / "pitchfork_reviews_typed.csv", INTERIM / "pitchfork_review_artists.csv"],
+          table_outputs=["pitchfork_reviews", "pitchfork_review_artists", "artist_search"]),
+    Stage("universe", SCRIPTS / "build_artist_universe.py",
+          table_inputs=["pitchfork_review_artists"],
+          outputs=[PROCESSED / "artist_universe.csv"]),
+    Stage("match", SCRIPTS / "match_artists_offline.py",
+          inputs=[PROCESSED / "artist_universe.csv",
+                  Path("data/raw/spotify_attributes"), Path("data/raw/spotify_youtube")],
+          outputs=[PROCESSED / "artist_map.csv"]),
+    Stage("match_review_queue", SCRIPTS / "match_artists.py",
+          inputs=[INTERIM / "pitchfork_artists.csv", INTERIM / "spotify_youtube_clean.csv"],
+          outputs=[Path("data/overrides/artist_map.csv"), Path("data/overrides/artist_review_queue.csv")]),
+    Stage("dim_artist", SCRIPTS / "load_dim_artist.py",
+          inputs=[PROCESSED / "artist_map.csv"],
+          table_inputs=["pitchfork_review_artists", "spotify_youtube_clean", "spotify_artist_rollup"],
+          table_outputs=["dim_artist", "dim_artist_stage", "artist_search", "dim_spotify_artist",
+                         "fact_review_artist", "fact_track", "fact_artist_streams"]),
+    Stage("views", sql=Path("sql/dw/create_views.sql"),
+          table_outputs=["vw_review_with_artist", "vw_unmatched_artists", "vw_artist_coverage_by_year",
+                         "vw_artist_summary", "vw_artist_streams", "vw_artist_critics_vs_streams"]),
+    Stage("marts", SCRIPTS / "refresh_marts.py",
+          inputs=[Path("sql/dw/create_marts.sql")],
+          table_inputs=["pitchfork_reviews", "fact_review_artist", "fact_artist_streams", "dim_artist",
+                        "dim_spotify_artist"],
+          table_outputs=["mart_artist_summary", "mart_artist_streams", "mart_artist_critics_vs_streams"]),
+    Stage("cube", SCRIPTS / "review_cube.py",
+          inputs=[Path("sql/dw/create_cube.sql")],
+          table_inputs=["pitchfork_reviews", "pitchfork_genres", "pitchfork_labels",
+                        "fact_review_artist", "dim_artist", "fact_track"],
+          table_outputs=["cube_review", "cube_review_rollup"]),
+    Stage("snapshots", SCRIPTS / "snapshots.py",
+          table_inputs=["vw_artist_critics_vs_streams", "vw_artist_summary", "vw_artist_streams",
+                        "vw_artist_coverage_by_year", "fact_review_artist", "fact_artist_streams",
+                        "dim_artist", "dim_spotify_artist", "pitchfork_reviews"],
+          outputs=[PROCESSED / "snapshots" / f"{v}.arrow"
+                   for v in ("vw_artist_critics_vs_streams", "vw_artist_summary", "vw_artist_streams",
+                             "vw_artist_coverage_by_year")]),
+]
+BY_NAME = {s.name: s for s in STAGES}
+ORDER = {s.name: i for i, s in enumerate(STAGES)}
+
+
+def sha256_file(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def sha256_text(*parts: str) -> str:
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class Hasher:
+    """File/directory hashes, reusing the stored hash while (size, mtime_ns) is unchanged."""
+
+    def __init__(self, cache: dict):
+        self.cache = cache
+
+    def file(self, path: Path) -> str | None:
+        if not path.exists():
+            return None
+        if path.is_dir():
+            files = sorted(p for p in path.rglob("*") if p.is_file())
+            return sha256_text(*(f"{p.relative_to(path).as_posix()}={self.file(p)}" for p in files))
+        st = path.stat()
+        key = str(path)
+        hit = self.cache.get(key)
+        if hit and hit["size"] == st.st_size and hit["mtime_ns"] == st.st_mtime_ns:
+            return hit["sha256"]
+        digest = sha256_file(path)
+        self.cache[key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
+        return digest
+
+
+def resolve(path: Path) -> Path:
+    """
+    Same lookup as interim_io.resolve for interim/processed artifacts, without
+    importing pandas (that import alone would cost more than a no-op run).
+    """
+    if path.suffix != ".csv" or path.parts[:2] not in (("data", "interim"), ("data", "processed")):
+        return path
+    fmt = os.environ.get("VINYL_INTERIM_FORMAT", "parquet").strip().lower()
+    exts = [".parquet", ".csv", ".csv.gz", ".csv.zst"] if fmt == "parquet" else [".csv", ".csv.gz", ".csv.zst", ".parquet"]
+    for ext in exts:
+        if path.with_suffix(ext).exists():
+            return path.with_suffix(ext)
+    return path.with_suffix(exts[0])
+
+
+def local_imports(script: Path, seen: set[Path] | None = None) -> list[Path]:
+    """The script plus every sibling module it (transitively) imports."""
+    seen = seen if seen is not None else set()
+    if script in seen or not script.exists():
+        return []
+    seen.add(script)
+    out = [script]
+    for m in re.findall(r"^\s*(?:import|from)\s+(\w+)", script.read_text(encoding="utf-8"), flags=re.M):
+        out += local_imports(SCRIPTS / f"{m}.py", seen)
+    return out
+
+
+def stage_key(stage: Stage, hasher: Hasher, state: dict) -> tuple[str, dict]:
+    code = local_imports(stage.script) if stage.script else [stage.sql]
+    parts = {f"code:{p.as_posix()}": hasher.file(p) for p in code}
+    parts.update({f"in:{p.as_posix()}": hasher.file(resolve(p)) for p in stage.inputs})
+    parts.update({f"table:{t}": state["tables"].get(t, {}).get("fp") for t in stage.table_inputs})
+    key = sha256_text(*(f"{k}={v}" for k, v in sorted(parts.items())))
+    return key, parts
+
+
+def existing_tables() -> set[str]:
+    db = warehouse.db_path(DB)
+    if not db.exists():
+        return set()
+    # Closed explicitly: a connection left to the GC would keep the shadow file locked at publish time
+    con = sqlite3.connect(db)
+    try:
+        return {r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type IN ('table','view')")}
+    finally:
+        con.close()
+
+
+def stale_reason(stage: Stage, key: str, hasher: Hasher, state: dict, tables: set[str]) -> str | None:
+    prev = state["stages"].get(stage.name)
+    if prev is None:
+        return "never run"
+    if prev["key"] != key:
+        return "inputs or code changed"
+    for p in stage.outputs:
+        if hasher.file(resolve(p)) != prev["outputs"].get(p.as_posix()):
+            return f"output {p} missing or modified"
+    for t in stage.table_outputs:
+        if t not in tables:
+            return f"table {t} missing"
+        owner = state["tables"].get(t, {})
+        # Updated in place since this stage wrote it: still its output, just newer
+        if owner.get("writer") == stage.name and (owner.get("fp") == key or owner.get("restamped")):
+            continue
+        # A later stage replacing the table is expected (load_reviews over stage_to_sqlite)
+        if owner.get("writer") not in ORDER or ORDER[owner["writer"]] <= ORDER[stage.name]:
+            return f"table {t} was overwritten by {owner.get('writer')}"
+    return None
+
+
+def dependents(name: str) -> set[str]:
+    """Stages downstream of `name` (by files, tables, or a later write to the same table)."""
+    out, frontier = {name}, [name]
+    while frontier:
+        up = BY_NAME[frontier.pop()]
+        produced = {p.as_posix() for p in up.outputs}
+        idx = STAGES.index(up)
+        for s in STAGES[idx + 1:]:
+            if s.name in out:
+                continue
+            if (produced & {p.as_posix() for p in s.inputs}
+                    or set(up.table_outputs) & set(s.table_inputs + s.table_outputs)):
+                out.add(s.name)
+                frontier.append(s.name)
+    return out
+
+
+def run_stage(stage: Stage) -> None:
+    if stage.sql is not None:
+        con = sqlite3.connect(warehouse.db_path(DB))
+        try:
+            with con:
+                con.executescript(stage.sql.read_text(encoding="utf-8"))
+        finally:
+            con.close()
+        return
+    subprocess.run([sys.executable, str(stage.script)], check=True)
+
+
+def load_state() -> dict:
+    if STATE.exists():
+        with STATE.open("r", encoding="utf-8") as f:
+            state = json.load(f)
+    else:
+        state = {}
+    for k in ("files", "stages", "tables"):
+        state.setdefault(k, {})
+    return state
+
+
+def stamp_build(state: dict) -> None:
+    """Keep the warehouse's dw_build stamp in step with the table fingerprints in `state`."""
+    db = warehouse.db_path(DB)
+    if db.exists():
+        warehouse.stamp_build(db, {t: v["fp"] for t, v in state["tables"].items()})
+
+
+def adopt_restamped(state: dict) -> list[str]:
+    """Take over the fingerprints of tables restamped in the warehouse since the last run."""
+    stamp = warehouse.build_stamp(warehouse.db_path(DB))
+    changed = sorted(t for t, fp in stamp.items() if t in state["tables"] and state["tables"][t]["fp"] != fp)
+    for t in changed:
+        state["tables"][t].update(fp=stamp[t], restamped=True)
+    return changed
+
+
+def save_state(state: dict, path: Path = STATE) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Run the ETL stages whose inputs changed.")
+    g = ap.add_mutually_exclusive_group()
+    g.add_argument("--from", dest="from_", choices=list(BY_NAME), help="force this stage and its dependents")
+    g.add_argument("--only", choices=list(BY_NAME), help="run just this stage")
+    ap.add_argument("--force", action="store_true", help="rerun every stage")
+    ap.add_argument("--dry-run", action="store_true", help="print the plan without running anything")
+    ap.add_argument("--shadow", action="store_true",
+                    help="build into a shadow copy of the warehouse, check it, then swap it in atomically")
+    args = ap.parse_args()
+
+    t_start = time.perf_counter()
+    state = load_state()
+    hasher = Hasher(state["files"])
+    live = warehouse.db_path(DB)
+    state_path = STATE
+    if args.shadow and not args.dry_run:
+        shadow = warehouse.start_shadow(live)
+        os.environ["VINYL_DW_PATH"] = str(shadow)      # inherited by every stage
+        state_path = STATE.with_name(f"{STATE.stem}.shadow{STATE.suffix}")
+        print(f"[info] shadow build in {shadow}")
+    tables = existing_tables()
+    restamped = adopt_restamped(state)
+    if restamped:
+        print(f"[info] written outside the pipeline since its last run: {', '.join(restamped)}")
+
+    if args.only:
+        selected, forced = [BY_NAME[args.only]], {args.only}
+    elif args.from_:
+        start = STAGES.index(BY_NAME[args.from_])
+        selected, forced = STAGES[start:], dependents(args.from_)
+    else:
+        selected, forced = STAGES, set(BY_NAME) if args.force else set()
+
+    # Groups the stages' metrics into one run manifest (see instrument.py)
+    os.environ.setdefault("VINYL_RUN_ID", datetime.now(tz=timezone.utc).strftime("%Y%m%dT%H%M%SZ"))
+
+    ran = 0
+    for stage in selected:
+        key, parts = stage_key(stage, hasher, state)
+        reason = "forced" if stage.name in forced else stale_reason(stage, key, hasher, state, tables)
+        if reason is None:
+            print(f"[skip] {stage.name}: up to date")
+            continue
+        print(f"[run] {stage.name}: {reason}")
+        if args.dry_run:
+            ran += 1
+            continue
+
+        t0 = time.perf_counter()
+        stamp_build(state)      # stages reading the warehouse see the build they read from
+        run_stage(stage)
+        ran += 1
+        state["stages"][stage.name] = {
+            "key": key,
+            "inputs": parts,
+            "outputs": {p.as_posix(): hasher.file(resolve(p)) for p in stage.outputs},
+            "ran_at": datetime.now(tz=timezone.utc).isoformat(),
+            "seconds": round(time.perf_counter() - t0, 3),
+        }
+        for t in stage.table_outputs:
+            state["tables"][t] = {"writer": stage.name, "fp": key}
+        tables = existing_tables()
+        save_state(state, state_path)
+        print(f"[ok] {stage.name} finished in {time.perf_counter() - t0:.2f}s")
+
+    if not args.dry_run:
+        save_state(state, state_path)
+        if ran:
+            stamp_build(state)
+    if args.shadow and not args.dry_run:
+        if ran == 0:
+            warehouse.shadow_path(live).unlink()
+            state_path.unlink()
+            print("[ok] nothing changed; live warehouse left as is")
+        else:
+            problems = warehouse.check(shadow, baseline=live)
+            if problems:
+                for p in problems:
+                    print(f"[fail] {p}")
+                raise SystemExit(f"[fail] shadow build not published; inspect {shadow}")
+            warehouse.publish(shadow, live)
+            os.replace(state_path, STATE)
+            print(f"[ok] published {live} (previous generation: {warehouse.prev_path(live)})")
+    verb = "would run" if args.dry_run else "run"
+    print(f"[ok] pipeline: {ran} stage(s) {verb}, {len(selected) - ran} up to date "
+          f"({time.perf_counter() - t_start:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+# scripts/snapshots.py
+"""
+Arrow IPC (Feather v2) snapshots of the artist-level outputs for notebooks and
+dashboards, so a kernel restart maps a file instead of querying SQLite or
+parsing CSV.
+
+  data/processed/snapshots/<view>.arrow   one file per view in SNAPSHOTS
+
+Files are uncompressed so
+`load()` can memory-map them: the columns are read straight from the OS page
+cache, without parsing or copying. Artist columns are dictionary-encoded
+(categoricals in pandas).
+
+Each file carries, in its schema metadata, the hash of the dw_build fingerprints
+(warehouse.py) of the tables it was read from. `load()` recomputes that hash
+from the warehouse and refuses a snapshot whose sources have been rebuilt
+since; rebuilding unrelated tables does not make it stale. Without the
+warehouse file (snapshots copied to another machine) the check is skipped.
+
+Usage:
+  python scripts/snapshots.py                       # export every snapshot
+  python scripts/snapshots.py --check               # report stale or missing snapshots
+
+  import snapshots
+  df = snapshots.load_frame("vw_artist_critics_vs_streams")
+"""
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import os
+import sqlite3
+import time
+
+import instrument
+import warehouse
+
+DB = warehouse.db_path(Path("data/processed/vinyl_dw.sqlite"))
+SNAPSHOT_DIR = Path("data/processed/snapshots")
+
+# view -> tables whose fingerprints its rows depend on (the view itself covers its SQL)
+_SUMMARY = ["vw_artist_summary", "fact_review_artist", "dim_artist", "dim_spotify_artist", "pitchfork_reviews"]
+_STREAMS = ["vw_artist_streams", "fact_artist_streams", "dim_spotify_artist"]
+SNAPSHOTS = {
+    "vw_artist_critics_vs_streams": sorted({"vw_artist_critics_vs_streams", *_SUMMARY, *_STREAMS}),
+    "vw_artist_summary": _SUMMARY,
+    "vw_artist_streams": _STREAMS,
+    "vw_artist_coverage_by_year": ["vw_artist_coverage_by_year", "fact_review_artist", "dim_artist",
+                                   "pitchfork_reviews"],
+}
+DICT_COLUMNS = {"artist"}
+
+META_BUILD = b"vinyl.build_hash"
+META_EXPORTED = b"vinyl.exported_at"
+
+
+def snapshot_path(name: str, snapshot_dir: Path = SNAPSHOT_DIR) -> Path:
+    return Path(snapshot_dir) / f"{name}.arrow"
+
+
+def to_table(cur: sqlite3.Cursor):
+    """Arrow table from a cursor; column types are inferred (INTEGER with NULLs stays int64)."""
+    import pyarrow as pa
+
+    names = [d[0] for d in cur.description]
+    rows = cur.fetchall()
+    columns = list(zip(*rows)) if rows else [()] * len(names)
+    arrays = []
+    for name, values in zip(names, columns):
+        arr = pa.array(values)
+        if name in DICT_COLUMNS:
+            arr = arr.dictionary_encode()
+        arrays.append(arr)
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+def export(con: sqlite3.Connection, name: str, stamp: dict[str, str],
+           snapshot_dir: Path = SNAPSHOT_DIR) -> tuple[Path, int]:
+    import pyarrow.feather as feather
+
+    build = warehouse.build_hash(stamp, SNAPSHOTS[name])
+    table = to_table(con.execute(f"SELECT * FROM {name}"))
+    table = table.replace_schema_metadata({
+        META_BUILD: (build or "").encode("ascii"),
+        META_EXPORTED: datetime.now(tz=timezone.utc).isoformat().encode("ascii"),
+    })
+    path = snapshot_path(name, snapshot_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    feather.write_feather(table, tmp, compression="uncompressed")
+    # Readers holding a map of the old file keep it; new ones get the new file
+    os.replace(tmp, path)
+    return path, table.num_rows
+
+
+def status(name: str, snapshot_dir: Path = SNAPSHOT_DIR, db: Path = DB) -> str | None:
+    """Why the snapshot should not be used (missing or stale), or None if it is current."""
+    import pyarrow as pa
+
+    path = snapshot_path(name, snapshot_dir)
+    if not path.exists():
+        return f"{path} missing; run python scripts/snapshots.py"
+    if not Path(db).exists():
+        return None
+    with pa.memory_map(str(path), "r") as source:
+        meta = pa.ipc.open_file(source).schema.metadata or {}
+    tagged = meta.get(META_BUILD, b"").decode("ascii") or None
+    current = warehouse.build_hash(warehouse.build_stamp(db), SNAPSHOTS[name])
+    if tagged is None and current is None:
+        return None         # unstamped warehouse: nothing to compare
+    if tagged is None or current is None:
+        return f"{path} cannot be matched to the warehouse build; re-export it"
+    if tagged != current:
+        return f"{path} is stale: its source tables were rebuilt since it was exported"
+    return None
+
+
+def load(name: str, snapshot_dir: Path = SNAPSHOT_DIR, db: Path = DB, allow_stale: bool = False):
+    """Memory-mapped Arrow table of a snapshot (zero-copy); raises if it is stale."""
+    import pyarrow as pa
+
+    if name not in SNAPSHOTS:
+        raise KeyError(f"Unknown snapshot {name!r}; expected one of {sorted(SNAPSHOTS)}")
+    problem = status(name, snapshot_dir, db)
+    if problem and not (allow_stale and snapshot_path(name, snapshot_dir).exists()):
+        raise RuntimeError(problem)
+    if problem:
+        print(f"[warn] {problem}")
+    source = pa.memory_map(str(snapshot_path(name, snapshot_dir)), "r")
+    return pa.ipc.open_file(source).read_all()
+
+
+def load_frame(name: str, snapshot_dir: Path = SNAPSHOT_DIR, db: Path = DB, allow_stale: bool = False):
+    """The snapshot as a pandas DataFrame (artist columns as categoricals)."""
+    return load(name, snapshot_dir, db, allow_stale).to_pandas()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Export memory-mappable Arrow snapshots of the artist views.")
+    ap.add_argument("--check", action="store_true", help="only report missing or stale snapshots")
+    ap.add_argument("--out", type=Path, default=SNAPSHOT_DIR)
+    args = ap.parse_args()
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise SystemExit("[fail] pyarrow is required for the Arrow snapshots")
+    if not DB.exists():
+        raise FileNotFoundError(f"Missing warehouse DB: {DB}")
+
+    if args.check:
+        problems = [p for p in (status(n, args.out, DB) for n in SNAPSHOTS) if p]
+        for p in problems:
+            print(f"[warn] {p}")
+        if problems:
+            raise SystemExit(1)
+        print(f"[ok] {len(SNAPSHOTS)} snapshot(s) in {args.out} match the warehouse build")
+        return
+
+    st = instrument.start("snapshots")
+    stamp = warehouse.build_stamp(DB)
+    if not stamp:
+        print("[warn] warehouse has no build stamp (run it through run_pipeline.py); "
+              "snapshots cannot be checked for staleness")
+    con = sqlite3.connect(DB)
+    total = 0
+    try:
+        for name in SNAPSHOTS:
+            t0 = time.perf_counter()
+            path, n = export(con, name, stamp, args.out)
+            total += n
+            print(f"[ok] {path}: {n:,} rows, {path.stat().st_size / 1e6:.2f} MB "
+                  f"({time.perf_counter() - t0:.2f}s)")
+    finally:
+        con.close()
+    st.rows(rows_out=total)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,29 @@
 from pathlib import Path
+import sqlite3
 import pandas as pd
 
+import instrument
+import interim_io
+import quality
+import warehouse
+
 SRC = Path("data/interim/pitchfork_reviews.csv")
 OUT = Path("data/interim/pitchfork_reviews_typed.csv")
+DB = warehouse.db_path(Path("data/processed/vinyl_dw.sqlite"))
 
-df = pd.read_csv(SRC)
+st = instrument.start("stage_reviews")
+direct = interim_io.direct_tables()
+if "reviews" in direct:
+    # extract_pitchfork.py --direct wrote no interim file; the reviews are already typed in the warehouse
+    con = sqlite3.connect(DB.resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        df = pd.read_sql(f'SELECT * FROM "{direct["reviews"]}"', con)
+    finally:
+        con.close()
+    print(f"[info] source: {DB}:{direct['reviews']} (direct export)")
+else:
+    df = interim_io.read_table(SRC)
+st.lap("read", rows_out=len(df))
 
 # Convert strings → datetime; invalids become NaT so we can count them
 df["pub_date"] = pd.to_datetime(df["pub_date"], errors="coerce")
@@ -16,13 +35,18 @@ df["pub_month"] = df["pub_month"].astype("int8")
 df["pub_day"] = df["pub_day"].astype("int8")
 df["score"] = df["score"].astype("float32")
 
-# Guardrails: Pitchfork scores are 0.0–10.0
-bad = df[(df["score"] < 0) | (df["score"] > 10) | (df["score"].isna())]
-if len(bad):
-    raise ValueError(f"Score domain violated on {len(bad)} rows")
-
-null_dates = df["pub_date"].isna().sum()
-print(f"[check] null pub_date after parse: {null_dates}")
+# Guardrails: Pitchfork scores are 0.0–10.0; unparseable dates are only counted
+score_domain = quality.in_range("pitchfork_reviews_typed", "score", 0, 10, nulls_ok=False)
+results = quality.check_frame(df, "pitchfork_reviews_typed", [
+    score_domain,
+    quality.not_null("pitchfork_reviews_typed", "pub_date", severity="info"),
+])
+quality.report(results, st)
+if quality.failures(results):
+    raise ValueError(f"Score domain violated on {results[0].value:,} rows")
 
-df.to_csv(OUT, index=False)
-print(f"[ok] wrote {OUT} with {len(df):,} rows")
+st.lap("type", rows_in=len(df), rows_out=len(df))
+out = interim_io.write_table(df, OUT)
+st.lap("write", rows_out=len(df))
+st.rows(rows_in=len(df), rows_out=len(df))
+print(f"[ok] wrote {out} with {len(df):,} rows")
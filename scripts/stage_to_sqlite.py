@@ -1,18 +1,311 @@
-import sqlite3, pandas as pd, glob, os
+import sqlite3, pandas as pd, glob, time, argparse, itertools, json, sys
 from pathlib import Path
 
-DB = Path(r"D:\Projects\vinyl-critics-vs-streams\data\processed\vinyl_dw.sqlite")
+import artist_search
+import instrument
+import interim_io
+import merkle
+import warehouse
+
+DB = warehouse.db_path(Path(r"D:\Projects\vinyl-critics-vs-streams\data\processed\vinyl_dw.sqlite"))
 IN_DIR = Path(r"D:\Projects\vinyl-critics-vs-streams\data\interim")
 
-DB.parent.mkdir(parents=True, exist_ok=True)
-con = sqlite3.connect(DB)
+# Streaming mode: rows per CSV chunk (memory is bounded by this, not the file size)
+CHUNK_ROWS = 50_000
+
+# Secondary indexes built after each table is filled (only if the columns exist)
+INDEXES = {
+    "pitchfork_reviews": [("reviewid",)],
+    "pitchfork_reviews_typed": [("reviewid",)],
+    "pitchfork_artists": [("reviewid",), ("artist",)],
+    "pitchfork_review_artists": [("reviewid",), ("artist",)],
+    "pitchfork_genres": [("reviewid",)],
+    "pitchfork_labels": [("reviewid",)],
+    "pitchfork_years": [("reviewid",)],
+    "pitchfork_content": [("reviewid",)],
+    "spotify_youtube_clean": [("artist",)],
+    "spotify_artist_rollup": [("artist",)],
+}
+
+# Tables staged from interim files built off another table's rows, with the script that
+# builds them: a keyed reload of the source reloads these for the same keys
+DERIVED = {
+    "pitchfork_reviews": [("pitchfork_reviews_typed", "stage_reviews.py")],
+}
+
+# Bulk-load settings: WAL keeps readers unblocked, synchronous=OFF skips fsyncs
+# until the final commit, and a 256 MB page cache keeps index builds in memory.
+LOAD_PRAGMAS = [
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=OFF;",
+    "PRAGMA cache_size=-262144;",
+    "PRAGMA temp_store=MEMORY;",
+]
 
-for f in glob.glob(str(IN_DIR / "*.csv")):
-    name = os.path.splitext(os.path.basename(f))[0]
-    df = pd.read_csv(f, low_memory=False)
+def q(ident: str) -> str:
+    return '"' + ident.replace('"', '""') + '"'
+
+def sqlite_type(dtype) -> str:
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(dtype):
+        return "REAL"
+    return "TEXT"
+
+def interim_files() -> dict[str, Path]:
+    """
+    One file per table name; when both formats exist the active one wins.
+    Tables the last export copied straight into the warehouse (--direct) are left
+    out, so leftover files from an older export can't replace them.
+    """
+    exts = list(interim_io.FORMATS.values()) + [".csv" + e for e in interim_io.CSV_COMPRESSION.values()]
+    stems = {interim_io.table_name(Path(f))
+             for ext in exts
+             for f in glob.glob(str(IN_DIR / f"*{ext}"))}
+    direct = set(interim_io.direct_tables(IN_DIR / interim_io.EXPORT_MANIFEST.name).values())
+    if direct:
+        print(f"[info] already in the warehouse (direct export): {', '.join(sorted(direct))}")
+    return {name: interim_io.resolve(IN_DIR / f"{name}.csv") for name in sorted(stems - direct)}
+
+def load_pandas(con: sqlite3.Connection, path: Path, name: str) -> int:
+    df = interim_io.sql_ready(interim_io.read_table(path, low_memory=False))
     df.to_sql(name, con, if_exists="replace", index=False)
     print(f"Loaded {len(df):,} rows into table {name}")
+    return len(df)
+
+def csv_chunks(path: Path, chunk_rows: int):
+    """
+    Text chunks of a CSV. Column types are inferred from a typed read of the
+    first chunk; values are inserted as text and SQLite's column affinity
+    converts numeric text to INTEGER/REAL, so anything that doesn't fit the
+    pinned type is kept verbatim instead of being coerced away.
+    """
+    reader = pd.read_csv(path, dtype=str, chunksize=chunk_rows)
+    first = next(reader, None)
+    if first is None:
+        return None, iter(())
+
+    sample = pd.read_csv(path, nrows=len(first), low_memory=False)
+    types = {c: sqlite_type(sample[c].dtype) for c in first.columns}
+    bools = [c for c in first.columns if pd.api.types.is_bool_dtype(sample[c].dtype)]
+
+    def chunks():
+        for chunk in itertools.chain([first], reader):
+            for c in bools:
+                chunk[c] = chunk[c].map({"True": "1", "False": "0"}, na_action="ignore")
+            yield chunk
+    return types, chunks()
+
+def parquet_chunks(path: Path, chunk_rows: int):
+    """Typed record batches of a Parquet file; the file schema pins the column types."""
+    import pyarrow.parquet as pq
+    pf = pq.ParquetFile(path)
+    empty = pf.schema_arrow.empty_table().to_pandas()
+    types = {c: sqlite_type(empty[c].dtype) for c in empty.columns}
+    chunks = (interim_io.sql_ready(b.to_pandas()) for b in pf.iter_batches(batch_size=chunk_rows))
+    return types, chunks
+
+def load_streaming(con: sqlite3.Connection, path: Path, name: str, chunk_rows: int) -> int:
+    """
+    Stream one interim file into a typed table inside a single transaction.
+    Column types are pinned once in the DDL; memory is bounded by `chunk_rows`.
+    """
+    t0 = time.perf_counter()
+    source = parquet_chunks if interim_io.format_of(path) == "parquet" else csv_chunks
+    types, chunks = source(path, chunk_rows)
+    if not types:
+        print(f"[skip] {name}: empty file")
+        return 0
+
+    cols = ", ".join(f"{q(c)} {t}" for c, t in types.items())
+    insert = f"INSERT INTO {q(name)} VALUES ({', '.join('?' * len(types))})"
+
+    rows = 0
+    con.execute("BEGIN")
+    try:
+        con.execute(f"DROP TABLE IF EXISTS {q(name)}")
+        con.execute(f"CREATE TABLE {q(name)} ({cols})")
+        for chunk in chunks:
+            con.executemany(insert, chunk.to_numpy(dtype=object, na_value=None).tolist())
+            rows += len(chunk)
+
+        t_idx = time.perf_counter()
+        for idx_cols in INDEXES.get(name, []):
+            if set(idx_cols) <= set(types):
+                ix = f"ix_{name}_{'_'.join(idx_cols)}"
+                con.execute(f"CREATE INDEX {q(ix)} ON {q(name)}({', '.join(q(c) for c in idx_cols)})")
+        con.execute("COMMIT")
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+
+    dt = time.perf_counter() - t0
+    rate = rows / dt if dt else float("inf")
+    print(f"Loaded {rows:,} rows into table {name} in {dt:.2f}s "
+          f"({rate:,.0f} rows/s, indexes {time.perf_counter() - t_idx:.2f}s)")
+    return rows
+
+def unique_on_key(con: sqlite3.Connection, name: str) -> bool:
+    """True if `name` has a unique index on reviewid alone (pitchfork_reviews after a full review load)."""
+    for _, ix, unique, *_ in con.execute(f"PRAGMA index_list({q(name)})"):
+        if unique and [r[2] for r in con.execute(f"PRAGMA index_info({q(ix)})")] == [merkle.KEY]:
+            return True
+    return False
+
+def reload_keys(con: sqlite3.Connection, path: Path, name: str, keys: list, chunk_rows: int) -> tuple[int, int]:
+    """
+    Replace the rows of an existing table whose reviewid is in `keys` with
+    that key's rows from the interim file, in one transaction. Rows of other
+    keys are left alone, so change-capture triggers only see the changed ones.
+    If the table is unique on reviewid, only the last row of each key is kept,
+    as load_reviews_and_bridge.read_reviews does (the dump repeats a few reviews).
+    Returns (rows deleted, rows inserted).
+    """
+    source = parquet_chunks if interim_io.format_of(path) == "parquet" else csv_chunks
+    types, chunks = source(path, chunk_rows)
+    wanted = {k for k in keys if k is not None}
+    with_null = None in keys
+    dedupe = unique_on_key(con, name)
+    last: dict = {}     # reviewid -> (columns, row), when deduping
+
+    con.execute("BEGIN")
+    try:
+        con.execute("CREATE TEMP TABLE IF NOT EXISTS reload_keys (key PRIMARY KEY)")
+        con.execute("DELETE FROM temp.reload_keys")
+        con.executemany("INSERT INTO temp.reload_keys VALUES (?)", [(k,) for k in wanted])
+        key = q(merkle.KEY)
+        deleted = con.execute(
+            f"DELETE FROM {q(name)} WHERE {key} IN (SELECT key FROM temp.reload_keys)"
+            + (f" OR {key} IS NULL" if with_null else "")
+        ).rowcount
+
+        inserted = 0
+        for chunk in chunks if types else ():
+            k = pd.to_numeric(chunk[merkle.KEY], errors="coerce")
+            chunk = chunk[k.isin(wanted) | (k.isna() & with_null)]
+            if dedupe:
+                cols = tuple(chunk.columns)
+                for row in chunk.to_numpy(dtype=object, na_value=None).tolist():
+                    last[row[cols.index(merkle.KEY)]] = (cols, row)
+                continue
+            if len(chunk):
+                insert = (f"INSERT INTO {q(name)} ({', '.join(q(c) for c in chunk.columns)}) "
+                          f"VALUES ({', '.join('?' * len(chunk.columns))})")
+                con.executemany(insert, chunk.to_numpy(dtype=object, na_value=None).tolist())
+                inserted += len(chunk)
+        for cols, row in last.values():
+            con.execute(f"INSERT INTO {q(name)} ({', '.join(q(c) for c in cols)}) "
+                        f"VALUES ({', '.join('?' * len(cols))})", row)
+            inserted += 1
+        con.execute("COMMIT")
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+    return deleted, inserted
+
+def with_derived(name: str, files: dict[str, Path]) -> list[str]:
+    """`name` followed by the DERIVED tables staged from it; their interim files must be rebuilt first."""
+    names = [name]
+    for derived, script in DERIVED.get(name, []):
+        if name in files and derived in files and files[derived].stat().st_mtime < files[name].stat().st_mtime:
+            sys.exit(f"[fail] {files[derived]} is older than {files[name]}; run {script} first")
+        names.append(derived)
+    return names
+
+def main_keys(keys_path: Path, chunk_rows: int, st) -> None:
+    """
+    Targeted reload of the reviewids listed by verify_manifest.py --changed-keys;
+    tables it lists under full_reload (no row-level hashes) are replaced whole.
+    Tables derived from a changed table (DERIVED) are reloaded the same way.
+    """
+    changed = json.loads(keys_path.read_text(encoding="utf-8"))
+    if changed.get("key") != merkle.KEY:
+        sys.exit(f"[fail] {keys_path} lists {changed.get('key')!r} keys; expected {merkle.KEY!r}")
+
+    files = interim_files()
+    direct = set(interim_io.direct_tables(IN_DIR / interim_io.EXPORT_MANIFEST.name).values())
+    con = sqlite3.connect(DB, isolation_level=None)
+    try:
+        con.execute("PRAGMA journal_mode=WAL;")
+        existing = {r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        total = 0
+        for t in changed.get("full_reload", []):
+            # Changed, but without row-level hashes to say which keys: replace the whole table
+            for name in with_derived(f"pitchfork_{t}", files):
+                if name in direct:
+                    print(f"[info] {name}: already replaced whole by the direct export")
+                    continue
+                if name not in files:
+                    sys.exit(f"[fail] {name}: no interim file to reload from")
+                n = load_streaming(con, files[name], name, chunk_rows)
+                st.lap(f"reload_{name}", rows_out=n)
+                total += n
+        for t, keys in changed.get("tables", {}).items():
+            for name in with_derived(f"pitchfork_{t}", files):
+                if name in direct:
+                    print(f"[info] {name}: already replaced whole by the direct export")
+                    continue
+                if name not in existing or name not in files:
+                    sys.exit(f"[fail] {name}: no table or interim file to reload from; run a full load")
+                t0 = time.perf_counter()
+                deleted, inserted = reload_keys(con, files[name], name, keys, chunk_rows)
+                st.lap(f"reload_{name}", rows_out=inserted)
+                total += inserted
+                print(f"[ok] {name}: {len(keys):,} key(s), -{deleted:,} / +{inserted:,} rows "
+                      f"({time.perf_counter() - t0:.2f}s)")
+        st.rows(rows_in=total, rows_out=total)
+
+        for source, (added, removed) in artist_search.refresh(con, ["pitchfork"]).items():
+            print(f"[ok] artist_search index: +{added:,} / -{removed:,} {source} names")
+        con.execute("PRAGMA optimize;")
+    finally:
+        con.close()
+    print(f"Warehouse updated -> {DB}")
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Load every interim file (CSV or Parquet) into the warehouse.")
+    ap.add_argument("--stream", action="store_true",
+                    help="chunked, typed, single-transaction load with flat memory use")
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    ap.add_argument("--keys", type=Path, metavar="CHANGED_KEYS_JSON",
+                    help="only replace the rows of the reviewids listed by verify_manifest.py --changed-keys")
+    args = ap.parse_args()
+    st = instrument.start("stage_to_sqlite")
+
+    if args.keys:
+        main_keys(args.keys, args.chunk_rows, st)
+        return
+
+    DB.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(DB, isolation_level=None if args.stream else "")
+    if args.stream:
+        for p in LOAD_PRAGMAS:
+            con.execute(p)
+
+    total = 0
+    for name, f in interim_files().items():
+        if args.stream:
+            n = load_streaming(con, f, name, args.chunk_rows)
+        else:
+            n = load_pandas(con, f, name)
+        st.lap(f"load_{name}", rows_out=n)
+        total += n
+    st.rows(rows_in=total, rows_out=total)
+
+    for source, (added, removed) in artist_search.refresh(con, ["pitchfork", "spotify"]).items():
+        print(f"[ok] artist_search index: +{added:,} / -{removed:,} {source} names")
+    con.commit()
+    st.lap("artist_search")
+
+    if args.stream:
+        # Tables were rebuilt from scratch, so a full VACUUM buys little; refresh stats instead
+        con.execute("PRAGMA synchronous=NORMAL;")
+        con.execute("PRAGMA optimize;")
+    else:
+        con.execute("PRAGMA vacuum;")
+    st.lap("finalize")
+    con.close()
+    print(f"Warehouse ready -> {DB}")
 
-con.execute("PRAGMA vacuum;")
-con.close()
-print(f"Warehouse ready -> {DB}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# scripts/tfidf_match.py
+"""
+Character n-gram TF-IDF matching engine for catalogue-scale candidate sets.
+
+Names (already normalized by the caller) are padded with one space on each side
+and cut into character trigrams. Candidates become an L2-normalized sparse
+TF-IDF matrix; queries are projected onto the candidate vocabulary (trigrams
+the candidates never use still count towards the query norm, so cosine scores
+are not inflated). Candidate generation is a sparse matrix product done in
+blocks of `chunk_size` queries x `block_size` candidates, so the intermediate
+product never holds more than chunk_size * block_size entries; only pairs at or
+above `min_sim` survive a block, and the best `top_k` per query are kept.
+
+The short list can optionally be re-ranked with rapidfuzz WRatio, dropping
+pairs rejected by the match_guards rules.
+"""
+from __future__ import annotations
+
+from array import array
+import math
+
+import numpy as np
+from scipy import sparse
+
+NGRAM = 3
+TOP_K = 10
+MIN_SIM = 0.8
+CHUNK_SIZE = 512           # queries per block
+BLOCK_SIZE = 50_000        # candidates per block
+
+
+def ngrams(s: str, n: int = NGRAM) -> list[str]:
+    s = f" {s} "
+    return [s[i:i + n] for i in range(len(s) - n + 1)]
+
+
+class TfidfIndex:
+    """TF-IDF trigram vectors of a fixed candidate list (rows follow `names`)."""
+
+    def __init__(self, names: list[str], n: int = NGRAM):
+        self.n = n
+        self.vocab: dict[str, int] = {}
+        indptr, indices = array("q", [0]), array("q")
+        for name in names:
+            indices.extend(self.vocab.setdefault(g, len(self.vocab)) for g in ngrams(name, n))
+            indptr.append(len(indices))
+        counts = self._csr(indptr, indices, len(names), len(self.vocab))
+
+        n_docs = len(names)
+        df = np.bincount(counts.indices, minlength=len(self.vocab))
+        self.idf = np.log((1 + n_docs) / (1 + df)) + 1.0
+        self.idf_unseen = math.log(1 + n_docs) + 1.0
+        self.matrix = self._normalize(counts, np.zeros(len(names)))
+
+    @staticmethod
+    def _csr(indptr: array, indices: array, n_rows: int, n_cols: int) -> sparse.csr_matrix:
+        indices = np.frombuffer(indices, dtype=np.int64) if len(indices) else np.zeros(0, dtype=np.int64)
+        m = sparse.csr_matrix(
+            (np.ones(len(indices)), indices, np.frombuffer(indptr, dtype=np.int64)),
+            shape=(n_rows, n_cols),
+        )
+        m.sum_duplicates()          # repeated trigrams become term counts
+        return m
+
+    def _normalize(self, counts: sparse.csr_matrix, extra_sq: np.ndarray) -> sparse.csr_matrix:
+        """Weight counts by IDF and L2-normalize rows; `extra_sq` adds out-of-vocabulary mass."""
+        w = counts.multiply(self.idf).tocsr()
+        sq = np.asarray(w.multiply(w).sum(axis=1)).ravel() + extra_sq
+        norm = np.sqrt(sq)
+        inv = np.divide(1.0, norm, out=np.zeros_like(norm), where=norm > 0)
+        return sparse.diags(inv) @ w
+
+    def transform(self, names: list[str]) -> sparse.csr_matrix:
+        """Query vectors over the candidate vocabulary."""
+        indptr, indices = array("q", [0]), array("q")
+        unseen_sq = np.zeros(len(names))
+        for i, name in enumerate(names):
+            grams: dict[str, int] = {}
+            for g in ngrams(name, self.n):
+                grams[g] = grams.get(g, 0) + 1
+            for g, c in grams.items():
+                j = self.vocab.get(g)
+                if j is None:
+                    unseen_sq[i] += (c * self.idf_unseen) ** 2
+                else:
+                    indices.extend([j] * c)
+            indptr.append(len(indices))
+        counts = self._csr(indptr, indices, len(names), len(self.vocab))
+        return self._normalize(counts, unseen_sq)
+
+
+def top_k(
+    index: TfidfIndex,
+    queries: list[str],
+    k: int = TOP_K,
+    min_sim: float = MIN_SIM,
+    rows: np.ndarray | None = None,
+    chunk_size: int = CHUNK_SIZE,
+    block_size: int = BLOCK_SIZE,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Up to `k` candidates per query with cosine >= `min_sim`, as aligned
+    (query position, candidate row, similarity) arrays ordered by query, then
+    similarity descending, then candidate row (ties go to the earlier candidate).
+    `rows` restricts the search to those candidate rows.
+    """
+    cand = index.matrix if rows is None else index.matrix[rows]
+    row_ids = np.arange(cand.shape[0]) if rows is None else np.asarray(rows)
+    # Transposed candidate blocks are cut once and reused by every query chunk
+    blocks = [(c0, cand[c0:c0 + block_size].T) for c0 in range(0, cand.shape[0], block_size)]
+    out_q, out_c, out_s = [], [], []
+    for q0 in range(0, len(queries), chunk_size):
+        q = index.transform(queries[q0:q0 + chunk_size])
+        parts_r, parts_c, parts_s = [], [], []
+        for c0, block in blocks:
+            prod = (q @ block).tocsr()
+            keep = prod.data >= min_sim
+            row = np.repeat(np.arange(prod.shape[0]), np.diff(prod.indptr))
+            parts_r.append(row[keep])
+            parts_c.append(prod.indices[keep] + c0)
+            parts_s.append(prod.data[keep])
+        if not parts_r:
+            continue
+        r, c, s = np.concatenate(parts_r), np.concatenate(parts_c), np.concatenate(parts_s)
+        order = np.lexsort((c, -s, r))
+        r, c, s = r[order], c[order], s[order]
+        # rank of each pair within its query
+        starts = np.flatnonzero(np.r_[True, r[1:] != r[:-1]])
+        rank = np.arange(len(r)) - np.repeat(starts, np.diff(np.r_[starts, len(r)]))
+        top = rank < k
+        out_q.append(r[top] + q0)
+        out_c.append(row_ids[c[top]])
+        out_s.append(s[top])
+    if not out_q:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+    return np.concatenate(out_q), np.concatenate(out_c), np.concatenate(out_s)
+
+
+def rerank(
+    queries: list[str],
+    names: list[str],
+    q_pos: np.ndarray,
+    c_row: np.ndarray,
+    sims: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Re-order each query's short list by WRatio (cosine, then candidate row break
+    ties) after dropping pairs the match_guards rules reject.
+    """
+    from rapidfuzz import fuzz
+    import match_guards
+
+    if not len(q_pos):
+        return q_pos, c_row, sims
+    wr = np.array([fuzz.WRatio(queries[i], names[j]) for i, j in zip(q_pos, c_row)])
+    ok = match_guards.ok_pairs(match_guards.name_features(queries), match_guards.name_features(names),
+                               q_pos, c_row, wr)
+    q_pos, c_row, sims, wr = q_pos[ok], c_row[ok], sims[ok], wr[ok]
+    order = np.lexsort((c_row, -sims, -wr, q_pos))
+    return q_pos[order], c_row[order], sims[order]
+
+
+def best_matches(
+    index: TfidfIndex,
+    names: list[str],
+    queries: list[str],
+    rows: np.ndarray | None = None,
+    min_sim: float = MIN_SIM,
+    k: int = TOP_K,
+    rescore: bool = False,
+) -> dict[str, tuple[str | None, float]]:
+    """Best candidate name (from `names`, the index rows) and cosine per query."""
+    q_pos, c_row, sims = top_k(index, queries, k=k, min_sim=min_sim, rows=rows)
+    if rescore:
+        q_pos, c_row, sims = rerank(queries, names, q_pos, c_row, sims)
+    picks: dict[str, tuple[str | None, float]] = {q: (None, 0.0) for q in queries}
+    first = np.r_[True, q_pos[1:] != q_pos[:-1]] if len(q_pos) else np.zeros(0, dtype=bool)
+    for i, j, s in zip(q_pos[first], c_row[first], sims[first]):
+        picks[queries[i]] = (names[j], round(float(s), 6))
+    return picks
@@ -1,17 +1,73 @@
+import argparse
 import json
 import sys
 from pathlib import Path
 
+import merkle
+
 def load(p: str):
     with open(p, "r", encoding="utf-8") as f:
         return json.load(f)
 
-if len(sys.argv) != 3:
-    print("Usage: python scripts\\verify_manifest.py <old_manifest.json> <new_manifest.json>")
-    sys.exit(2)
+ap = argparse.ArgumentParser(
+    usage="python scripts\\verify_manifest.py <old_manifest.json> <new_manifest.json>",
+    description="Compare two export manifests (pitchfork_export_meta.json) or two run manifests "
+                "(pipeline_run_meta.json).")
+ap.add_argument("old")
+ap.add_argument("new")
+ap.add_argument("--perf-threshold", type=float, default=25.0,
+                help="run manifests: fail when a stage's wall time or peak RSS grows by more than this %%")
+ap.add_argument("--min-seconds", type=float, default=1.0,
+                help="run manifests: ignore wall-time changes smaller than this (timer noise)")
+ap.add_argument("--changed-keys", metavar="PATH",
+                help="export manifests: write the reviewids whose rows changed, per table, as JSON "
+                     "(input to stage_to_sqlite.py --keys)")
+args = ap.parse_args()
+
+old = load(args.old)
+new = load(args.new)
+
+def pct_change(o, n):
+    return ((n - o) / o * 100) if o else 0.0
+
+def compare_runs(old, new) -> bool:
+    """Per-stage perf/row deltas between two run manifests; True if any breach the policy."""
+    bad = False
+    o_st, n_st = old.get("stages", {}), new.get("stages", {})
+    print(f"[info] runs {old.get('run_id')} -> {new.get('run_id')} (stages old={len(o_st)}, new={len(n_st)})")
+    for s in sorted(set(o_st) & set(n_st)):
+        o, n = o_st[s], n_st[s]
+        if n.get("status") != "ok":
+            print(f"[fail] {s}: status {n.get('status')}")
+            bad = True
+            continue
+        status = []
+        dt = n["wall_s"] - o["wall_s"]
+        wall_pct = pct_change(o["wall_s"], n["wall_s"])
+        if dt > args.min_seconds and wall_pct > args.perf_threshold:
+            status.append(f"wall {o['wall_s']:.2f}s→{n['wall_s']:.2f}s ({wall_pct:+.1f}%)")
+        if o.get("peak_rss_mb") and n.get("peak_rss_mb"):
+            rss_pct = pct_change(o["peak_rss_mb"], n["peak_rss_mb"])
+            if rss_pct > args.perf_threshold:
+                status.append(f"peak RSS {o['peak_rss_mb']:.0f}→{n['peak_rss_mb']:.0f} MB ({rss_pct:+.1f}%)")
+        if o.get("rows_out") and n.get("rows_out") is not None:
+            rows_pct = pct_change(o["rows_out"], n["rows_out"])
+            # Same policy as the export manifests: fail if rows drop >2%
+            if rows_pct < -2.0:
+                status.append(f"rows out {o['rows_out']}→{n['rows_out']} ({rows_pct:+.2f}%)")
+        if status:
+            print(f"[delta] {s}: " + ", ".join(status))
+            bad = True
+        else:
+            print(f"[ok] {s}: wall {o['wall_s']:.2f}s→{n['wall_s']:.2f}s")
+    return bad
 
-old = load(sys.argv[1])
-new = load(sys.argv[2])
+if "stages" in old and "stages" in new:
+    if compare_runs(old, new):
+        print("[fail] performance regressions detected")
+        sys.exit(1)
+    print("[ok] run comparison passed")
+    sys.exit(0)
 
 def get_tables(m): return set(m.get("tables", {}).keys())
 
@@ -24,23 +80,52 @@ print(f"[info] tables (old={len(old_tabs)}, new={len(new_tabs)})")
 if added:  print(f"[warn] added tables: {added}")
 if removed: print(f"[warn] removed tables: {removed}")
 
+# Hashes are only comparable when both runs hashed the same thing (CSV file vs table rows)
+old_kind, new_kind = old.get("hash_kind", "csv_file"), new.get("hash_kind", "csv_file")
+same_kind = old_kind == new_kind
+if not same_kind:
+    print(f"[info] hash kinds differ ({old_kind} vs {new_kind}); content hashes not compared")
+
 bad = False
+changed_keys = {}
+full_reload = []     # changed tables without a Merkle section on both sides: no key-level diff
 
 for t in common:
     o = old["tables"][t]
     n = new["tables"][t]
     dr = n["rows"] - o["rows"]
     pct = (dr / o["rows"] * 100) if o["rows"] else 0.0
-    hash_changed = (o["sha256"] != n["sha256"])
+    hash_changed = same_kind and (o["sha256"] != n["sha256"])
     status = []
     if dr != 0: status.append(f"rows {o['rows']}→{n['rows']} ({pct:+.2f}%)")
     if hash_changed: status.append("hash changed")
+    if "merkle" not in o or "merkle" not in n:
+        if dr != 0 or hash_changed or not same_kind:
+            full_reload.append(t)
+            status.append("no merkle section; needs a full reload")
+    else:
+        # Row-level hashes don't depend on the file format, so compare them even across hash kinds
+        ranges, keys = merkle.diff(o["merkle"], n["merkle"])
+        if keys:
+            changed_keys[t] = keys
+            shown = ", ".join(map(str, keys[:5])) + (", ..." if len(keys) > 5 else "")
+            status.append(f"{len(ranges)} {o['merkle']['key']} range(s), {len(keys)} key(s) changed: {shown}")
     if status:
         print(f"[delta] {t}: " + ", ".join(status))
         # Policy example: fail if row drop >2%
         if pct < -2.0:
             bad = True
 
+if args.changed_keys:
+    full_reload += added
+    union = sorted({k for keys in changed_keys.values() for k in keys if isinstance(k, int)})
+    with open(args.changed_keys, "w", encoding="utf-8") as f:
+        json.dump({"key": merkle.KEY, "tables": changed_keys, "reviewids": union,
+                   "full_reload": full_reload}, f, indent=2)
+    print(f"[ok] {len(union):,} changed {merkle.KEY}(s) in {len(changed_keys)} table(s) -> {args.changed_keys}")
+    if full_reload:
+        print(f"[warn] {len(full_reload)} table(s) to reload in full: {', '.join(full_reload)}")
+
 if bad:
     print("[fail] significant regressions detected")
     sys.exit(1)
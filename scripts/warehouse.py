@@ -0,0 +1,252 @@
+# scripts/warehouse.py
+"""
+Where the loaders write the SQLite warehouse, and the shadow build / publish
+steps used by `run_pipeline.py --shadow`.
+
+Every script that opens the warehouse goes through `db_path()`, which returns
+VINYL_DW_PATH when it is set. A shadow build points it at a copy of the live
+file, runs the stale stages against that copy, checks it, and only then swaps
+it in with an atomic rename. Readers of the live file never see a missing or
+half-loaded table: connections opened before the swap keep reading the old
+generation, new ones get the new one. The replaced generation is kept next to
+it for rollback:
+
+  vinyl_dw.sqlite          live
+  vinyl_dw.shadow.sqlite   being built (left behind if its checks fail)
+  vinyl_dw.prev.sqlite     previous generation
+
+Checks before publishing: PRAGMA quick_check, PRAGMA foreign_key_check, every
+view compiles, and quality.WAREHOUSE_CHECKS - row counts must be non-zero and
+not drop more than MAX_ROW_DROP against the live file, scores must stay within
+0-10, and null counts must not grow.
+
+The pipeline stamps each table's fingerprint (the key of the stage that wrote
+it) into dw_build, so the build travels with the file through publish and
+rollback. build_hash() over a set of tables tells derived outputs (the Arrow
+snapshots) whether the warehouse they were made from is still the live one.
+Loaders that write tables in place outside a pipeline stage (the incremental
+review load) give those tables fresh fingerprints with restamp(); the next
+run_pipeline.py run adopts them and reruns the stages that read the tables.
+
+Usage:
+  python scripts/warehouse.py --check      # run the checks against the live file
+  python scripts/warehouse.py --rollback   # swap the previous generation back in
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import hashlib
+import os
+import shutil
+import sqlite3
+
+LIVE_DB = Path("data/processed/vinyl_dw.sqlite")
+
+# Largest relative drop in a checked row count accepted against the live file
+MAX_ROW_DROP = 0.02
+
+BUILD_TABLE = "dw_build"
+
+
+def db_path(default: Path = LIVE_DB) -> Path:
+    """The warehouse file to open: VINYL_DW_PATH if set (shadow builds), else `default`."""
+    override = os.environ.get("VINYL_DW_PATH")
+    return Path(override) if override else Path(default)
+
+
+def build_stamp(db: Path) -> dict[str, str]:
+    """Table -> fingerprint as stamped by the pipeline (empty for an unstamped warehouse)."""
+    if not Path(db).exists():
+        return {}
+    con = sqlite3.connect(Path(db).resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        return dict(con.execute(f"SELECT tbl, fp FROM {BUILD_TABLE}").fetchall())
+    except sqlite3.OperationalError:
+        return {}
+    finally:
+        con.close()
+
+
+def stamp_build(db: Path, fingerprints: dict[str, str]) -> None:
+    """Record the tables' fingerprints in the warehouse; no write when they are unchanged."""
+    if build_stamp(db) == fingerprints:
+        return
+    con = sqlite3.connect(db)
+    try:
+        with con:
+            con.execute(f"CREATE TABLE IF NOT EXISTS {BUILD_TABLE} (tbl TEXT PRIMARY KEY, fp TEXT NOT NULL)")
+            con.execute(f"DELETE FROM {BUILD_TABLE}")
+            con.executemany(f"INSERT INTO {BUILD_TABLE} VALUES (?, ?)", sorted(fingerprints.items()))
+    finally:
+        con.close()
+
+
+def restamp(con: sqlite3.Connection, tables: list[str], note: str) -> None:
+    """
+    New fingerprints for `tables` after an in-place write outside the pipeline,
+    derived from the old one and `note`. Runs in the caller's transaction; a
+    warehouse without a stamp is left unstamped.
+    """
+    if con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (BUILD_TABLE,)).fetchone() is None:
+        return
+    for t in tables:
+        old = con.execute(f"SELECT fp FROM {BUILD_TABLE} WHERE tbl = ?", (t,)).fetchone()
+        fp = hashlib.sha256(f"{old[0] if old else ''}\x1f{note}".encode("utf-8")).hexdigest()
+        con.execute(f"INSERT INTO {BUILD_TABLE} VALUES (?, ?) ON CONFLICT(tbl) DO UPDATE SET fp = excluded.fp",
+                    (t, fp))
+
+
+def build_hash(stamp: dict[str, str], tables: list[str] | None = None) -> str | None:
+    """Hash of the stamped fingerprints of `tables` (all stamped tables if None); None if any is missing."""
+    tables = sorted(stamp) if tables is None else sorted(tables)
+    if not tables or any(t not in stamp for t in tables):
+        return None
+    return hashlib.sha256("\x1f".join(f"{t}={stamp[t]}" for t in tables).encode("utf-8")).hexdigest()
+
+
+def shadow_path(live: Path) -> Path:
+    return live.with_name(f"{live.stem}.shadow{live.suffix}")
+
+
+def prev_path(live: Path) -> Path:
+    return live.with_name(f"{live.stem}.prev{live.suffix}")
+
+
+def _remove(path: Path) -> None:
+    for p in (path, Path(f"{path}-wal"), Path(f"{path}-shm"), Path(f"{path}-journal")):
+        p.unlink(missing_ok=True)
+
+
+def start_shadow(live: Path) -> Path:
+    """Fresh shadow file seeded with a consistent copy of the live warehouse (if any)."""
+    shadow = shadow_path(live)
+    _remove(shadow)
+    shadow.parent.mkdir(parents=True, exist_ok=True)
+    dst = sqlite3.connect(shadow)
+    try:
+        if live.exists():
+            src = sqlite3.connect(live)
+            try:
+                src.backup(dst)
+            finally:
+                src.close()
+    finally:
+        dst.close()
+    return shadow
+
+
+def check(db: Path, baseline: Path | None = None) -> list[str]:
+    """Problems that should block publishing `db` (empty if it is fine)."""
+    import quality  # imports this module for db_path()
+
+    problems = []
+    con = sqlite3.connect(db)
+    try:
+        ok = con.execute("PRAGMA quick_check").fetchone()[0]
+        if ok != "ok":
+            problems.append(f"quick_check: {ok}")
+        fk = con.execute("PRAGMA foreign_key_check").fetchall()
+        if fk:
+            problems.append(f"foreign_key_check: {len(fk):,} violation(s), first in {fk[0][0]}")
+        for (view,) in con.execute("SELECT name FROM sqlite_master WHERE type = 'view' ORDER BY name").fetchall():
+            try:
+                con.execute(f"SELECT * FROM {view} LIMIT 1").fetchall()
+            except sqlite3.Error as e:
+                problems.append(f"view {view}: {e}")
+    finally:
+        con.close()
+
+    new = quality.run(db, quality.WAREHOUSE_CHECKS)
+    old: dict[str, float] = {}
+    if baseline is not None and baseline.exists():
+        old = {r.name: r.value for r in quality.run(baseline, quality.WAREHOUSE_CHECKS) if r.value is not None}
+
+    for r in new:
+        was = old.get(r.name)
+        print(f"[check] {r.name}: {quality.describe(r)}" + (f" (live: {was:,})" if was is not None else ""))
+        if "error" in r.detail:
+            problems.append(f"{r.name}: {r.detail['error']}")
+        elif r.kind == "rows":
+            if not r.value:
+                problems.append(f"{r.name} is empty")
+            elif was and r.value < was * (1 - MAX_ROW_DROP):
+                problems.append(f"{r.name} dropped from {was:,} to {r.value:,}")
+        elif r.status == "fail":
+            problems.append(f"{r.name}: {quality.describe(r)}")
+        elif r.kind == "not_null" and was is not None and r.value > was:
+            problems.append(f"{r.name} grew from {was:,} to {r.value:,}")
+    return problems
+
+
+def _checkpoint(db: Path, rollback_journal: bool = False) -> None:
+    """Fold the WAL into the main file (and optionally leave WAL mode altogether)."""
+    con = sqlite3.connect(db, timeout=30)
+    try:
+        (busy, _, _), = con.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        if busy:
+            raise RuntimeError(f"could not checkpoint {db}: readers are holding the WAL")
+        if rollback_journal:
+            con.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        con.close()
+
+
+def _swap_in(new: Path, live: Path, keep_as: Path) -> None:
+    """Atomically replace `live` with `new`, keeping the replaced file as `keep_as`."""
+    if live.exists():
+        # The live file must not leave committed pages behind in its -wal, or the
+        # kept generation would be incomplete and the new file could pick them up.
+        _checkpoint(live)
+        keep_as.unlink(missing_ok=True)
+        try:
+            os.link(live, keep_as)
+        except OSError:
+            shutil.copy2(live, keep_as)
+    os.replace(new, live)
+
+
+def publish(shadow: Path, live: Path) -> None:
+    """Swap the checked shadow in as the live warehouse; the old one becomes .prev."""
+    # Published as a single file: no -wal of its own to go missing in the rename
+    _checkpoint(shadow, rollback_journal=True)
+    for side in (Path(f"{shadow}-wal"), Path(f"{shadow}-shm")):
+        side.unlink(missing_ok=True)
+    _swap_in(shadow, live, prev_path(live))
+
+
+def rollback(live: Path) -> None:
+    """Swap the previous generation back in; the current one becomes the new .prev."""
+    prev = prev_path(live)
+    if not prev.exists():
+        raise FileNotFoundError(f"No previous generation at {prev}")
+    staged = live.with_name(f"{live.stem}.rollback{live.suffix}")
+    _remove(staged)
+    os.replace(prev, staged)
+    _swap_in(staged, live, prev)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Check the warehouse or roll back to the previous generation.")
+    g = ap.add_mutually_exclusive_group(required=True)
+    g.add_argument("--check", action="store_true", help="run the publish checks against the live file")
+    g.add_argument("--rollback", action="store_true", help="swap the previous generation back in")
+    args = ap.parse_args()
+
+    live = db_path()
+    if args.rollback:
+        rollback(live)
+        print(f"[ok] rolled back {live} (the replaced generation is now {prev_path(live)})")
+        return
+    if not live.exists():
+        raise FileNotFoundError(f"Missing warehouse DB: {live}")
+    problems = check(live)
+    for p in problems:
+        print(f"[fail] {p}")
+    if problems:
+        raise SystemExit(1)
+    print(f"[ok] {live} passed all checks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+-- Precomputed rollups of reviews over pub_year x genre x label x best_new_music.
+-- Filled by scripts/review_cube.py; query them through review_cube.query().
+
+---------------------------------------------------------------------------
+-- One row per review with its review-level measures
+---------------------------------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS cube_review (
+  reviewid        INTEGER PRIMARY KEY,
+  pub_year        INTEGER,
+  best_new_music  INTEGER,
+  score           REAL,
+  mapped          INTEGER NOT NULL,   -- 1 if any artist of the review maps to Spotify
+  streams         REAL                -- total streams of the review's mapped Spotify artists
+);
+
+---------------------------------------------------------------------------
+-- Every grouping set of the four dimensions (16 of them), one table
+---------------------------------------------------------------------------
+
+-- dims_mask says which dimensions a row is grouped by (1 pub_year, 2 genre,
+-- 4 label, 8 best_new_music); the others are NULL. Within a grouping set a
+-- NULL dimension means the review has no value for it (e.g. no genre).
+CREATE TABLE IF NOT EXISTS cube_review_rollup (
+  dims_mask            INTEGER NOT NULL,
+  pub_year             INTEGER,
+  genre                TEXT,
+  label                TEXT,
+  best_new_music       INTEGER,
+  review_count         INTEGER NOT NULL,
+  scored_count         INTEGER NOT NULL,   -- reviews with a score
+  score_sum            REAL,
+  mapped_review_count  INTEGER NOT NULL,
+  streams_sum          REAL,               -- per-review artist streams, summed over reviews
+  artist_count         INTEGER NOT NULL,   -- distinct artists (not additive across rows)
+  mapped_artist_count  INTEGER NOT NULL    -- distinct artists mapped to Spotify (idem)
+);
+
+CREATE INDEX IF NOT EXISTS ix_cube_review_rollup
+  ON cube_review_rollup(dims_mask, pub_year, genre, label, best_new_music);
+
+CREATE INDEX IF NOT EXISTS ix_genres_reviewid ON pitchfork_genres(reviewid);
+CREATE INDEX IF NOT EXISTS ix_labels_reviewid ON pitchfork_labels(reviewid);
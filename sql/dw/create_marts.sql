@@ -0,0 +1,95 @@
+-- Materialized marts backing the critics-vs-streams views.
+-- Same columns as vw_artist_summary, vw_artist_streams and vw_artist_critics_vs_streams,
+-- keyed by spotify_artist_key (dim_spotify_artist). Filled and refreshed by scripts/refresh_marts.py.
+
+---------------------------------------------------------------------------
+-- Mart tables, one row per Spotify artist
+---------------------------------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS mart_artist_summary (
+  artist              TEXT NOT NULL UNIQUE,
+  review_count        INTEGER NOT NULL,
+  avg_score           REAL,
+  min_score           REAL,
+  max_score           REAL,
+  first_review_year   INTEGER,
+  last_review_year    INTEGER,
+  spotify_artist_key  INTEGER PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS mart_artist_streams (
+  artist                  TEXT NOT NULL UNIQUE,
+  track_count             INTEGER NOT NULL,
+  total_streams           REAL,
+  avg_streams_per_track   REAL,
+  total_yt_views          REAL,
+  avg_yt_views_per_track  REAL,
+  total_yt_likes          REAL,
+  total_yt_comments       REAL,
+  avg_danceability        REAL,
+  avg_energy              REAL,
+  avg_valence             REAL,
+  spotify_artist_key      INTEGER PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS mart_artist_critics_vs_streams (
+  artist                  TEXT NOT NULL UNIQUE,
+  review_count            INTEGER NOT NULL,
+  avg_score               REAL,
+  min_score               REAL,
+  max_score               REAL,
+  first_review_year       INTEGER,
+  last_review_year        INTEGER,
+  track_count             INTEGER,
+  total_streams           REAL,
+  avg_streams_per_track   REAL,
+  total_yt_views          REAL,
+  avg_yt_views_per_track  REAL,
+  total_yt_likes          REAL,
+  total_yt_comments       REAL,
+  avg_danceability        REAL,
+  avg_energy              REAL,
+  avg_valence             REAL,
+  spotify_artist_key      INTEGER PRIMARY KEY
+);
+
+-- Case-insensitive name lookups (query_service.py `artist`: WHERE artist = ? COLLATE NOCASE)
+CREATE INDEX IF NOT EXISTS ix_mart_cvs_artist_nocase
+  ON mart_artist_critics_vs_streams(artist COLLATE NOCASE);
+
+---------------------------------------------------------------------------
+-- Change capture and refresh bookkeeping
+---------------------------------------------------------------------------
+
+-- Keys touched by in-place writes to the base tables (filled by triggers)
+CREATE TABLE IF NOT EXISTS mart_changes (
+  seq   INTEGER PRIMARY KEY AUTOINCREMENT,   -- never reused, so seq is a monotonic watermark
+  src   TEXT NOT NULL,      -- 'artist_key' | 'reviewid' | 'spotify_artist_key'
+  key   INTEGER
+);
+
+-- dim_artist is rebuilt wholesale, so its mapping changes are found by diffing this snapshot
+CREATE TABLE IF NOT EXISTS mart_dim_artist_snapshot (
+  artist_key          INTEGER NOT NULL,
+  spotify_artist_key  INTEGER
+);
+
+-- One row per refresh; the latest row is the current watermark
+CREATE TABLE IF NOT EXISTS mart_refresh_log (
+  refresh_id      INTEGER PRIMARY KEY,
+  refreshed_at    TEXT NOT NULL,
+  mode            TEXT NOT NULL,      -- 'full' | 'incremental'
+  change_seq      INTEGER NOT NULL,   -- last mart_changes.seq folded in
+  artists_touched INTEGER NOT NULL,
+  seconds         REAL NOT NULL
+);
+
+---------------------------------------------------------------------------
+-- Lookup indexes on the base tables used by incremental refreshes
+---------------------------------------------------------------------------
+
+-- fact_review_artist is keyed (reviewid, artist_key), fact_artist_streams by spotify_artist_key,
+-- and load_dim_artist.py indexes fact_review_artist(artist_key) and dim_artist(spotify_artist_key);
+-- these are no-ops when those already exist.
+CREATE INDEX IF NOT EXISTS ix_fact_review_artist_key ON fact_review_artist(artist_key, reviewid);
+CREATE INDEX IF NOT EXISTS ix_dim_artist_spotify_key ON dim_artist(spotify_artist_key);
@@ -1,5 +1,7 @@
 -- Analysis views for Pitchfork reviews, artist mapping and streaming data.
 -- These views sit on top of the core tables and are safe to run repeatedly.
+-- They join on the integer keys of the star schema built by load_dim_artist.py
+-- (fact_review_artist, fact_artist_streams, dim_artist, dim_spotify_artist).
 
 ---------------------------------------------------------------------------
 -- Review to artist view, including mapping metadata
@@ -14,14 +16,15 @@ SELECT
   pr.pub_year,
   pr.pub_month,
   pr.score,
-  pra.artist        AS bridge_artist,
+  da.artist         AS bridge_artist,
   da.artist_spotify,
   da.match_type,
   da.score          AS match_conf
-FROM pitchfork_review_artists AS pra
-JOIN pitchfork_reviews AS pr USING (reviewid)
-LEFT JOIN dim_artist AS da
-  ON da.artist = pra.artist;
+FROM fact_review_artist AS fra
+JOIN pitchfork_reviews AS pr
+  ON pr.reviewid = fra.reviewid
+JOIN dim_artist AS da
+  ON da.artist_key = fra.artist_key;
 
 ---------------------------------------------------------------------------
 -- Unmatched artists, backlog for manual mapping or better matching logic
@@ -48,38 +51,40 @@ CREATE VIEW vw_artist_coverage_by_year AS
 WITH a AS (
   SELECT DISTINCT
     pr.pub_year,
-    pra.artist
-  FROM pitchfork_review_artists AS pra
-  JOIN pitchfork_reviews AS pr USING (reviewid)
+    fra.artist_key
+  FROM fact_review_artist AS fra
+  JOIN pitchfork_reviews AS pr
+    ON pr.reviewid = fra.reviewid
 ),
 m AS (
   SELECT DISTINCT
     pr.pub_year,
-    pra.artist
-  FROM pitchfork_review_artists AS pra
-  JOIN pitchfork_reviews AS pr USING (reviewid)
+    fra.artist_key
+  FROM fact_review_artist AS fra
+  JOIN pitchfork_reviews AS pr
+    ON pr.reviewid = fra.reviewid
   JOIN dim_artist AS da
-    ON da.artist = pra.artist
-  WHERE da.artist_spotify IS NOT NULL
+    ON da.artist_key = fra.artist_key
+  WHERE da.spotify_artist_key IS NOT NULL
 )
 SELECT
   a.pub_year,
-  COUNT(DISTINCT a.artist) AS artists_total,
-  COUNT(DISTINCT m.artist) AS artists_mapped,
+  COUNT(DISTINCT a.artist_key) AS artists_total,
+  COUNT(DISTINCT m.artist_key) AS artists_mapped,
   ROUND(
-    1.0 * COUNT(DISTINCT m.artist)
-      / NULLIF(COUNT(DISTINCT a.artist), 0),
+    1.0 * COUNT(DISTINCT m.artist_key)
+      / NULLIF(COUNT(DISTINCT a.artist_key), 0),
     3
   ) AS pct_mapped
 FROM a
 LEFT JOIN m
-  ON m.pub_year = a.pub_year
- AND m.artist   = a.artist
+  ON m.pub_year   = a.pub_year
+ AND m.artist_key = a.artist_key
 GROUP BY a.pub_year
 ORDER BY a.pub_year;
 
 ---------------------------------------------------------------------------
--- Artist level critic summary, keyed by Spotify artist name
+-- Artist level critic summary, one row per Spotify artist
 -- Only includes artists that have a Spotify mapping
 ---------------------------------------------------------------------------
 
@@ -87,38 +92,46 @@ DROP VIEW IF EXISTS vw_artist_summary;
 
 CREATE VIEW vw_artist_summary AS
 SELECT
-  artist_spotify                AS artist,
-  COUNT(DISTINCT reviewid)      AS review_count,
-  AVG(score)                    AS avg_score,
-  MIN(score)                    AS min_score,
-  MAX(score)                    AS max_score,
-  MIN(pub_year)                 AS first_review_year,
-  MAX(pub_year)                 AS last_review_year
-FROM vw_review_with_artist
-WHERE artist_spotify IS NOT NULL
-GROUP BY artist_spotify;
+  dsa.artist                    AS artist,
+  COUNT(DISTINCT pr.reviewid)   AS review_count,
+  AVG(pr.score)                 AS avg_score,
+  MIN(pr.score)                 AS min_score,
+  MAX(pr.score)                 AS max_score,
+  MIN(pr.pub_year)              AS first_review_year,
+  MAX(pr.pub_year)              AS last_review_year,
+  dsa.spotify_artist_key
+FROM fact_review_artist AS fra
+JOIN dim_artist AS da
+  ON da.artist_key = fra.artist_key
+JOIN dim_spotify_artist AS dsa
+  ON dsa.spotify_artist_key = da.spotify_artist_key
+JOIN pitchfork_reviews AS pr
+  ON pr.reviewid = fra.reviewid
+GROUP BY dsa.spotify_artist_key;
 
 ---------------------------------------------------------------------------
--- Artist level streaming summary from spotify_youtube_clean
+-- Artist level streaming summary, from the per-artist rollup of the tracks
 ---------------------------------------------------------------------------
 
 DROP VIEW IF EXISTS vw_artist_streams;
 
 CREATE VIEW vw_artist_streams AS
 SELECT
-  artist,
-  COUNT(*)              AS track_count,
-  SUM(streams)          AS total_streams,
-  AVG(streams)          AS avg_streams_per_track,
-  SUM(yt_views)         AS total_yt_views,
-  AVG(yt_views)         AS avg_yt_views_per_track,
-  SUM(yt_likes)         AS total_yt_likes,
-  SUM(yt_comments)      AS total_yt_comments,
-  AVG(danceability)     AS avg_danceability,
-  AVG(energy)           AS avg_energy,
-  AVG(valence)          AS avg_valence
-FROM spotify_youtube_clean
-GROUP BY artist;
+  dsa.artist,
+  fas.track_count,
+  fas.total_streams,
+  fas.avg_streams_per_track,
+  fas.total_yt_views,
+  fas.avg_yt_views_per_track,
+  fas.total_yt_likes,
+  fas.total_yt_comments,
+  fas.avg_danceability,
+  fas.avg_energy,
+  fas.avg_valence,
+  fas.spotify_artist_key
+FROM fact_artist_streams AS fas
+JOIN dim_spotify_artist AS dsa
+  ON dsa.spotify_artist_key = fas.spotify_artist_key;
 
 ---------------------------------------------------------------------------
 -- Critics vs streams mart, one row per Spotify artist
@@ -148,4 +161,4 @@ SELECT
   s.avg_valence
 FROM vw_artist_summary AS c
 LEFT JOIN vw_artist_streams AS s
-  ON c.artist = s.artist;
+  ON s.spotify_artist_key = c.spotify_artist_key;
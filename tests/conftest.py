@@ -0,0 +1,6 @@
+# tests/conftest.py
+"""The scripts import their siblings by name, as when run from scripts/."""
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
@@ -0,0 +1,42 @@
+# tests/test_clean_spotify_youtube.py
+import numpy as np
+import pandas as pd
+
+import clean_spotify_youtube as csy
+
+
+class _Stage:
+    def lap(self, *args, **kwargs):
+        pass
+
+
+def test_seen_rows_all_duplicate_chunk():
+    seen = csy.SeenRows()
+    fp = np.array([3, 1, 2], dtype=np.uint64)
+    assert seen.first_seen(fp).all()
+    assert not seen.first_seen(fp[[1, 1]]).any()
+    assert not seen.first_seen(np.array([], dtype=np.uint64)).any()
+    assert seen.first_seen(np.array([1, 4, 4], dtype=np.uint64)).tolist() == [False, True, False]
+    assert all(len(run) for run in seen.runs)
+    assert len(seen) == 4
+
+
+def test_streaming_matches_in_memory(tmp_path, monkeypatch):
+    src = tmp_path / "Spotify_Youtube.csv"
+    rows = [
+        ("A", "one", 0.5, 10.0), ("A", "one", 0.5, 10.0), ("A", "one", 0.5, 10.0),
+        ("B", "two", 0.1, 5.0), ("A", "one", 0.5, 10.0), ("B", "two", 0.1, 5.0),
+        ("B", "three", 0.2, None), ("A", "four", 0.9, 1.0),
+    ]
+    pd.DataFrame(rows, columns=["Artist", "Track", "Energy", "Stream"]).to_csv(src, index=False)
+    monkeypatch.setattr(csy, "SRC", src)
+    monkeypatch.setattr(csy, "OUT", tmp_path / "spotify_youtube_clean.csv")
+    monkeypatch.setenv("VINYL_INTERIM_FORMAT", "csv")
+
+    rows_in, written, rollup = csy.clean_streaming(_Stage(), chunk_rows=2)
+    _, clean, expected = csy.clean_in_memory(_Stage())
+
+    assert (rows_in, written) == (8, len(clean)) == (8, 4)
+    streamed = pd.read_csv(tmp_path / "spotify_youtube_clean.csv")
+    pd.testing.assert_frame_equal(streamed, clean.reset_index(drop=True), check_dtype=False)
+    pd.testing.assert_frame_equal(rollup, expected, check_dtype=False)
@@ -0,0 +1,49 @@
+# tests/test_make_review_artists_bridge.py
+import random
+import re
+import unicodedata
+
+import pandas as pd
+
+import make_review_artists_bridge as mrab
+
+
+def clean_token(s):
+    s = unicodedata.normalize("NFKC", (s or "")).strip()
+    return re.sub(r"\s+", " ", s)
+
+
+def split_artists(s):
+    """The per-row splitter split_credits replaced."""
+    s = clean_token(s)
+    if not s:
+        return []
+    parts = [clean_token(p) for p in mrab.SEP_RE.split(s) if p]
+    return [p for p in parts if len(p) > 2 or p.casefold() in mrab.VALID_SHORT]
+
+
+def per_row(credits):
+    pairs = mrab.split_credits(pd.Series(credits, dtype="string"))
+    got = [[] for _ in credits]
+    for row, artist in zip(pairs["row"], pairs["artist"]):
+        got[row].append(artist)
+    return got
+
+
+def test_part_order_kept_when_some_credits_are_dropped():
+    assert per_row(["", "Delta", "X & Alpha & Delta", ""]) == [[], ["Delta"], ["X", "Alpha", "Delta"], []]
+
+
+def test_matches_per_row_split():
+    words = ["Alpha", "Delta", "X", "u2", "s", "Islands", "Hands", "Band", "Ｆｕｌｌ", " ", ""]
+    seps = [", ", " & ", "/", " + ", " and ", " feat. ", " featuring ", " with ", " ", "  "]
+    rng = random.Random(0)
+    for _ in range(500):
+        credits = []
+        for _ in range(rng.randint(1, 6)):
+            if rng.random() < 0.2:           # credits with no artist leave gaps in the codes
+                credits.append(rng.choice([None, ""]))
+                continue
+            n = rng.randint(1, 4)
+            credits.append("".join(rng.choice(words) + (rng.choice(seps) if i < n - 1 else "") for i in range(n)))
+        assert per_row(credits) == [split_artists(c) for c in credits], credits
@@ -0,0 +1,15 @@
+# tests/test_match_artists_offline.py
+import match_artists_offline as mao
+import match_cache
+
+
+def test_cached_delta_agrees_with_full_pass(tmp_path, monkeypatch):
+    open_cache = match_cache.open_cache
+    monkeypatch.setattr(match_cache, "open_cache", lambda: open_cache(tmp_path / "match_cache.sqlite"))
+    keys = ["alpha beta gamma"]
+    mao.fuzzy_matches(keys, ["alpha beta gamma delta", "zzz"])
+    # the added candidate ties the cached pick and is listed first
+    cands = ["alpha beta gamma epsilon", "alpha beta gamma delta", "zzz"]
+    cached = mao.fuzzy_matches(keys, cands)
+    assert cached == mao.fuzzy_matches(keys, cands, use_cache=False)
+    assert cached["alpha beta gamma"] == ("alpha beta gamma epsilon", 0.75)